@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AdminviewConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'adminView'
+
+    def ready(self):
+        from .stats import conectar_senales
+        conectar_senales()
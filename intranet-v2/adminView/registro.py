@@ -0,0 +1,465 @@
+import calendar
+import csv
+import io
+import re
+import unicodedata
+from datetime import date, datetime
+
+from django.db import transaction
+from openpyxl import load_workbook
+
+from core.models import (
+    Class,
+    Comuna,
+    Enrollment,
+    GuardianProfile,
+    GuardianRelation,
+    OutboundEmail,
+    Payment,
+    User,
+)
+from core.outbox import preparar_correo
+from core.passwords import hashear_passwords
+
+from .stats import invalidar_dashboard_stats
+
+
+# =====================================================
+#  CONTRASEÑA INICIAL DEL ALUMNO
+# =====================================================
+
+def strip_accents(s: str) -> str:
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+
+def first_letters(name: str, n: int, upper=False, lower=False) -> str:
+    base = strip_accents((name or "").strip())
+    base = re.sub(r"[^A-Za-z]", "", base)  # solo letras
+    out = base[:n]
+    if upper:
+        out = out.upper()
+    if lower:
+        out = out.lower()
+    return out
+
+
+def first_two_digits_of_rut(rut: str) -> str:
+    digits = re.sub(r"[^0-9]", "", rut or "")
+    return digits[:2] or "00"
+
+
+def build_password_inline(first_name: str, last_name: str, rut: str) -> str:
+    aa = first_letters(first_name, 2, upper=True)       # 2 letras nombre (mayus)
+    bbbbb = first_letters(last_name, 5, lower=True)     # 5 letras apellido (minus)
+    dd = first_two_digits_of_rut(rut)                   # 2 dígitos del RUT
+
+    if len(aa) < 2:
+        aa = (aa + "XX")[:2]
+    if len(bbbbb) < 5:
+        bbbbb = (bbbbb + "xxxxx")[:5]
+    if len(dd) < 2:
+        dd = (dd + "0")[:2]
+
+    return f"{aa}{bbbbb}{dd}"
+
+
+# =====================================================
+#  PLAN DE PAGOS (matrícula + mensualidades)
+# =====================================================
+
+MONTO_MATRICULA = 230000
+MONTO_MENSUALIDAD = 180000
+
+
+def cuotas_del_plan(hoy):
+    """[(concepto, monto, vencimiento)]: matrícula y mensualidades desde el mes actual."""
+    year, mes_inicio = hoy.year, hoy.month
+    cuotas = [(f"Matrícula {year}", MONTO_MATRICULA, date(year, mes_inicio, 5))]
+    cuotas += [
+        (f"Mensualidad {calendar.month_name[month]} {year}", MONTO_MENSUALIDAD, date(year, month, 5))
+        for month in range(mes_inicio, 13)
+    ]
+    return cuotas
+
+
+def crear_plan_de_pagos(student_ids, hoy=None):
+    """
+    Crea las cuotas que falten a cada alumno: una query para ver cuáles
+    existen y un solo bulk_create. Retorna cuántos pagos se crearon.
+    """
+    hoy = hoy or date.today()
+    cuotas = cuotas_del_plan(hoy)
+
+    existentes = set(
+        Payment.objects
+        .filter(student_id__in=student_ids, concept__in=[c for c, _, _ in cuotas])
+        .values_list("student_id", "concept")
+    )
+    nuevos = [
+        Payment(
+            student_id=student_id,
+            concept=concepto,
+            amount=monto,
+            status="pending",
+            issue_date=hoy,
+            due_date=vencimiento,
+        )
+        for student_id in student_ids
+        for concepto, monto, vencimiento in cuotas
+        if (student_id, concepto) not in existentes
+    ]
+    Payment.objects.bulk_create(nuevos, batch_size=1000)
+    return len(nuevos)
+
+
+# =====================================================
+#  CORREO AL APODERADO
+# =====================================================
+
+def correo_registro(alumno, apoderado, pwd_inicial, pin):
+    """OutboundEmail (sin guardar) con las credenciales del alumno."""
+    year_actual = datetime.now().year
+
+    # Credenciales en HTML
+    credenciales_html = f"""
+    <div style="border: 2px solid #123159; padding: 20px; margin: 20px 0; background-color: #e6f0ff; border-radius: 4px;">
+        <p style="font-size: 17px; margin:0 0 15px 0; color:#123159; font-weight:bold; text-align:center;">
+            🔑 Credenciales del Alumno y Apoderado
+        </p>
+        <ul style="list-style:none; padding-left:0; font-size:16px; color:#333;">
+            <li><strong style="color:#123159;">Alumno:</strong> {alumno.first_name} {alumno.last_name}</li>
+            <li><strong style="color:#123159;">RUT:</strong> {alumno.rut}</li>
+            <li><strong style="color:#123159;">Contraseña inicial:</strong> {pwd_inicial}</li>
+            <li><strong style="color:#123159;">PIN apoderado:</strong> {pin}</li>
+        </ul>
+    </div>
+    """
+
+    recordatorio_html = f"""
+    <p style="font-size:14px; color:#a00000; font-style: italic;">
+        ⚠️ Por seguridad, le recomendamos cambiar la contraseña y el PIN iniciales en la sección "Recupera tu contraseña".
+    </p>
+    """
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html lang="es">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Registro de Alumno</title>
+    </head>
+    <body style="margin:0; padding:0; font-family: Arial, sans-serif; background-color:#f4f4f4;">
+        <table width="100%" cellpadding="0" cellspacing="0" style="table-layout:fixed;">
+            <tr>
+                <td align="center" style="padding: 30px 0;">
+                    <table width="600" style="max-width:600px; background-color:#fff; border-radius:6px; border:1px solid #e0e0e0;">
+                        <tr>
+                            <td align="center" style="background-color:#D9A84E; padding:15px 40px; border-radius:6px 6px 0 0;">
+                                <h1 style="color:#123159; margin:0; font-size:20px; font-weight:bold;">¡Bienvenido al Colegio!</h1>
+                            </td>
+                        </tr>
+                        <tr>
+                            <td style="padding:30px 40px; color:#333; line-height:1.6;">
+                                <p style="margin:0 0 15px 0;">
+                                    Estimado/a <strong>{apoderado.first_name} {apoderado.last_name}</strong>:
+                                </p>
+                                <p style="margin:0 0 15px 0;">
+                                    Se ha registrado un nuevo alumno en el sistema y se han generado sus credenciales:
+                                </p>
+
+                                {credenciales_html}
+
+                                {recordatorio_html}
+
+                                <p style="font-size:16px; color:#123159; font-weight:bold;">Atentamente,</p>
+                                <p style="font-size:16px; color:#123159; font-weight:bold;">Equipo de Soporte - Colegio San Agustín de Hipona</p>
+                            </td>
+                        </tr>
+                        <tr>
+                            <td align="center" style="padding:20px 40px; border-top:1px solid #e0e0e0; color:#999; font-size:12px; border-radius:0 0 6px 6px;">
+                                &copy; {year_actual}. Colegio San Agustín de Hipona — Todos los derechos reservados.
+                            </td>
+                        </tr>
+                    </table>
+                </td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    """
+
+    return preparar_correo(
+        subject=f"Registro de alumno {alumno.first_name} {alumno.last_name}",
+        body=(
+            f"Estimado/a {apoderado.first_name} {apoderado.last_name}, "
+            f"se ha registrado un nuevo alumno. "
+            f"Contraseña: {pwd_inicial}, PIN: {pin}"
+        ),
+        to=[apoderado.email],
+        html_body=html_content,
+    )
+
+
+# =====================================================
+#  REGISTRO (uno o muchos alumnos)
+# =====================================================
+
+CAMPOS_REGISTRO = [
+    "rut", "nombres", "apellidos", "fecha_nacimiento", "comuna", "curso", "estado_alumno",
+    "rut_apoderado", "nombre_apoderado", "apellidos_apoderado", "email_apoderado", "telefono_apoderado",
+]
+CAMPOS_OBLIGATORIOS = [
+    "rut", "nombres", "apellidos", "rut_apoderado", "nombre_apoderado", "apellidos_apoderado",
+]
+PIN_INICIAL = "12345"
+REGISTRO_CHUNK_SIZE = 100
+
+
+def limpiar_fila(data):
+    """Normaliza una fila del formulario o de la planilla (strings sin espacios, vacíos -> None)."""
+    fila = {}
+    for campo in CAMPOS_REGISTRO:
+        valor = data.get(campo)
+        if isinstance(valor, datetime):
+            valor = valor.date()
+        elif isinstance(valor, float) and valor.is_integer():
+            valor = str(int(valor))
+        elif valor is not None and not isinstance(valor, date):
+            valor = str(valor).strip()
+        fila[campo] = valor or None
+    fila["estado_alumno"] = fila["estado_alumno"] or "active"
+    return fila
+
+
+def validar_fila(fila):
+    faltan = [c for c in CAMPOS_OBLIGATORIOS if not fila[c]]
+    if faltan:
+        return f"Faltan campos obligatorios: {', '.join(faltan)}."
+    return None
+
+
+def registrar_lote(filas, hoy, hashes=None):
+    """
+    Registra un lote de filas ya validadas con un número fijo de queries:
+    alumnos, apoderados, perfiles, relaciones, matrículas, pagos y correos
+    se resuelven con una carga previa y bulk_create/bulk_update.
+    Debe llamarse dentro de transaction.atomic.
+
+    `hashes` ({rut: hash}) guarda las contraseñas ya hasheadas; se completa
+    aquí con las que falten, así un reintento no vuelve a pagar el PBKDF2.
+    """
+    hashes = {} if hashes is None else hashes
+    ruts = {f["rut"] for f in filas} | {f["rut_apoderado"] for f in filas}
+    usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+
+    # Contraseñas iniciales: alumnos (todos) y apoderados nuevos. Se hashean
+    # juntas, en paralelo y antes de cualquier escritura del lote.
+    passwords = {}
+    for f in filas:
+        passwords.setdefault(f["rut"], build_password_inline(f["nombres"], f["apellidos"], f["rut"]))
+    pendientes = {rut: pwd for rut, pwd in passwords.items() if rut not in hashes}
+    for f in filas:
+        rut = f["rut_apoderado"]
+        if rut not in usuarios and rut not in hashes:
+            pendientes[rut] = rut
+    hashes.update(zip(pendientes, hashear_passwords(pendientes.values(), hilos=True)))
+
+    # Comunas (se crean las que falten)
+    nombres_comuna = {f["comuna"].upper() for f in filas if f["comuna"]}
+    comunas = dict(Comuna.objects.filter(nombre__in=nombres_comuna).values_list("nombre", "id"))
+    if nombres_comuna - comunas.keys():
+        Comuna.objects.bulk_create(
+            [Comuna(nombre=n) for n in nombres_comuna - comunas.keys()],
+            ignore_conflicts=True,
+        )
+        comunas = dict(Comuna.objects.filter(nombre__in=nombres_comuna).values_list("nombre", "id"))
+
+    # Clase más reciente de cada curso
+    clases = {}
+    for clase_id, curso_id in (
+        Class.objects
+        .filter(grade__curso_id__in={f["curso"] for f in filas if f["curso"]})
+        .order_by("grade_id", "-year")
+        .values_list("id", "grade_id")
+    ):
+        clases.setdefault(curso_id, clase_id)
+
+    # Alumnos: se crean los nuevos; a los existentes se les reinicia la contraseña
+    alumnos_nuevos, alumnos_existentes = [], []
+    vistos = set()
+    for f in filas:
+        rut = f["rut"]
+        if rut in vistos:
+            continue
+        vistos.add(rut)
+        alumno = usuarios.get(rut)
+        if alumno:
+            alumno.password = hashes[rut]
+            alumnos_existentes.append(alumno)
+        else:
+            alumno = User(
+                rut=rut,
+                first_name=f["nombres"],
+                last_name=f["apellidos"],
+                role=User.STUDENT,
+                birth_date=f["fecha_nacimiento"],
+                comuna_id=comunas.get((f["comuna"] or "").upper()),
+                active_status=f["estado_alumno"],
+                password=hashes[rut],
+            )
+            usuarios[rut] = alumno
+            alumnos_nuevos.append(alumno)
+
+    # Apoderados nuevos (los existentes no se modifican)
+    apoderados_nuevos = []
+    for f in filas:
+        rut = f["rut_apoderado"]
+        if rut not in usuarios:
+            usuarios[rut] = User(
+                rut=rut,
+                first_name=f["nombre_apoderado"],
+                last_name=f["apellidos_apoderado"],
+                email=f["email_apoderado"],
+                phone=f["telefono_apoderado"],
+                role=User.GUARDIAN,
+                password=hashes[rut],
+            )
+            apoderados_nuevos.append(usuarios[rut])
+
+    User.objects.bulk_create(alumnos_nuevos + apoderados_nuevos)
+    User.objects.bulk_update(alumnos_existentes, ["password"])
+
+    # Perfil de apoderado + PIN
+    guardian_ids = {usuarios[f["rut_apoderado"]].id for f in filas}
+    pins = dict(GuardianProfile.objects.filter(user_id__in=guardian_ids).values_list("user_id", "payment_pin"))
+    GuardianProfile.objects.bulk_create([
+        GuardianProfile(user_id=gid, payment_pin=PIN_INICIAL) for gid in guardian_ids - pins.keys()
+    ])
+    sin_pin = [gid for gid, pin in pins.items() if not pin]
+    if sin_pin:
+        GuardianProfile.objects.filter(user_id__in=sin_pin).update(payment_pin=PIN_INICIAL)
+    pins = {gid: pins.get(gid) or PIN_INICIAL for gid in guardian_ids}
+
+    # Relaciones y matrículas (ignora las que ya existen)
+    GuardianRelation.objects.bulk_create(
+        [GuardianRelation(guardian=usuarios[f["rut_apoderado"]], student=usuarios[f["rut"]]) for f in filas],
+        ignore_conflicts=True,
+    )
+    Enrollment.objects.bulk_create(
+        [
+            Enrollment(student=usuarios[f["rut"]], class_group_id=clases[f["curso"]])
+            for f in filas if f["curso"] in clases
+        ],
+        ignore_conflicts=True,
+    )
+
+    crear_plan_de_pagos([usuarios[rut].id for rut in passwords], hoy)
+
+    # Correos a los apoderados (quedan en la bandeja de salida)
+    correos = []
+    registrados = []
+    for f in filas:
+        alumno, apoderado = usuarios[f["rut"]], usuarios[f["rut_apoderado"]]
+        if apoderado.email:
+            correos.append(correo_registro(alumno, apoderado, passwords[alumno.rut], pins[apoderado.id]))
+        registrados.append({
+            "nombre": f"{alumno.first_name} {alumno.last_name}",
+            "rut": alumno.rut,
+            "password_inicial": passwords[alumno.rut],
+            "apoderado": f"{apoderado.first_name} {apoderado.last_name}",
+        })
+    OutboundEmail.objects.bulk_create(correos)
+
+    return registrados
+
+
+def registrar_alumnos(filas, hoy=None, chunk_size=REGISTRO_CHUNK_SIZE, primera_fila=1):
+    """
+    Registra muchas filas en transacciones por bloque. Si un bloque falla se
+    revierte y se reintenta fila a fila, así solo las filas malas quedan
+    como error (con su propio mensaje).
+    Retorna {"registrados": [...], "errores": [{"fila", "rut", "error"}]}.
+    """
+    hoy = hoy or date.today()
+    resultado = {"registrados": [], "errores": []}
+
+    for inicio in range(0, len(filas), chunk_size):
+        validas = []
+        for n, data in enumerate(filas[inicio:inicio + chunk_size], start=primera_fila + inicio):
+            fila = limpiar_fila(data)
+            error = validar_fila(fila)
+            if error:
+                resultado["errores"].append({"fila": n, "rut": fila["rut"], "error": error})
+            else:
+                validas.append((n, fila))
+
+        if not validas:
+            continue
+
+        hashes = {}
+        try:
+            with transaction.atomic():
+                registrados = registrar_lote([f for _, f in validas], hoy, hashes)
+        except Exception as e:
+            print(f"❌ Error registrando filas {validas[0][0]}-{validas[-1][0]}:", e)
+            # Fila a fila, cada una en su transacción, para reportar el error
+            # real de la que falla (las contraseñas ya quedaron hasheadas)
+            for n, f in validas:
+                try:
+                    with transaction.atomic():
+                        registrado = registrar_lote([f], hoy, hashes)[0]
+                except Exception as e:
+                    resultado["errores"].append({"fila": n, "rut": f["rut"], "error": str(e)})
+                else:
+                    resultado["registrados"].append({"fila": n, **registrado})
+            continue
+
+        for (n, _), r in zip(validas, registrados):
+            resultado["registrados"].append({"fila": n, **r})
+
+    # bulk_create no dispara señales
+    invalidar_dashboard_stats()
+    return resultado
+
+
+# =====================================================
+#  LECTURA DE PLANILLAS (CSV / XLSX)
+# =====================================================
+
+def normalizar_columna(nombre):
+    return strip_accents(str(nombre or "")).strip().lower().replace(" ", "_")
+
+
+def leer_planilla(archivo):
+    """Lee un CSV o XLSX subido y retorna una lista de dicts por fila."""
+    nombre = (archivo.name or "").lower()
+
+    if nombre.endswith(".xlsx"):
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            encabezado = [normalizar_columna(c) for c in next(filas, [])]
+            datos = [
+                dict(zip(encabezado, fila))
+                for fila in filas
+                if any(v not in (None, "") for v in fila)
+            ]
+        finally:
+            wb.close()
+        return datos
+
+    if nombre.endswith(".csv"):
+        texto = archivo.read().decode("utf-8-sig")
+        try:
+            dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;")
+        except csv.Error:
+            dialecto = csv.excel
+        reader = csv.reader(io.StringIO(texto), dialecto)
+        encabezado = [normalizar_columna(c) for c in next(reader, [])]
+        return [dict(zip(encabezado, fila)) for fila in reader if any(v.strip() for v in fila)]
+
+    raise ValueError("Formato no soportado: sube un archivo .csv o .xlsx.")
@@ -952,11 +952,38 @@ function aplicarFormatoRutInput(inputElement) {
   /// ======================================================
   // 🔹 Ver Pagos (Lógica Original - Diseño Lista Moderna)
   // ======================================================
-async function cargarVerPagos() {
+// Pagos ya cargados (se van acumulando con "Cargar más")
+let pagosAcumulados = {};
+
+function mezclarPagos(destino, nuevos) {
+  Object.entries(nuevos).forEach(([estado, cursos]) => {
+    if (!Array.isArray(cursos)) return;  // ej: next_cursor
+    const lista = destino[estado] || (destino[estado] = []);
+    cursos.forEach(entry => {
+      const existente = lista.find(c => c.curso === entry.curso);
+      if (existente) {
+        existente.pagos = existente.pagos.concat(entry.pagos || []);
+        existente.pagos.sort((a, b) => a.alumno.localeCompare(b.alumno));
+      } else {
+        lista.push({ curso: entry.curso, pagos: entry.pagos || [] });
+      }
+    });
+    lista.sort((a, b) => a.curso.localeCompare(b.curso));
+  });
+}
+
+async function cargarVerPagos(cursor = null) {
   try {
-    const response = await fetch("/adminview/api/pagos/");
+    const url = cursor
+      ? `/adminview/api/pagos/?cursor=${encodeURIComponent(cursor)}`
+      : "/adminview/api/pagos/";
+    const response = await fetch(url);
     if (!response.ok) throw new Error("Error al obtener los pagos");
-    const data = await response.json();
+    const pagina = await response.json();
+
+    if (!cursor) pagosAcumulados = {};
+    mezclarPagos(pagosAcumulados, pagina);
+    const data = pagosAcumulados;
 
     let html = `<div class="finance-dashboard">`;
     
@@ -1020,10 +1047,22 @@ async function cargarVerPagos() {
       html += `</div>`;
     });
 
+    if (pagina.next_cursor) {
+      html += `
+        <div class="form-actions">
+          <button type="button" id="btn-mas-pagos" class="btn-guardar">Cargar más pagos</button>
+        </div>
+      `;
+    }
+
     html += `</div>`;
     mainContent.innerHTML = html;
     title.textContent = "Historial de Pagos";
 
+    document.getElementById("btn-mas-pagos")?.addEventListener("click", () => {
+      cargarVerPagos(pagina.next_cursor);
+    });
+
   } catch (error) {
     console.error("Error al cargar pagos", error);
     mainContent.innerHTML = `<div class="error-msg">Error cargando datos.</div>`;
@@ -1179,6 +1218,10 @@ async function cargarVerPagos() {
       });
 
       const result = await response.json();
+      if (!response.ok) {
+        alert("⚠️ " + (result.error || "No se pudo enviar el comunicado."));
+        return;
+      }
       alert("✅ " + result.message);
       form.reset();
     }
@@ -0,0 +1,121 @@
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save
+
+from core.models import Enrollment, Payment, User
+
+
+# =====================================================
+#  SNAPSHOT DE ESTADÍSTICAS DEL DASHBOARD
+# =====================================================
+
+DASHBOARD_STATS_CACHE_KEY = "adminview_dashboard_stats"
+DASHBOARD_STATS_TIMEOUT = 60 * 10  # respaldo por si alguna escritura no dispara señales
+
+# Nombres de mes fijos: no dependemos de locale.setlocale (global al proceso)
+MESES = {
+    1: "Enero",
+    2: "Febrero",
+    3: "Marzo",
+    4: "Abril",
+    5: "Mayo",
+    6: "Junio",
+    7: "Julio",
+    8: "Agosto",
+    9: "Septiembre",
+    10: "Octubre",
+    11: "Noviembre",
+    12: "Diciembre",
+}
+
+
+def calcular_dashboard_stats():
+    """Calcula todos los contadores y series del dashboard (4 queries en total)."""
+    stats = User.objects.aggregate(
+        total_students=Count("id", filter=Q(role=User.STUDENT)),
+        total_teachers=Count("id", filter=Q(role=User.TEACHER)),
+        total_guardians=Count("id", filter=Q(role=User.GUARDIAN)),
+        total_admins=Count("id", filter=Q(role__in=[User.ADMIN, User.FINANCE_ADMIN])),
+    )
+    stats.update(Payment.objects.aggregate(
+        total_payments=Count("id"),
+        pagos_pendientes=Count("id", filter=Q(status="pending")),
+        pagos_pagados=Count("id", filter=Q(status="paid")),
+        pagos_fallidos=Count("id", filter=Q(status="failed")),
+        pagos_reembolsados=Count("id", filter=Q(status="refunded")),
+    ))
+
+    # Flujo de ingresos por mes
+    ingresos_query = (
+        Payment.objects.filter(status="paid")
+        .annotate(month=TruncMonth("issue_date"))
+        .values("month")
+        .annotate(total=Sum("amount"))
+        .order_by("month")
+    )
+
+    ingresos_labels = []
+    ingresos_data = []
+
+    for entry in ingresos_query:
+        if entry["month"]:
+            ingresos_labels.append(MESES[entry["month"].month])
+            ingresos_data.append(entry["total"])
+
+    # Matrícula por nivel
+    alumnos_nivel_query = (
+        Enrollment.objects.filter(active_status="active")
+        .values("class_group__grade__curso_nombre")
+        .annotate(total=Count("student"))
+        .order_by("class_group__grade__curso_id")
+    )
+
+    niveles_labels = []
+    niveles_data = []
+
+    for entry in alumnos_nivel_query:
+        nombre = entry["class_group__grade__curso_nombre"]
+        if nombre:
+            nombre_corto = nombre.replace("Básico", "Bás").replace("Medio", "Med")
+            niveles_labels.append(nombre_corto)
+            niveles_data.append(entry["total"])
+
+    stats["ingresos_labels"] = ingresos_labels
+    stats["ingresos_data"] = ingresos_data
+    stats["niveles_labels"] = niveles_labels
+    stats["niveles_data"] = niveles_data
+    return stats
+
+
+def get_dashboard_stats():
+    """Devuelve el snapshot cacheado; lo recalcula solo si fue invalidado."""
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = calcular_dashboard_stats()
+        cache.set(DASHBOARD_STATS_CACHE_KEY, stats, DASHBOARD_STATS_TIMEOUT)
+    return stats
+
+
+def invalidar_dashboard_stats(**kwargs):
+    """
+    Borra el snapshot. Se conecta a las señales de Payment, User y Enrollment;
+    los procesos que usan bulk_create/update deben llamarla a mano.
+
+    El borrado llega a todos los workers porque la caché es compartida
+    (CACHES en settings), también cuando se llama desde un comando. Con una
+    caché por proceso (LocMem) el dashboard podría quedar desfasado hasta
+    DASHBOARD_STATS_TIMEOUT (10 minutos).
+    """
+    update_fields = kwargs.get("update_fields")
+    if kwargs.get("sender") is User and update_fields and set(update_fields) <= {"last_login"}:
+        # El login actualiza last_login: no cambia ningún contador
+        return
+    cache.delete(DASHBOARD_STATS_CACHE_KEY)
+
+
+def conectar_senales():
+    for model in (Payment, User, Enrollment):
+        uid = f"dashboard_stats_{model.__name__}"
+        post_save.connect(invalidar_dashboard_stats, sender=model, dispatch_uid=f"{uid}_save")
+        post_delete.connect(invalidar_dashboard_stats, sender=model, dispatch_uid=f"{uid}_delete")
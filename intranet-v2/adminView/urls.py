@@ -18,16 +18,20 @@ urlpatterns = [
     path("api/profesores/crear/", views.api_crear_profesor, name="api_crear_profesor"),
     path("api/profesores/<int:id>/actualizar/", views.api_actualizar_profesor, name="api_actualizar_profesor"),
     path("api/profesores/<int:id>/eliminar/", views.api_eliminar_profesor, name="api_eliminar_profesor"),
+    path("api/profesores/<int:id>/horario/", views.api_horario_profesor, name="api_horario_profesor"),
+    path("api/profesores/horarios.zip", views.api_horarios_zip, name="api_horarios_zip"),
 
     # --- Cursos y alumnos ---
     path("api/cursos/", views.api_ver_cursos, name="api_ver_cursos"),
     path("api/alumnos/registrar/", views.api_registrar_alumno, name="api_registrar_alumno"),
+    path("api/alumnos/registrar-lote/", views.api_registrar_alumnos_lote, name="api_registrar_alumnos_lote"),
 
     # --- Pagos ---
     path("api/pagos/", views.api_ver_pagos, name="api_ver_pagos"),
 
     # --- Comunicados y apoderados ---
     path("api/comunicados/enviar/", views.api_enviar_comunicado, name="enviar_comunicado"),
+    path("api/comunicados/<int:id>/", views.api_estado_comunicado, name="api_estado_comunicado"),
     path("api/apoderados/", views.api_listar_apoderados, name="api_listar_apoderados"),
 
     #xd
@@ -1,22 +1,20 @@
 import json
-import locale
 import calendar
 import unicodedata
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, date, time
 
 from django.utils import timezone
 from django.utils.timezone import localtime, make_aware, now
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.hashers import make_password
-from django.core.mail import send_mail
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Sum, Count
-from django.db.models.functions import TruncMonth
+from django.db.models import Sum, Count, Q, Prefetch, OuterRef, Subquery
 from collections import defaultdict
 
 from core.models import (
@@ -32,8 +30,17 @@ from core.models import (
     Attendance,
     Comuna,
     GuardianProfile,
+    TeacherProfile,
+    Comunicado,
 )
 
+from core.comunicados import programar_comunicado, resolver_destinatarios
+from core.horarios import XLSX_MIMETYPE, horario_xlsx, zip_horarios
+from core.outbox import adjunto, encolar_correo
+
+from .registro import leer_planilla, limpiar_fila, registrar_alumnos, validar_fila
+from .stats import get_dashboard_stats
+
 # =====================================================
 #  FUNCIONES AUXILIARES
 # =====================================================
@@ -43,6 +50,83 @@ def is_admin(user):
     return user.is_authenticated and user.role in [User.ADMIN, User.FINANCE_ADMIN]
 
 
+USUARIOS_PAGE_SIZE = 50
+USUARIOS_PAGE_SIZE_MAX = 500
+
+ROLE_LABELS = dict(User.ROLE_CHOICES)
+
+
+def encode_cursor(*values):
+    """Cursor opaco para paginación keyset (JSON en base64 url-safe)."""
+    return urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def buscar_usuarios(params):
+    """
+    Listado de usuarios ordenado por (rol, nombre, id) con paginación keyset.
+
+    params (GET):
+      - rol:    uno o varios roles separados por coma (student,guardian,...)
+      - q:      texto; cada palabra debe calzar con el inicio del RUT o con
+                parte del nombre, apellido o correo
+      - cursor: valor "next_cursor" de la página anterior
+      - limit:  tamaño de página (por defecto 50)
+
+    Devuelve (filas, next_cursor). Lanza ValueError si algún parámetro es inválido.
+    """
+    qs = User.objects.all()
+
+    roles = [r.strip() for r in (params.get("rol") or "").split(",") if r.strip()]
+    if roles:
+        invalidos = [r for r in roles if r not in ROLE_LABELS]
+        if invalidos:
+            raise ValueError(f"Rol inválido: {', '.join(invalidos)}")
+        qs = qs.filter(role__in=roles)
+
+    for term in (params.get("q") or "").split():
+        qs = qs.filter(
+            Q(rut__istartswith=term)
+            | Q(first_name__icontains=term)
+            | Q(last_name__icontains=term)
+            | Q(email__icontains=term)
+        )
+
+    cursor = params.get("cursor")
+    if cursor:
+        role, first_name, last_id = decode_cursor(cursor, 3)
+        qs = qs.filter(
+            Q(role__gt=role)
+            | Q(role=role, first_name__gt=first_name)
+            | Q(role=role, first_name=first_name, id__gt=last_id)
+        )
+
+    limit = int(params.get("limit") or USUARIOS_PAGE_SIZE)
+    limit = max(1, min(limit, USUARIOS_PAGE_SIZE_MAX))
+
+    filas = list(
+        qs.order_by("role", "first_name", "id")
+        .values("id", "rut", "first_name", "last_name", "email", "phone", "role")[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        next_cursor = encode_cursor(ultima["role"], ultima["first_name"], ultima["id"])
+
+    return filas, next_cursor
+
+
 # =====================================================
 #  DASHBOARD PRINCIPAL
 # =====================================================
@@ -50,17 +134,14 @@ def is_admin(user):
 @login_required
 @user_passes_test(is_admin)
 def admin_dashboard(request):
-    total_students = User.objects.filter(role=User.STUDENT).count()
-    total_teachers = User.objects.filter(role=User.TEACHER).count()
-    total_guardians = User.objects.filter(role=User.GUARDIAN).count()
-    total_payments = Payment.objects.count()
+    stats = get_dashboard_stats()
 
     return render(request, "adminView/admins.html", {
         "usuario": request.user,
-        "total_students": total_students,
-        "total_teachers": total_teachers,
-        "total_guardians": total_guardians,
-        "total_payments": total_payments,
+        "total_students": stats["total_students"],
+        "total_teachers": stats["total_teachers"],
+        "total_guardians": stats["total_guardians"],
+        "total_payments": stats["total_payments"],
     })
 
 
@@ -71,8 +152,11 @@ def admin_dashboard(request):
 @login_required
 @user_passes_test(is_admin)
 def users_list(request):
-    users = User.objects.all().order_by("role", "first_name")
-    return render(request, "adminView/users.html", {"users": users})
+    try:
+        users, next_cursor = buscar_usuarios(request.GET)
+    except ValueError:
+        users, next_cursor = buscar_usuarios({})
+    return render(request, "adminView/users.html", {"users": users, "next_cursor": next_cursor})
 
 
 # =====================================================
@@ -90,11 +174,49 @@ from collections import OrderedDict
 from django.utils.timezone import localtime, make_aware
 from datetime import datetime, time
 
+PAGOS_PAGE_SIZE = 500
+PAGOS_PAGE_SIZE_MAX = 2000
+
+PAGOS_STATUS_MAP = {
+    "pending": "pendientes",
+    "paid": "pagados",
+    "failed": "fallidos",
+    "refunded": "reembolsados",
+}
+
+
+def cursos_activos_por_alumno(student_ids):
+    """
+    Devuelve {student_id: "1° Básico A (2025)"} usando la matrícula activa
+    más reciente de cada alumno. Una sola query para todos los alumnos.
+    """
+    filas = (
+        Enrollment.objects
+        .filter(student_id__in=student_ids, active_status="active")
+        .order_by("student_id", "-class_group__year")
+        .values_list("student_id", "class_group__grade__curso_nombre", "class_group__year")
+    )
+
+    cursos = {}
+    for student_id, curso_nombre, year in filas:
+        if student_id not in cursos and curso_nombre:
+            cursos[student_id] = f"{curso_nombre} ({year})"
+    return cursos
+
+
 @login_required
 @user_passes_test(is_admin)
 def api_ver_pagos(request):
     """
     Agrupa pagos por estado -> curso -> alumno.
+
+    Filtros opcionales (GET):
+      - estado: pending/paid/failed/refunded (o pendientes/pagados/...)
+      - year:   año de vencimiento de la cuota
+      - curso:  curso_id (Grade) de la matrícula activa del alumno
+      - cursor: id del último pago recibido (paginación)
+      - limit:  tamaño de página (por defecto 500)
+
     Respuesta:
     {
       "pendientes": [
@@ -103,41 +225,83 @@ def api_ver_pagos(request):
       ],
       "pagados": [...],
       ...
+      "next_cursor": "1234" | null
     }
     """
-    pagos = Payment.objects.select_related("student").order_by("issue_date")
+    estado = (request.GET.get("estado") or "").strip().lower()
+    year = request.GET.get("year")
+    curso_id = (request.GET.get("curso") or "").strip()
+    cursor = request.GET.get("cursor")
 
-    status_map = {
-        "pending": "pendientes",
-        "paid": "pagados",
-        "failed": "fallidos",
-        "refunded": "reembolsados",
-    }
+    try:
+        limit = int(request.GET.get("limit") or PAGOS_PAGE_SIZE)
+        year = int(year) if year else None
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({"error": "Parámetros inválidos."}, status=400)
+    limit = max(1, min(limit, PAGOS_PAGE_SIZE_MAX))
+
+    pagos = Payment.objects.all()
+
+    # ----- Filtros -----
+    if estado:
+        # Se acepta la clave del modelo ("paid") o el nombre del grupo ("pagados")
+        grupo = PAGOS_STATUS_MAP.get(estado, estado)
+        if grupo == "pendientes":
+            # Todo lo que no cae en otro bucket se muestra como pendiente
+            pagos = pagos.exclude(status__in=["paid", "failed", "refunded"])
+        elif grupo in PAGOS_STATUS_MAP.values():
+            status = next(k for k, v in PAGOS_STATUS_MAP.items() if v == grupo)
+            pagos = pagos.filter(status=status)
+        else:
+            return JsonResponse({"error": f"Estado '{estado}' no válido."}, status=400)
+
+    if year:
+        pagos = pagos.filter(
+            Q(due_date__year=year) | Q(due_date__isnull=True, issue_date__year=year)
+        )
+
+    if curso_id:
+        matriculas = Enrollment.objects.filter(
+            active_status="active",
+            class_group__grade__curso_id=curso_id,
+        )
+        if year:
+            matriculas = matriculas.filter(class_group__year=year)
+        pagos = pagos.filter(student_id__in=matriculas.values("student_id"))
+
+    # ----- Paginación por cursor (id descendente) -----
+    if cursor:
+        pagos = pagos.filter(id__lt=cursor)
+
+    pagos = list(
+        pagos
+        .order_by("-id")
+        .values(
+            "id", "status", "concept", "amount", "issue_date", "created_at",
+            "student_id", "student__first_name", "student__last_name",
+        )[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(pagos) > limit:
+        pagos = pagos[:limit]
+        next_cursor = str(pagos[-1]["id"])
+
+    # ----- Curso del alumno (una sola query) -----
+    cursos_por_alumno = cursos_activos_por_alumno({p["student_id"] for p in pagos})
 
     # temp[estado][curso] = [ pagos... ]
-    temp = {v: defaultdict(list) for v in status_map.values()}
+    temp = {v: defaultdict(list) for v in PAGOS_STATUS_MAP.values()}
 
     for p in pagos:
         # ----- Estado -----
-        estado = status_map.get(p.status, "pendientes")
-
-        # ----- Curso del alumno -----
-        curso_nombre = "Sin curso asignado"
-        enrollment = (
-            Enrollment.objects
-            .filter(student=p.student, active_status="active")
-            .select_related("class_group__grade")
-            .order_by("-class_group__year")
-            .first()
-        )
-        if enrollment and enrollment.class_group and enrollment.class_group.grade:
-            curso_nombre = (
-                f"{enrollment.class_group.grade.curso_nombre} "
-                f"({enrollment.class_group.year})"
-            )
+        estado_key = PAGOS_STATUS_MAP.get(p["status"], "pendientes")
+
+        curso_nombre = cursos_por_alumno.get(p["student_id"], "Sin curso asignado")
 
         # ----- Fecha segura -----
-        fecha = p.issue_date or p.created_at
+        fecha = p["issue_date"] or p["created_at"]
         if isinstance(fecha, datetime):
             dt = localtime(fecha)
         else:
@@ -145,17 +309,17 @@ def api_ver_pagos(request):
             dt = localtime(fecha_dt)
 
         registro = {
-            "alumno": f"{p.student.first_name} {p.student.last_name}",
-            "concepto": p.concept or "—",
-            "monto": f"{p.amount:,.0f}".replace(",", "."),
+            "alumno": f"{p['student__first_name']} {p['student__last_name']}",
+            "concepto": p["concept"] or "—",
+            "monto": f"{p['amount']:,.0f}".replace(",", "."),
             "fecha": dt.strftime("%d-%m-%Y"),
         }
 
-        temp[estado][curso_nombre].append(registro)
+        temp[estado_key][curso_nombre].append(registro)
 
     # ----- Convertir a listas ordenadas -----
     buckets = {}
-    for estado, cursos_dict in temp.items():
+    for estado_key, cursos_dict in temp.items():
         cursos_list = []
         for curso in sorted(cursos_dict.keys()):
             pagos_lista = cursos_dict[curso]
@@ -164,8 +328,9 @@ def api_ver_pagos(request):
                 "curso": curso,
                 "pagos": pagos_lista,
             })
-        buckets[estado] = cursos_list
+        buckets[estado_key] = cursos_list
 
+    buckets["next_cursor"] = next_cursor
     return JsonResponse(buckets)
 
 
@@ -203,12 +368,34 @@ def ver_cursos(request):
 @login_required
 @user_passes_test(is_admin)
 def api_ver_cursos(request):
-    clases = Class.objects.select_related("grade", "teacher").all()
-    data = []
+    """
+    Cursos de un año con sus alumnos. Usa ?year=YYYY (por defecto el año
+    académico actual). Siempre 2 queries: clases + matrículas prefetched.
+    """
+    try:
+        year = int(request.GET.get("year") or timezone.localdate().year)
+    except ValueError:
+        return JsonResponse({"error": "Año inválido."}, status=400)
 
+    matriculas = (
+        Enrollment.objects
+        .select_related("student")
+        .only("class_group_id", "student__rut", "student__first_name",
+              "student__last_name", "student__email")
+    )
+    clases = (
+        Class.objects
+        .filter(year=year)
+        .select_related("grade", "teacher")
+        .prefetch_related(Prefetch("enrollment_set", queryset=matriculas))
+        .order_by("grade__curso_id")
+    )
+
+    data = []
     for c in clases:
-        alumnos = Enrollment.objects.filter(class_group=c).select_related("student")
         data.append({
+            "id": c.id,
+            "curso_id": c.grade.curso_id,
             "curso": c.grade.curso_nombre,
             "year": c.year,
             "profesor": f"{c.teacher.first_name} {c.teacher.last_name}" if c.teacher else "Sin profesor asignado",
@@ -218,39 +405,57 @@ def api_ver_cursos(request):
                     "nombre": f"{a.student.first_name} {a.student.last_name}",
                     "correo": a.student.email or "",
                 }
-                for a in alumnos
+                for a in c.enrollment_set.all()
             ]
         })
 
-    return JsonResponse({"cursos": data})
+    return JsonResponse({"year": year, "cursos": data})
 
 
 @login_required
 @user_passes_test(is_admin)
 def api_ver_profesores(request):
+    """
+    Tabla de profesores en 2 queries fijas: profesores con su curso jefe
+    (subquery) + todas las asignaturas de todos los profesores.
+    """
     try:
-        profesores = User.objects.filter(role=User.TEACHER).prefetch_related("subject_set")
+        jefatura = Class.objects.filter(teacher=OuterRef("pk")).order_by("id")
+        profesores = (
+            User.objects
+            .filter(role=User.TEACHER)
+            .annotate(
+                curso_jefe=Subquery(jefatura.values("grade__curso_id")[:1]),
+                curso_jefe_year=Subquery(jefatura.values("year")[:1]),
+            )
+            .values("id", "first_name", "last_name", "email", "phone",
+                    "curso_jefe", "curso_jefe_year")
+        )
+
+        # Asignaturas únicas por profesor (en orden de creación)
+        asignaturas = defaultdict(dict)
+        for teacher_id, nombre in (
+            Subject.objects
+            .filter(teacher__role=User.TEACHER)
+            .order_by("id")
+            .values_list("teacher_id", "name")
+        ):
+            asignaturas[teacher_id][nombre] = None
+
         data = []
 
         for prof in profesores:
-            # Curso Jefe
-            clase = Class.objects.filter(teacher=prof).select_related("grade").first()
-            curso_jefe = clase.grade.curso_id if clase else "—"
-            year = clase.year if clase else "—"
-
-            # Asignaturas únicas
-            asignaturas_query = prof.subject_set.values_list("name", flat=True)
-            asignaturas_unicas = list(dict.fromkeys(asignaturas_query))
+            asignaturas_unicas = list(asignaturas.get(prof["id"], {}))
             asignaturas_str = ", ".join(asignaturas_unicas) if asignaturas_unicas else "—"
 
             data.append({
-                "id": prof.id,
-                "first_name": prof.first_name,
-                "last_name": prof.last_name,
-                "email": prof.email or "",
-                "telefono": prof.phone or "—",
-                "curso_jefe": curso_jefe,
-                "year": year,
+                "id": prof["id"],
+                "first_name": prof["first_name"],
+                "last_name": prof["last_name"],
+                "email": prof["email"] or "",
+                "telefono": prof["phone"] or "—",
+                "curso_jefe": prof["curso_jefe"] or "—",
+                "year": prof["curso_jefe_year"] or "—",
                 "asignaturas": asignaturas_str,
             })
 
@@ -261,15 +466,11 @@ def api_ver_profesores(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-import io
 import json
 import unicodedata # <--- NECESARIO para manejar tildes/eñes
-from openpyxl import Workbook
-from django.core.mail import EmailMultiAlternatives
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
-from email.mime.image import MIMEImage
 from django.conf import settings
 from django.contrib.auth.hashers import make_password 
 from django.db import transaction
@@ -361,11 +562,9 @@ def api_crear_profesor(request):
                 password=initial_password,
             )
 
-            # Guardar título en TeacherProfile
+            # Guardar título en TeacherProfile (creado junto con el usuario)
             if title:
-                tprofile = profesor.tprofile
-                tprofile.title = title
-                tprofile.save()
+                TeacherProfile.objects.filter(user=profesor).update(title=title)
 
             # Asignar jefe de curso y clase
             clase = None
@@ -395,29 +594,8 @@ def api_crear_profesor(request):
                         subject.teacher = profesor
                         subject.save()
 
-            # --- Generar Excel con horario ---
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Horario de Clases"
-            ws.append(["Día", "Hora inicio", "Hora fin", "Asignatura", "Curso"])
-            day_names = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
-
-            horarios = SubjectSchedule.objects.filter(subject__teacher=profesor)\
-                .select_related("subject__class_group__grade")\
-                .order_by("day_of_week", "start_time")
-            
-            for h in horarios:
-                ws.append([
-                    day_names[h.day_of_week] if h.day_of_week < 5 else str(h.day_of_week),
-                    h.start_time.strftime("%H:%M"),
-                    h.end_time.strftime("%H:%M"),
-                    h.subject.name,
-                    h.subject.class_group.grade.curso_nombre if h.subject.class_group and h.subject.class_group.grade else "—"
-                ])
-            
-            excel_buffer = io.BytesIO()
-            wb.save(excel_buffer)
-            excel_buffer.seek(0)
+            # --- Excel con horario (write-only, queda cacheado por profesor) ---
+            horario = horario_xlsx(profesor.id)
 
             # --- Preparar envío de correo ---
             if profesor.email:
@@ -499,31 +677,30 @@ def api_crear_profesor(request):
         </html>
                 """
 
-                email_msg = EmailMultiAlternatives(
-                    subject=f"Bienvenido/a {profesor.first_name} - Curso y Horario",
-                    body=f"Estimado/a {profesor.first_name}, adjunto su horario y curso. Usuario: {profesor.rut}, Contraseña: {initial_password}.",
-                    from_email=settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
-                    to=[profesor.email],
-                )
-                email_msg.attach_alternative(html_content, "text/html")
+                adjuntos = []
 
                 # Adjuntar logo si existe
                 try:
                     with open(logo_path, "rb") as f:
-                        logo = MIMEImage(f.read())
-                        logo.add_header('Content-ID', '<logo_cid>')
-                        logo.add_header('Content-Disposition', 'inline', filename='logo2.png')
-                        email_msg.attach(logo)
+                        adjuntos.append(adjunto("logo2.png", f.read(), "image/png", content_id="logo_cid"))
                 except FileNotFoundError:
                     print(f"⚠️ No se encontró imagen en {logo_path}")
 
                 # Adjuntar Excel
-                email_msg.attach(f"Horario_{profesor.rut}.xlsx", excel_buffer.read(),
-                                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-                email_msg.send(fail_silently=False)
+                adjuntos.append(adjunto(f"Horario_{profesor.rut}.xlsx", horario, XLSX_MIMETYPE))
+
+                # Se encola dentro de la transacción: si algo falla no queda un
+                # correo huérfano, y no esperamos al SMTP con la transacción abierta.
+                encolar_correo(
+                    subject=f"Bienvenido/a {profesor.first_name} - Curso y Horario",
+                    body=f"Estimado/a {profesor.first_name}, adjunto su horario y curso. Usuario: {profesor.rut}, Contraseña: {initial_password}.",
+                    to=[profesor.email],
+                    html_body=html_content,
+                    attachments=adjuntos,
+                )
 
             return JsonResponse({
-                "message": "✅ Profesor creado y correo enviado.",
+                "message": "✅ Profesor creado. El correo de bienvenida quedó en cola de envío.",
                 "profesor": {
                     "id": profesor.id,
                     "nombre": f"{profesor.first_name} {profesor.last_name}",
@@ -547,7 +724,7 @@ def api_crear_profesor(request):
 def api_actualizar_profesor(request, id):
     try:
         data = json.loads(request.body.decode("utf-8"))
-        profesor = User.objects.get(id=id, role=User.TEACHER)
+        profesor = User.objects.select_related("teacher_profile").get(id=id, role=User.TEACHER)
 
         # Nombre completo viene en el campo "first_name" del formulario
         full_name = data.get("first_name")
@@ -570,8 +747,11 @@ def api_actualizar_profesor(request, id):
         tprofile = profesor.tprofile
         title = data.get("title")
         if title is not None:
-            tprofile.title = title
-            tprofile.save()
+            if tprofile is None:
+                tprofile = TeacherProfile.objects.create(user=profesor, title=title)
+            else:
+                tprofile.title = title
+                tprofile.save(update_fields=["title"])
 
         return JsonResponse({
             "message": "Profesor actualizado correctamente",
@@ -606,46 +786,47 @@ def api_eliminar_profesor(request, id):
 
 
 # =====================================================
-#  REGISTRO DE ALUMNOS
+#  HORARIOS DE PROFESORES (DESCARGA)
 # =====================================================
 
-def strip_accents(s: str) -> str:
-    if not s:
-        return ""
-    s = unicodedata.normalize("NFKD", s)
-    return "".join(c for c in s if not unicodedata.combining(c))
-
-
-def first_letters(name: str, n: int, upper=False, lower=False) -> str:
-    base = strip_accents((name or "").strip())
-    base = re.sub(r"[^A-Za-z]", "", base)  # solo letras
-    out = base[:n]
-    if upper:
-        out = out.upper()
-    if lower:
-        out = out.lower()
-    return out
-
-
-def first_two_digits_of_rut(rut: str) -> str:
-    digits = re.sub(r"[^0-9]", "", rut or "")
-    return digits[:2] or "00"
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def api_horario_profesor(request, id):
+    """Descarga el Excel con el horario de un profesor (cacheado)."""
+    profesor = User.objects.filter(id=id, role=User.TEACHER).values("id", "rut").first()
+    if not profesor:
+        return JsonResponse({"error": "Profesor no encontrado."}, status=404)
 
+    try:
+        response = HttpResponse(horario_xlsx(profesor["id"]), content_type=XLSX_MIMETYPE)
+        response["Content-Disposition"] = f'attachment; filename="Horario_{profesor["rut"]}.xlsx"'
+        return response
+    except Exception as e:
+        print("❌ Error en api_horario_profesor:", str(e))
+        return JsonResponse({"error": str(e)}, status=500)
 
-def build_password_inline(first_name: str, last_name: str, rut: str) -> str:
-    aa = first_letters(first_name, 2, upper=True)       # 2 letras nombre (mayus)
-    bbbbb = first_letters(last_name, 5, lower=True)     # 5 letras apellido (minus)
-    dd = first_two_digits_of_rut(rut)                   # 2 dígitos del RUT
 
-    if len(aa) < 2:
-        aa = (aa + "XX")[:2]
-    if len(bbbbb) < 5:
-        bbbbb = (bbbbb + "xxxxx")[:5]
-    if len(dd) < 2:
-        dd = (dd + "0")[:2]
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def api_horarios_zip(request):
+    """
+    ZIP con el horario de todos los profesores. Se envía en streaming:
+    cada Excel sale apenas está listo, sin armar el ZIP completo en memoria.
+    """
+    profesores = [
+        (p["id"], f'Horario_{p["rut"]}_{p["last_name"] or "profesor"}.xlsx')
+        for p in User.objects.filter(role=User.TEACHER).order_by("last_name", "first_name").values("id", "rut", "last_name")
+    ]
+    response = StreamingHttpResponse(zip_horarios(profesores), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="Horarios_profesores_{timezone.localdate():%Y%m%d}.zip"'
+    return response
 
-    return f"{aa}{bbbbb}{dd}"
 
+# =====================================================
+#  REGISTRO DE ALUMNOS
+# =====================================================
 
 @login_required
 @user_passes_test(is_admin)
@@ -658,205 +839,15 @@ def api_registrar_alumno(request):
     try:
         data = request.POST or json.loads(request.body.decode("utf-8"))
 
-        # Datos del alumno
-        rut = data.get("rut")
-        nombres = data.get("nombres")
-        apellidos = data.get("apellidos")
-        fecha_nacimiento = data.get("fecha_nacimiento")
-        comuna_nombre = data.get("comuna")
-        curso_id = data.get("curso")
-        estado_alumno = data.get("estado_alumno", "active")
-
-        # Datos del apoderado
-        rut_apoderado       = data.get("rut_apoderado")
-        nombre_apoderado    = data.get("nombre_apoderado")
-        apellidos_apoderado = data.get("apellidos_apoderado")  # 👈 NUEVO
-        email_apoderado     = data.get("email_apoderado")
-        telefono_apoderado  = data.get("telefono_apoderado")
-
-        # Ahora también exigimos apellido del apoderado
-        if not all([rut, nombres, apellidos, rut_apoderado, nombre_apoderado, apellidos_apoderado]):
+        fila = limpiar_fila(data)
+        if validar_fila(fila):
             return JsonResponse({"error": "Faltan campos obligatorios."}, status=400)
 
-        # Generar contraseña inicial del alumno
-        pwd_inicial = build_password_inline(nombres, apellidos, rut)
-
-        # Comuna (FK)
-        comuna_obj = None
-        if comuna_nombre:
-            comuna_obj, _ = Comuna.objects.get_or_create(
-                nombre=comuna_nombre.upper()
-            )
-
-        # Crear o actualizar alumno
-        alumno, creado = User.objects.get_or_create(
-            rut=rut,
-            defaults={
-                "first_name": nombres,
-                "last_name": apellidos,
-                "role": User.STUDENT,
-                "birth_date": fecha_nacimiento,
-                "comuna": comuna_obj,
-                "active_status": estado_alumno,
-                "password": make_password(pwd_inicial),
-            },
-        )
-
-        if not creado:
-            alumno.password = make_password(pwd_inicial)
-            alumno.save(update_fields=["password"])
-
-        # Crear o actualizar apoderado (ahora con last_name)
-        apoderado, creado_apo = User.objects.get_or_create(
-            rut=rut_apoderado,
-            defaults={
-                "first_name": nombre_apoderado,
-                "last_name": apellidos_apoderado,     
-                "email": email_apoderado,
-                "phone": telefono_apoderado,
-                "role": User.GUARDIAN,
-                "password": make_password(rut_apoderado),
-            },
-        )
-
-        # Perfil de apoderado + PIN
-        gprofile, _ = GuardianProfile.objects.get_or_create(user=apoderado)
-        if not gprofile.payment_pin:
-            gprofile.payment_pin = "12345"
-            gprofile.save()
-
-        # Relación alumno - apoderado
-        GuardianRelation.objects.get_or_create(
-            guardian=apoderado,
-            student=alumno
-        )
-
-        # Asignación de curso (Enrollment)
-        if curso_id:
-            clase = Class.objects.filter(grade__curso_id=curso_id).first()
-            if clase:
-                Enrollment.objects.get_or_create(student=alumno, class_group=clase)
-
-        # Matrícula y mensualidades
-        hoy = datetime.now().date()
-        year = hoy.year
-        mes_inicio = hoy.month
-
-        Payment.objects.get_or_create(
-            student=alumno,
-            concept=f"Matrícula {year}",
-            defaults={
-                "amount": 230000,
-                "status": "pending",
-                "issue_date": hoy,
-                "due_date": date(year, mes_inicio, 5),
-            },
-        )
-
-        MONTO_MENSUALIDAD = 180000
-        for month in range(mes_inicio, 13):
-            Payment.objects.get_or_create(
-                student=alumno,
-                concept=f"Mensualidad {calendar.month_name[month]} {year}",
-                defaults={
-                    "amount": MONTO_MENSUALIDAD,
-                    "status": "pending",
-                    "issue_date": hoy,
-                    "due_date": date(year, month, 5),
-                },
-            )
-
-        # -----------------------------
-        # Envío de correo HTML personalizado
-        # -----------------------------
-        if apoderado.email:
-            try:
-                year_actual = datetime.now().year
-
-                # Credenciales en HTML
-                credenciales_html = f"""
-                <div style="border: 2px solid #123159; padding: 20px; margin: 20px 0; background-color: #e6f0ff; border-radius: 4px;">
-                    <p style="font-size: 17px; margin:0 0 15px 0; color:#123159; font-weight:bold; text-align:center;">
-                        🔑 Credenciales del Alumno y Apoderado
-                    </p>
-                    <ul style="list-style:none; padding-left:0; font-size:16px; color:#333;">
-                        <li><strong style="color:#123159;">Alumno:</strong> {alumno.first_name} {alumno.last_name}</li>
-                        <li><strong style="color:#123159;">RUT:</strong> {alumno.rut}</li>
-                        <li><strong style="color:#123159;">Contraseña inicial:</strong> {pwd_inicial}</li>
-                        <li><strong style="color:#123159;">PIN apoderado:</strong> {gprofile.payment_pin}</li>
-                    </ul>
-                </div>
-                """
-
-                recordatorio_html = f"""
-                <p style="font-size:14px; color:#a00000; font-style: italic;">
-                    ⚠️ Por seguridad, le recomendamos cambiar la contraseña y el PIN iniciales en la sección "Recupera tu contraseña".
-                </p>
-                """
-
-                html_content = f"""
-                <!DOCTYPE html>
-                <html lang="es">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>Registro de Alumno</title>
-                </head>
-                <body style="margin:0; padding:0; font-family: Arial, sans-serif; background-color:#f4f4f4;">
-                    <table width="100%" cellpadding="0" cellspacing="0" style="table-layout:fixed;">
-                        <tr>
-                            <td align="center" style="padding: 30px 0;">
-                                <table width="600" style="max-width:600px; background-color:#fff; border-radius:6px; border:1px solid #e0e0e0;">
-                                    <tr>
-                                        <td align="center" style="background-color:#D9A84E; padding:15px 40px; border-radius:6px 6px 0 0;">
-                                            <h1 style="color:#123159; margin:0; font-size:20px; font-weight:bold;">¡Bienvenido al Colegio!</h1>
-                                        </td>
-                                    </tr>
-                                    <tr>
-                                        <td style="padding:30px 40px; color:#333; line-height:1.6;">
-                                            <p style="margin:0 0 15px 0;">
-                                                Estimado/a <strong>{apoderado.first_name} {apoderado.last_name}</strong>:
-                                            </p>
-                                            <p style="margin:0 0 15px 0;">
-                                                Se ha registrado un nuevo alumno en el sistema y se han generado sus credenciales:
-                                            </p>
-
-                                            {credenciales_html}
-
-                                            {recordatorio_html}
-
-                                            <p style="font-size:16px; color:#123159; font-weight:bold;">Atentamente,</p>
-                                            <p style="font-size:16px; color:#123159; font-weight:bold;">Equipo de Soporte - Colegio San Agustín de Hipona</p>
-                                        </td>
-                                    </tr>
-                                    <tr>
-                                        <td align="center" style="padding:20px 40px; border-top:1px solid #e0e0e0; color:#999; font-size:12px; border-radius:0 0 6px 6px;">
-                                            &copy; {year_actual}. Colegio San Agustín de Hipona — Todos los derechos reservados.
-                                        </td>
-                                    </tr>
-                                </table>
-                            </td>
-                        </tr>
-                    </table>
-                </body>
-                </html>
-                """
-
-                email_msg = EmailMultiAlternatives(
-                    subject=f"Registro de alumno {alumno.first_name} {alumno.last_name}",
-                    body=(
-                        f"Estimado/a {apoderado.first_name} {apoderado.last_name}, "
-                        f"se ha registrado un nuevo alumno. "
-                        f"Contraseña: {pwd_inicial}, PIN: {gprofile.payment_pin}"
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
-                    to=[apoderado.email],
-                )
-                email_msg.attach_alternative(html_content, "text/html")
-                email_msg.send(fail_silently=False)
-
-            except Exception as e:
-                print("❌ Error al enviar correo al apoderado:", e)
+        # Mismo camino que la carga masiva: pagos y relaciones en bulk
+        resultado = registrar_alumnos([fila])
+        if resultado["errores"]:
+            return JsonResponse({"error": resultado["errores"][0]["error"]}, status=500)
+        registrado = resultado["registrados"][0]
 
         # -----------------------------
         # Respuesta JSON
@@ -867,10 +858,10 @@ def api_registrar_alumno(request):
                 "Se generó matrícula, mensualidades, PIN 12345 para el apoderado y se asignó curso."
             ),
             "alumno": {
-                "nombre": f"{alumno.first_name} {alumno.last_name}",
-                "rut": alumno.rut,
-                "password_inicial": pwd_inicial,
-                "apoderado": f"{apoderado.first_name} {apoderado.last_name}",
+                "nombre": registrado["nombre"],
+                "rut": registrado["rut"],
+                "password_inicial": registrado["password_inicial"],
+                "apoderado": registrado["apoderado"],
             }
         }, status=201)
 
@@ -879,6 +870,51 @@ def api_registrar_alumno(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(["POST"])
+def api_registrar_alumnos_lote(request):
+    """
+    Registro masivo desde una planilla (campo "archivo", .csv o .xlsx) con
+    las mismas columnas que el formulario: rut, nombres, apellidos,
+    fecha_nacimiento, comuna, curso, estado_alumno, rut_apoderado,
+    nombre_apoderado, apellidos_apoderado, email_apoderado, telefono_apoderado.
+
+    Se procesa en bloques con su propia transacción; las filas con error se
+    informan sin detener el resto.
+    """
+    archivo = request.FILES.get("archivo")
+    if not archivo:
+        return JsonResponse({"error": "Debes adjuntar un archivo .csv o .xlsx."}, status=400)
+
+    try:
+        filas = leer_planilla(archivo)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        print("❌ Error leyendo planilla de alumnos:", e)
+        return JsonResponse({"error": "No se pudo leer el archivo."}, status=400)
+
+    if not filas:
+        return JsonResponse({"error": "El archivo no tiene filas."}, status=400)
+
+    try:
+        # La fila 1 es el encabezado
+        resultado = registrar_alumnos(filas, primera_fila=2)
+    except Exception as e:
+        print("❌ Error en registro masivo de alumnos:", e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    return JsonResponse({
+        "message": (
+            f"✅ {len(resultado['registrados'])} alumnos registrados, "
+            f"{len(resultado['errores'])} filas con error."
+        ),
+        "registrados": resultado["registrados"],
+        "errores": resultado["errores"],
+    }, status=201 if resultado["registrados"] else 400)
+
+
 
 
 # =====================================================
@@ -892,6 +928,10 @@ def api_enviar_comunicado(request):
     """
     API para enviar comunicados por correo.
     Recibe: asunto, mensaje, destino (todos/curso/alumno/manual)
+    y según el destino: curso_id, rut o email_manual.
+
+    Registra el Comunicado y deja los lotes BCC en la bandeja de salida;
+    el envío real lo hace el worker send_outbox.
     """
     asunto = request.POST.get("asunto", "").strip()
     mensaje = request.POST.get("mensaje", "").strip()
@@ -901,37 +941,80 @@ def api_enviar_comunicado(request):
         return JsonResponse({"error": "Asunto y mensaje son obligatorios."}, status=400)
 
     try:
-        destinatarios = []
+        clase = None
 
         if destino == "manual":
             email_manual = request.POST.get("email_manual", "").strip()
             if not email_manual:
                 return JsonResponse({"error": "Debes indicar un correo destino."}, status=400)
-            destinatarios.append(email_manual)
+            destinatarios = [email_manual.lower()]
+
+        elif destino == "curso":
+            curso_id = request.POST.get("curso_id", "").strip()
+            clase = (
+                Class.objects
+                .filter(grade__curso_id=curso_id, year=timezone.localdate().year)
+                .first()
+            )
+            if not clase:
+                return JsonResponse({"error": "Debes seleccionar un curso válido."}, status=400)
+            destinatarios = resolver_destinatarios("curso", clase=clase)
+
+        elif destino == "alumno":
+            rut = request.POST.get("rut", "").strip()
+            alumno = User.objects.filter(rut__iexact=rut, role=User.STUDENT).first()
+            if not alumno:
+                return JsonResponse({"error": "No se encontró un alumno con ese RUT."}, status=400)
+            destinatarios = resolver_destinatarios("alumno", alumno=alumno)
+
+        elif destino == "todos":
+            destinatarios = resolver_destinatarios("todos")
+
         else:
-            if settings.EMAIL_HOST_USER:
-                destinatarios.append(settings.EMAIL_HOST_USER)
-            else:
-                return JsonResponse(
-                    {"error": "No hay correo remitente configurado en el servidor."},
-                    status=500
-                )
+            return JsonResponse({"error": "Destino no válido."}, status=400)
 
-        send_mail(
-            subject=asunto,
-            message=mensaje,
-            from_email=settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
-            recipient_list=destinatarios,
-            fail_silently=False,
-        )
+        if not destinatarios:
+            return JsonResponse({"error": "No hay destinatarios con correo para ese destino."}, status=400)
 
-        return JsonResponse({"message": "Comunicado enviado correctamente."})
+        # Juntos o nada: un comunicado sin lotes quedaría "pendiente" para siempre
+        with transaction.atomic():
+            comunicado = Comunicado.objects.create(
+                asunto=asunto,
+                mensaje=mensaje,
+                destino=destino,
+                curso=clase,
+                enviado_por=request.user,
+            )
+            lotes = programar_comunicado(comunicado, destinatarios)
+
+        return JsonResponse({
+            "message": f"Comunicado en cola de envío para {len(destinatarios)} destinatario(s).",
+            "comunicado_id": comunicado.id,
+            "destinatarios": len(destinatarios),
+            "lotes": lotes,
+        })
 
     except Exception as e:
         print("Error al enviar comunicado:", e)
         return JsonResponse({"error": "Error interno al enviar el comunicado."}, status=500)
 
 
+@login_required
+@user_passes_test(is_admin)
+def api_estado_comunicado(request, id):
+    """Progreso de envío de un comunicado masivo."""
+    comunicado = get_object_or_404(Comunicado, id=id)
+    return JsonResponse({
+        "id": comunicado.id,
+        "asunto": comunicado.asunto,
+        "estado": comunicado.estado,
+        "total": comunicado.total_destinatarios,
+        "enviados": comunicado.enviados,
+        "fallidos": comunicado.fallidos,
+        "ultimo_error": comunicado.ultimo_error,
+    })
+
+
 # =====================================================
 #  LISTADOS GENERALES
 # =====================================================
@@ -939,21 +1022,26 @@ def api_enviar_comunicado(request):
 @login_required
 @user_passes_test(is_admin)
 def api_listar_usuarios(request):
+    """Listado paginado de usuarios. Ver buscar_usuarios() para los filtros."""
     try:
-        usuarios = User.objects.all().order_by("role", "first_name")
+        filas, next_cursor = buscar_usuarios(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        data = []
-        for u in usuarios:
-            data.append({
-                "id": u.id,
-                "nombre": f"{u.first_name} {u.last_name}",
-                "rut": u.rut,
-                "email": u.email or "—",
-                "telefono": u.phone or "—",
-                "rol": u.get_role_display() if hasattr(u, "get_role_display") else u.role,
-            })
+    try:
+        data = [
+            {
+                "id": u["id"],
+                "nombre": f"{u['first_name']} {u['last_name']}",
+                "rut": u["rut"],
+                "email": u["email"] or "—",
+                "telefono": u["phone"] or "—",
+                "rol": ROLE_LABELS.get(u["role"], u["role"]),
+            }
+            for u in filas
+        ]
 
-        return JsonResponse({"usuarios": data})
+        return JsonResponse({"usuarios": data, "next_cursor": next_cursor})
 
     except Exception as e:
         print("❌ Error al listar usuarios:", e)
@@ -1074,63 +1162,7 @@ def api_listar_horarios(request):
 
 @login_required
 def api_dashboard_stats(request):
-    try:
-        locale.setlocale(locale.LC_TIME, '')
-    except Exception:
-        pass
-
-    stats = {
-        "total_students": User.objects.filter(role=User.STUDENT).count(),
-        "total_teachers": User.objects.filter(role=User.TEACHER).count(),
-        "total_guardians": User.objects.filter(role=User.GUARDIAN).count(),
-        "total_admins": User.objects.filter(role__in=[User.ADMIN, User.FINANCE_ADMIN]).count(),
-        "pagos_pendientes": Payment.objects.filter(status="pending").count(),
-        "pagos_pagados": Payment.objects.filter(status="paid").count(),
-        "pagos_fallidos": Payment.objects.filter(status="failed").count(),
-        "pagos_reembolsados": Payment.objects.filter(status="refunded").count(),
-    }
-
-    # Flujo de ingresos por mes
-    ingresos_query = (
-        Payment.objects.filter(status='paid')
-        .annotate(month=TruncMonth('issue_date'))
-        .values('month')
-        .annotate(total=Sum('amount'))
-        .order_by('month')
-    )
-
-    ingresos_labels = []
-    ingresos_data = []
-
-    for entry in ingresos_query:
-        if entry['month']:
-            mes_nombre = entry['month'].strftime('%B').capitalize()
-            ingresos_labels.append(mes_nombre)
-            ingresos_data.append(entry['total'])
-
-    # Matrícula por nivel
-    alumnos_nivel_query = (
-        Enrollment.objects.filter(active_status='active')
-        .values('class_group__grade__curso_nombre')
-        .annotate(total=Count('student'))
-        .order_by('class_group__grade__curso_id')
-    )
-
-    niveles_labels = []
-    niveles_data = []
-
-    for entry in alumnos_nivel_query:
-        nombre = entry['class_group__grade__curso_nombre']
-        if nombre:
-            nombre_corto = nombre.replace("Básico", "Bás").replace("Medio", "Med")
-            niveles_labels.append(nombre_corto)
-            niveles_data.append(entry['total'])
-
-    stats["ingresos_labels"] = ingresos_labels
-    stats["ingresos_data"] = ingresos_data
-    stats["niveles_labels"] = niveles_labels
-    stats["niveles_data"] = niveles_data
-
+    stats = get_dashboard_stats()
     return JsonResponse(stats)
 
 
@@ -4,6 +4,7 @@ from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import (
     User, Payment, Grade, Class, Subject, Enrollment,
     GuardianRelation, EvaluationType, Evaluation, GradeResult, Attendance,
+    OutboundEmail,
     Student, Guardian  # proxies 
 )
 
@@ -68,6 +69,16 @@ class PaymentAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at")
 
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status",)
+    search_fields = ("subject",)
+    readonly_fields = ("created_at", "sent_at", "last_error")
+    # El contenido puede traer contraseñas iniciales o PINs: nunca se muestra
+    exclude = ("body", "html_body", "attachments")
+
+
 admin.site.register(Grade)
 admin.site.register(Class)
 admin.site.register(Subject)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import horarios, perfiles, promedios
+        horarios.conectar_senales()
+        perfiles.conectar_senales()
+        promedios.conectar_senales()
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.models import (
+    Comunicado,
+    Enrollment,
+    GuardianRelation,
+    OutboundEmail,
+    Subject,
+    User,
+)
+
+
+# =====================================================
+#  RESOLUCIÓN DE DESTINATARIOS
+# =====================================================
+
+def resolver_destinatarios(destino, clase=None, alumno=None):
+    """
+    Correos (sin duplicados, en minúscula) de alumnos, apoderados y
+    profesores según el destino. Siempre es una sola query.
+
+      - todos:  alumnos, apoderados y profesores activos del colegio
+      - curso:  alumnos activos de `clase`, sus apoderados, los profesores
+                de sus asignaturas y el profesor jefe
+      - alumno: el alumno y sus apoderados
+    """
+    if destino == "todos":
+        filtro = (
+            Q(role__in=[User.STUDENT, User.GUARDIAN, User.TEACHER])
+            # cualquier usuario con pupilos también es apoderado
+            | Q(id__in=GuardianRelation.objects.values("guardian_id"))
+        )
+    elif destino == "curso":
+        alumnos = Enrollment.objects.filter(class_group=clase, active_status="active").values("student_id")
+        filtro = (
+            Q(id__in=alumnos)
+            | Q(id__in=GuardianRelation.objects.filter(student_id__in=alumnos).values("guardian_id"))
+            | Q(id__in=Subject.objects.filter(class_group=clase).values("teacher_id"))
+            | Q(id=clase.teacher_id)
+        )
+    elif destino == "alumno":
+        filtro = (
+            Q(id=alumno.id)
+            | Q(id__in=GuardianRelation.objects.filter(student=alumno).values("guardian_id"))
+        )
+    else:
+        raise ValueError(f"Destino '{destino}' no soportado")
+
+    correos = (
+        User.objects
+        .filter(filtro, is_active=True, active_status="active", email__isnull=False)
+        .exclude(email="")
+        .values_list("email", flat=True)
+    )
+    return list(dict.fromkeys(c.strip().lower() for c in correos if c.strip()))
+
+
+# =====================================================
+#  PROGRAMAR ENVÍO (lotes BCC en la bandeja de salida)
+# =====================================================
+
+def programar_comunicado(comunicado, destinatarios, batch_size=None):
+    """
+    Divide los destinatarios en lotes BCC y los deja en la bandeja de salida,
+    asociados al comunicado. El worker send_outbox los envía usando una sola
+    conexión SMTP y va actualizando el progreso del comunicado.
+    """
+    batch_size = batch_size or settings.COMUNICADO_BCC_BATCH_SIZE
+    remitente = settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER or ""
+
+    correos = []
+    for i in range(0, len(destinatarios), batch_size):
+        lote = destinatarios[i:i + batch_size]
+        if comunicado.destino == "manual":
+            to, bcc = lote, []
+        else:
+            # El "Para" es el propio colegio; las familias van ocultas en BCC
+            to, bcc = ([remitente] if remitente else []), lote
+        correos.append(OutboundEmail(
+            comunicado=comunicado,
+            subject=comunicado.asunto,
+            body=comunicado.mensaje,
+            from_email=remitente,
+            to=to,
+            bcc=bcc,
+        ))
+
+    with transaction.atomic():
+        comunicado.destinatarios = ", ".join(destinatarios)
+        comunicado.total_destinatarios = len(destinatarios)
+        comunicado.estado = "en_cola" if correos else "enviado"
+        comunicado.save(update_fields=["destinatarios", "total_destinatarios", "estado"])
+        OutboundEmail.objects.bulk_create(correos)
+
+    return len(correos)
+
+
+def registrar_progreso(correo, ok, error=""):
+    """Suma los destinatarios de un lote enviado (o descartado) al comunicado."""
+    n = len(correo.bcc) + (0 if correo.bcc else len(correo.to))
+    if ok:
+        cambios = {"enviados": F("enviados") + n}
+    else:
+        cambios = {"fallidos": F("fallidos") + n, "ultimo_error": error}
+
+    with transaction.atomic():
+        Comunicado.objects.filter(id=correo.comunicado_id).update(**cambios)
+        # Cierra el comunicado cuando ya no quedan lotes por enviar
+        pendientes = OutboundEmail.objects.filter(
+            comunicado_id=correo.comunicado_id,
+            status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING],
+        ).exclude(id=correo.id)
+        if not pendientes.exists():
+            Comunicado.objects.filter(id=correo.comunicado_id, fallidos=0).update(estado="enviado")
+            Comunicado.objects.filter(id=correo.comunicado_id, fallidos__gt=0).update(estado="con_errores")
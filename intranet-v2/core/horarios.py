@@ -0,0 +1,293 @@
+import io
+import time
+import zipfile
+from bisect import bisect_right
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from openpyxl import Workbook
+
+from core.models import Subject, SubjectSchedule
+
+
+# =====================================================
+#  HORARIO DE PROFESORES (Excel)
+# =====================================================
+
+DAY_NAMES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+HEADER = ["Día", "Hora inicio", "Hora fin", "Asignatura", "Curso"]
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+CACHE_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = "horarios_version"
+
+
+def _version():
+    # La versión global permite invalidar todo de una vez (cargas masivas)
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def _cache_key(prefix, teacher_id, version=None):
+    return f"{prefix}:{version or _version()}:{teacher_id}"
+
+
+def invalidar_horario(teacher_id):
+    if teacher_id:
+        _semana_memo.pop(teacher_id, None)
+        version = _version()
+        cache.delete_many([
+            _cache_key("horario_xlsx", teacher_id, version),
+            f"horario_semana:{teacher_id}",
+        ])
+
+
+def invalidar_todos_los_horarios():
+    """
+    Para cargas con bulk_create/update, que no disparan señales. La caché es
+    compartida (CACHES en settings), así que llega también a los workers web
+    aunque se llame desde un comando.
+    """
+    _semana_memo.clear()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def filas_horario(teacher_ids=None):
+    """
+    {teacher_id: [(día, inicio, fin, asignatura, curso), ...]} ordenado por
+    día y hora. Una sola query para todos los profesores pedidos.
+    """
+    qs = SubjectSchedule.objects.filter(subject__teacher__isnull=False)
+    if teacher_ids is not None:
+        qs = qs.filter(subject__teacher_id__in=teacher_ids)
+
+    filas = {}
+    for teacher_id, dia, inicio, fin, asignatura, curso in (
+        qs.order_by("day_of_week", "start_time")
+        .values_list(
+            "subject__teacher_id", "day_of_week", "start_time", "end_time",
+            "subject__name", "subject__class_group__grade__curso_nombre",
+        )
+    ):
+        filas.setdefault(teacher_id, []).append((
+            DAY_NAMES[dia] if dia < len(DAY_NAMES) else str(dia),
+            inicio.strftime("%H:%M"),
+            fin.strftime("%H:%M"),
+            asignatura,
+            curso or "—",
+        ))
+    return filas
+
+
+# =====================================================
+#  HORARIO SEMANAL (clases de hoy)
+# =====================================================
+#  Por profesor: {día: [(inicio, fin, asignatura, curso, class_id), ...]}
+#  con inicio/fin en minutos desde medianoche, ordenado por inicio. Las
+#  mismas señales que invalidan el Excel lo invalidan; además vence en una
+#  hora por si un cambio llega sin señal (SQL directo, otra app).
+
+#
+#  Delante de la caché compartida hay una memoria por proceso de unos
+#  segundos: el endpoint más pedido (clases de hoy, a las 8:00) no hace
+#  ninguna query mientras está vigente. Un cambio de horario puede tardar
+#  hasta SEMANA_MEMO_SEGUNDOS en verse en los otros workers.
+
+SEMANA_TIMEOUT = 60 * 60
+SEMANA_MEMO_SEGUNDOS = 30
+_semana_memo = {}  # teacher_id -> (vence, version, semana)
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _hhmm(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def semana_profesor(teacher_id):
+    """
+    Horario semanal del profesor, cacheado hasta que cambie.
+
+    Costo: con la memoria del proceso vigente, cero queries. Si no, una
+    lectura de la caché compartida (get_many de versión + horario), que con
+    DatabaseCache es un SELECT y con Redis no toca la BD.
+    """
+    ahora = time.monotonic()
+    memo = _semana_memo.get(teacher_id)
+    if memo is not None and memo[0] > ahora:
+        return memo[2]
+
+    key = f"horario_semana:{teacher_id}"
+    en_cache = cache.get_many([VERSION_KEY, key])
+    version = en_cache.get(VERSION_KEY) or _version()
+    guardado = en_cache.get(key)
+    if guardado is not None and guardado[0] == version:
+        _semana_memo[teacher_id] = (ahora + SEMANA_MEMO_SEGUNDOS, version, guardado[1])
+        return guardado[1]
+
+    semana = {}
+    for dia, inicio, fin, asignatura, curso, class_id in (
+        SubjectSchedule.objects
+        .filter(subject__teacher_id=teacher_id)
+        .order_by("day_of_week", "start_time", "end_time")
+        .values_list(
+            "day_of_week", "start_time", "end_time", "subject__name",
+            "subject__class_group__grade__curso_nombre", "subject__class_group_id",
+        )
+    ):
+        semana.setdefault(dia, []).append(
+            (_minutos(inicio), _minutos(fin), asignatura, curso or "—", class_id)
+        )
+    cache.set(key, (version, semana), SEMANA_TIMEOUT)
+    _semana_memo[teacher_id] = (ahora + SEMANA_MEMO_SEGUNDOS, version, semana)
+    return semana
+
+
+def _bloque(clase):
+    inicio, fin, asignatura, curso, class_id = clase
+    return {
+        "inicio": _hhmm(inicio),
+        "fin": _hhmm(fin),
+        "asignatura": asignatura,
+        "curso": curso,
+        "curso_id": class_id,
+    }
+
+
+def clases_del_dia(teacher_id, ahora):
+    """
+    Clases del día de `ahora` en orden, más la clase en curso y la siguiente
+    (bisect sobre los inicios ordenados).
+    """
+    clases = semana_profesor(teacher_id).get(ahora.weekday(), [])
+    minuto = _minutos(ahora)
+
+    # Última clase que ya empezó; está en curso si aún no termina
+    i = bisect_right([c[0] for c in clases], minuto)
+    actual = clases[i - 1] if i and minuto < clases[i - 1][1] else None
+    siguiente = clases[i] if i < len(clases) else None
+
+    return {
+        "clases": [_bloque(c) for c in clases],
+        "actual": _bloque(actual) if actual else None,
+        "siguiente": _bloque(siguiente) if siguiente else None,
+    }
+
+
+def construir_xlsx(filas):
+    """
+    Genera el .xlsx en modo write-only (no guarda celdas en memoria).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Horario de Clases")
+    ws.append(HEADER)
+    for fila in filas:
+        ws.append(list(fila))
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def horario_xlsx(teacher_id):
+    """Excel del horario de un profesor, cacheado hasta que cambie su horario."""
+    key = _cache_key("horario_xlsx", teacher_id)
+    contenido = cache.get(key)
+    if contenido is None:
+        contenido = construir_xlsx(filas_horario([teacher_id]).get(teacher_id, []))
+        cache.set(key, contenido, CACHE_TIMEOUT)
+    return contenido
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino no-seekable para ZipFile: acumula bytes que luego se drenan."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drenar(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_horarios(profesores):
+    """
+    Generador que produce un ZIP con el horario de cada profesor.
+    `profesores` es una lista de (teacher_id, nombre_archivo).
+
+    Los Excel cacheados se leen de una vez (get_many); los que faltan se
+    construyen en el mismo proceso (write-only, sin celdas en memoria) con
+    una sola query para todos, se emiten apenas están listos y se guardan
+    juntos al final (set_many).
+    """
+    nombres = dict(profesores)
+    version = _version()
+    claves = {teacher_id: _cache_key("horario_xlsx", teacher_id, version) for teacher_id in nombres}
+    # Una sola lectura de caché para todos (con DatabaseCache es un SELECT)
+    cacheados = cache.get_many(claves.values())
+
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        faltantes = []
+        for teacher_id in nombres:
+            contenido = cacheados.pop(claves[teacher_id], None)
+            if contenido is None:
+                faltantes.append(teacher_id)
+                continue
+            zf.writestr(nombres[teacher_id], contenido)
+            yield stream.drenar()
+
+        if faltantes:
+            filas = filas_horario(faltantes)
+            nuevos = {}
+            for teacher_id in faltantes:
+                contenido = construir_xlsx(filas.get(teacher_id, []))
+                nuevos[claves[teacher_id]] = contenido
+                zf.writestr(nombres[teacher_id], contenido)
+                yield stream.drenar()
+            cache.set_many(nuevos, CACHE_TIMEOUT)
+
+    yield stream.drenar()
+
+
+# =====================================================
+#  INVALIDACIÓN POR SEÑALES
+# =====================================================
+
+def _schedule_cambiado(sender, instance, **kwargs):
+    teacher_id = (
+        Subject.objects.filter(id=instance.subject_id).values_list("teacher_id", flat=True).first()
+    )
+    invalidar_horario(teacher_id)
+
+
+def _subject_antes_de_guardar(sender, instance, **kwargs):
+    # Guardamos el profesor anterior para invalidar también su horario
+    instance._teacher_anterior = (
+        Subject.objects.filter(id=instance.id).values_list("teacher_id", flat=True).first()
+        if instance.id else None
+    )
+
+
+def _subject_cambiado(sender, instance, **kwargs):
+    invalidar_horario(instance.teacher_id)
+    invalidar_horario(getattr(instance, "_teacher_anterior", None))
+
+
+def conectar_senales():
+    post_save.connect(_schedule_cambiado, sender=SubjectSchedule, dispatch_uid="horarios_schedule_save")
+    post_delete.connect(_schedule_cambiado, sender=SubjectSchedule, dispatch_uid="horarios_schedule_delete")
+    pre_save.connect(_subject_antes_de_guardar, sender=Subject, dispatch_uid="horarios_subject_pre_save")
+    post_save.connect(_subject_cambiado, sender=Subject, dispatch_uid="horarios_subject_save")
+    post_delete.connect(_subject_cambiado, sender=Subject, dispatch_uid="horarios_subject_delete")
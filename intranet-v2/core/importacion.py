@@ -0,0 +1,384 @@
+import codecs
+import csv
+import json
+import os
+from datetime import date, datetime, time
+from itertools import islice
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+
+# =====================================================
+#  LECTURA EN STREAMING
+# =====================================================
+
+ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+
+
+def detectar_encoding(path, encodings=ENCODINGS, block_size=1 << 16):
+    """
+    Primera codificación que decodifica el archivo completo. Se lee por
+    bloques con un decoder incremental: memoria constante.
+    """
+    for enc in encodings:
+        decoder = codecs.getincrementaldecoder(enc)()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(block_size), b""):
+                    decoder.decode(block)
+                decoder.decode(b"", final=True)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def normalizar_fila(row):
+    """Llaves en minúscula y valores sin espacios ('' si vienen vacíos)."""
+    return {
+        (k or "").strip().lower(): ("" if v is None else str(v).strip())
+        for k, v in (row or {}).items()
+        if k is not None
+    }
+
+
+def leer_filas_csv(path, encoding=None):
+    """Generador de filas normalizadas de un CSV (detecta codificación y delimitador)."""
+    encoding = encoding or detectar_encoding(path)
+    with open(path, newline="", encoding=encoding) as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
+            reader = csv.DictReader(f, dialect=dialect)
+        except csv.Error:
+            reader = csv.DictReader(f, delimiter=";" if ";" in sample else ",")
+
+        for row in reader:
+            yield normalizar_fila(row)
+
+
+def valor_celda(valor):
+    """
+    Celda de Excel -> texto con el mismo formato que tendría en el CSV:
+    fechas ISO (YYYY-MM-DD), horas HH:MM y números enteros sin '.0'.
+    """
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.date().isoformat() if valor.time() == time(0) else valor.strftime("%Y-%m-%d %H:%M")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M")
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def leer_filas_xlsx(path):
+    """
+    Generador de filas normalizadas de la primera hoja de un .xlsx.
+    Modo read_only + iter_rows(values_only=True): memoria constante.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = wb.worksheets[0].iter_rows(values_only=True)
+        encabezado = [valor_celda(c).lower() for c in next(filas, ())]
+        for fila in filas:
+            valores = [valor_celda(v) for v in fila]
+            if not any(valores):
+                continue  # filas vacías al final de la hoja
+            yield {k: v for k, v in zip(encabezado, valores) if k}
+    finally:
+        wb.close()
+
+
+def leer_filas(path):
+    """Generador de filas (dicts) del archivo a importar (.csv o .xlsx)."""
+    if not os.path.exists(path):
+        raise CommandError(f"Archivo no encontrado: {path}")
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return leer_filas_xlsx(path)
+    return leer_filas_csv(path)
+
+
+def en_bloques(iterable, size):
+    """Agrupa un iterable en listas de hasta `size` elementos sin materializarlo."""
+    it = iter(iterable)
+    while True:
+        bloque = list(islice(it, size))
+        if not bloque:
+            return
+        yield bloque
+
+
+# =====================================================
+#  PIPELINE: bloques transaccionales + checkpoint + errores
+# =====================================================
+
+def agregar_argumentos(parser, chunk_size=500):
+    """Opciones comunes de los comandos insert_*."""
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=chunk_size,
+        help=f"Filas por transacción (default: {chunk_size})",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Retoma una carga interrumpida desde el último bloque confirmado",
+    )
+    parser.add_argument(
+        "--errores",
+        type=str,
+        default="",
+        help="CSV donde se escriben las filas rechazadas (default: <archivo>.errores.csv)",
+    )
+
+
+class Importacion:
+    """
+    Recorre el archivo en bloques de `chunk_size` filas. Cada bloque se
+    procesa dentro de su propia transacción y, al confirmarse, se guarda un
+    checkpoint (<archivo>.checkpoint.json). Si la carga se cae a la mitad,
+    con --resume se salta lo ya confirmado.
+
+    Las filas rechazadas (rechazar()) se escriben en un CSV de errores con
+    su número de fila y el motivo. Si un bloque falla en la BD se repite
+    fila a fila: las que fallan van al CSV de errores y la carga sigue.
+
+    Uso:
+        imp = Importacion(path, chunk_size=500, resume=True)
+        imp.ejecutar(procesar_bloque)   # procesar_bloque([(n, fila), ...])
+    """
+
+    def __init__(self, path, chunk_size=500, resume=False, errores_path="", stdout=None):
+        self.path = path
+        self.chunk_size = max(1, chunk_size)
+        self.resume = resume
+        self.errores_path = errores_path or f"{path}.errores.csv"
+        self.checkpoint_path = f"{path}.checkpoint.json"
+        self.stdout = stdout
+
+        self.total = 0          # filas leídas en esta ejecución
+        self.confirmadas = 0    # filas en bloques confirmados (incluye las del checkpoint)
+        self.rechazadas = 0
+        self._pendientes = []   # rechazos del bloque en curso
+        self._errores_file = None
+        self._errores_writer = None
+
+    # ---------- checkpoint ----------
+
+    def _firma(self):
+        st = os.stat(self.path)
+        return {"archivo": os.path.abspath(self.path), "tamano": st.st_size, "mtime": int(st.st_mtime)}
+
+    def _leer_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if any(data.get(k) != v for k, v in self._firma().items()):
+            raise CommandError(
+                f"El checkpoint {self.checkpoint_path} corresponde a otra versión del archivo; "
+                "bórralo para empezar de nuevo."
+            )
+        return data["filas"]
+
+    def _guardar_checkpoint(self):
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**self._firma(), "filas": self.confirmadas}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # ---------- errores ----------
+
+    def rechazar(self, n, fila, motivo):
+        """Marca una fila como rechazada; se escribe si su bloque se confirma."""
+        self._pendientes.append((n, fila, motivo))
+
+    def _escribir_rechazos(self):
+        if not self._pendientes:
+            return
+        if self._errores_writer is None:
+            existe = os.path.exists(self.errores_path)
+            self._errores_file = open(
+                self.errores_path, "a" if self.resume and existe else "w",
+                newline="", encoding="utf-8",
+            )
+            self._errores_writer = csv.writer(self._errores_file)
+            if not (self.resume and existe):
+                self._errores_writer.writerow(["fila", "motivo", "datos"])
+        for n, fila, motivo in self._pendientes:
+            self._errores_writer.writerow([n, motivo, json.dumps(fila, ensure_ascii=False, default=str)])
+        self._errores_file.flush()
+        self.rechazadas += len(self._pendientes)
+        self._pendientes = []
+
+    # ---------- ejecución ----------
+
+    def filas(self):
+        """(n, fila) numeradas desde 2 (la fila 1 es el encabezado)."""
+        return enumerate(leer_filas(self.path), start=2)
+
+    def ejecutar(self, procesar_bloque):
+        saltar = self._leer_checkpoint() if self.resume else 0
+        if saltar and self.stdout:
+            self.stdout.write(f"⏩ Retomando carga: se saltan {saltar} filas ya confirmadas")
+        self.confirmadas = saltar
+
+        filas = islice(self.filas(), saltar, None)
+        try:
+            for bloque in en_bloques(filas, self.chunk_size):
+                self.total += len(bloque)
+                self._pendientes = []
+                contadores = self._contadores(procesar_bloque)
+                try:
+                    with transaction.atomic():
+                        procesar_bloque(bloque)
+                except Exception as e:
+                    self._restaurar_contadores(procesar_bloque, contadores)
+                    self._reintentar_por_fila(procesar_bloque, bloque, e)
+                self.confirmadas += len(bloque)
+                self._guardar_checkpoint()
+                self._escribir_rechazos()
+        finally:
+            if self._errores_file:
+                self._errores_file.close()
+
+        # Terminó completo: ya no hay nada que retomar
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _reintentar_por_fila(self, procesar_bloque, bloque, error):
+        """
+        El bloque falló en la BD (p. ej. un valor demasiado largo): se repite
+        fila a fila, cada una en su savepoint. Las que vuelven a fallar se
+        rechazan con su error real y la carga sigue con el resto.
+        """
+        if self.stdout:
+            self.stdout.write(
+                f"⚠️ Bloque de filas {bloque[0][0]}-{bloque[-1][0]} falló ({error}); "
+                "se reintenta fila a fila"
+            )
+        self._pendientes = []
+        with transaction.atomic():
+            for n, fila in bloque:
+                pendientes = len(self._pendientes)
+                contadores = self._contadores(procesar_bloque)
+                try:
+                    with transaction.atomic():
+                        procesar_bloque([(n, fila)])
+                except Exception as e:
+                    del self._pendientes[pendientes:]
+                    self._restaurar_contadores(procesar_bloque, contadores)
+                    self.rechazar(n, fila, f"Error en BD: {e}")
+
+    # Los comandos llevan contadores (creados, actualizados...) como enteros
+    # en sí mismos; si un intento se revierte, sus sumas también.
+
+    @staticmethod
+    def _contadores(procesar_bloque):
+        dueno = getattr(procesar_bloque, "__self__", None)
+        if dueno is None:
+            return {}
+        return {k: v for k, v in vars(dueno).items() if type(v) is int}
+
+    @staticmethod
+    def _restaurar_contadores(procesar_bloque, contadores):
+        dueno = getattr(procesar_bloque, "__self__", None)
+        for k, v in contadores.items():
+            setattr(dueno, k, v)
+
+    def resumen(self):
+        msg = f"Filas confirmadas: {self.confirmadas} | Rechazadas: {self.rechazadas}"
+        if self.rechazadas:
+            msg += f" (ver {self.errores_path})"
+        return msg
+
+
+# =====================================================
+#  PLAN / APPLY: vista previa de una carga sin tocar la BD
+# =====================================================
+
+def agregar_argumentos_plan(parser):
+    """Opciones --plan / --apply de los comandos de carga."""
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PLAN_JSON",
+        help="No escribe en la BD: calcula altas/cambios/omisiones y los guarda "
+             "en un plan JSON (default: <archivo>.plan.json)",
+    )
+    parser.add_argument(
+        "--apply",
+        type=str,
+        default="",
+        metavar="PLAN_JSON",
+        help="Ejecuta exactamente un plan generado antes con --plan",
+    )
+
+
+def valor_plan(valor):
+    """Valor de un campo tal como queda en el plan (JSON): fechas en ISO."""
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def diferencias(actuales, nuevos, ignorar_nulos=False):
+    """
+    {campo: [antes, después]} de los campos de `nuevos` que difieren de
+    `actuales`. Con ignorar_nulos, un None en `nuevos` no pisa el valor.
+    """
+    return {
+        campo: [actuales.get(campo), valor]
+        for campo, valor in nuevos.items()
+        if actuales.get(campo) != valor and not (ignorar_nulos and valor is None)
+    }
+
+
+def guardar_plan(path, comando, plan, origen=None):
+    """Escribe el plan (atómicamente) junto con el comando que lo generó."""
+    data = {
+        "comando": comando,
+        "generado": timezone.now().isoformat(),
+        "origen": origen,
+        **plan,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def cargar_plan(path, comando):
+    if not os.path.exists(path):
+        raise CommandError(f"Plan no encontrado: {path}")
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("comando") != comando:
+        raise CommandError(
+            f"El plan {path} fue generado por '{data.get('comando')}', no por '{comando}'."
+        )
+    return data
+
+
+def verificar_plan(conflictos):
+    """
+    Aborta si la BD cambió desde que se generó el plan (registros que el
+    plan crea y ya existen, o que actualiza y ya no tienen el valor 'antes').
+    """
+    if conflictos:
+        muestra = ", ".join(conflictos[:5]) + ("…" if len(conflictos) > 5 else "")
+        raise CommandError(
+            f"El plan está desactualizado: {len(conflictos)} registro(s) cambiaron "
+            f"desde que se generó ({muestra}). Genera uno nuevo con --plan."
+        )
@@ -4,7 +4,8 @@ from datetime import date
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from core.models import Enrollment, Payment, User
+from adminView.stats import invalidar_dashboard_stats
+from core.models import Enrollment, Payment
 
 
 class Command(BaseCommand):
@@ -30,96 +31,112 @@ class Command(BaseCommand):
             default=5,
             help="Día de vencimiento de cada cuota (ej: 5)",
         )
+        parser.add_argument(
+            "--curso",
+            action="append",
+            default=[],
+            help="Solo alumnos de este curso (curso_id, ej: 1A). Se puede repetir.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Pagos por INSERT/transacción (default: 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Muestra cuántos pagos se crearían, sin guardar nada",
+        )
+
+    def cuotas(self, anio, monto_matricula, monto_mensualidad, dia_venc):
+        """[(concepto, monto, vencimiento)] del año."""
+        cuotas = []
+
+        # 1) Matrícula
+        if monto_matricula > 0:
+            cuotas.append((f"Matrícula {anio}", monto_matricula, date(anio, 3, min(dia_venc, 28))))
+
+        # 2) Mensualidades marzo–diciembre (meses de clases en Chile)
+        if monto_mensualidad > 0:
+            for mes in range(3, 13):
+                nombre_mes = calendar.month_name[mes].capitalize()
+                # Evitar días inválidos (ej: 31 de febrero)
+                ultimo_dia_mes = calendar.monthrange(anio, mes)[1]
+                cuotas.append((
+                    f"Mensualidad {nombre_mes} {anio}",
+                    monto_mensualidad,
+                    date(anio, mes, min(dia_venc, ultimo_dia_mes)),
+                ))
+        return cuotas
 
-    @transaction.atomic
     def handle(self, *args, **options):
         anio = options["anio"]
-        monto_matricula = options["matricula"]
-        monto_mensualidad = options["mensualidad"]
-        dia_venc = options["dia_venc"]
+        cursos = options["curso"]
+        batch_size = max(1, options["batch_size"])
+        dry_run = options["dry_run"]
 
-        # Meses de clases en Chile (marzo a diciembre)
-        meses_mensualidad = list(range(3, 13))  # 3..12
+        cuotas = self.cuotas(anio, options["matricula"], options["mensualidad"], options["dia_venc"])
 
         self.stdout.write(self.style.NOTICE(
             f"Generando pagos para el año {anio} "
-            f"(matrícula={monto_matricula}, mensualidad={monto_mensualidad})"
+            f"(matrícula={options['matricula']}, mensualidad={options['mensualidad']})"
+            + (f" | cursos: {', '.join(cursos)}" if cursos else "")
+            + (" [DRY-RUN]" if dry_run else "")
         ))
 
-        # Buscar alumnos activos del año
-        enrollments = (
-            Enrollment.objects
-            .select_related("student", "class_group")
+        if not cuotas:
+            self.stdout.write(self.style.WARNING("⚠️ No hay montos > 0: no se genera ninguna cuota."))
+            return
+
+        # Buscar alumnos activos del año (un alumno con dos matrículas cuenta una vez)
+        enrollments = Enrollment.objects.filter(active_status="active", class_group__year=anio)
+        if cursos:
+            enrollments = enrollments.filter(class_group__grade__curso_id__in=cursos)
+        alumnos = list(enrollments.order_by("student_id").values_list("student_id", flat=True).distinct())
+        self.stdout.write(f"Alumnos activos encontrados: {len(alumnos)}")
+
+        # Todas las cuotas existentes en UNA query; la diferencia se calcula en memoria
+        existentes = set(
+            Payment.objects
             .filter(
-                active_status="active",
-                class_group__year=anio
+                student_id__in=enrollments.values("student_id"),
+                concept__in=[c for c, _, _ in cuotas],
             )
+            .values_list("student_id", "concept", "due_date")
         )
 
-        total_alumnos = enrollments.count()
-        self.stdout.write(f"Alumnos activos encontrados: {total_alumnos}")
-
+        nuevos = [
+            Payment(
+                student_id=student_id,
+                amount=monto,
+                concept=concepto,
+                due_date=vencimiento,
+                status="pending",
+            )
+            for student_id in alumnos
+            for concepto, monto, vencimiento in cuotas
+            if (student_id, concepto, vencimiento) not in existentes
+        ]
+        saltados = len(alumnos) * len(cuotas) - len(nuevos)
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"[DRY-RUN] Pagos a crear: {len(nuevos)} | Pagos saltados (ya existían): {saltados}"
+            ))
+            return
+
+        # Una transacción corta por lote: no se mantienen locks durante todo el proceso
         creados = 0
-        saltados = 0
-
-        for enr in enrollments:
-            alumno = enr.student  # User con role student
-
-            # -----------------------------
-            # 1) Matrícula
-            # -----------------------------
-            if monto_matricula > 0:
-                concepto_mat = f"Matrícula {anio}"
-                due_mat = date(anio, 3, min(dia_venc, 28))  # ej: 5 de marzo
-
-                existe_mat = Payment.objects.filter(
-                    student=alumno,
-                    concept=concepto_mat,
-                    due_date=due_mat
-                ).exists()
-
-                if existe_mat:
-                    saltados += 1
-                else:
-                    Payment.objects.create(
-                        student=alumno,
-                        amount=monto_matricula,
-                        concept=concepto_mat,
-                        due_date=due_mat,
-                        status="pending",
-                    )
-                    creados += 1
-
-            # -----------------------------
-            # 2) Mensualidades marzo–diciembre
-            # -----------------------------
-            if monto_mensualidad > 0:
-                for mes in meses_mensualidad:
-                    nombre_mes = calendar.month_name[mes].capitalize()
-                    concepto_mens = f"Mensualidad {nombre_mes} {anio}"
-
-                    # Evitar días inválidos (ej: 31 de febrero)
-                    ultimo_dia_mes = calendar.monthrange(anio, mes)[1]
-                    dia_real = min(dia_venc, ultimo_dia_mes)
-                    due_mens = date(anio, mes, dia_real)
-
-                    existe_mens = Payment.objects.filter(
-                        student=alumno,
-                        concept=concepto_mens,
-                        due_date=due_mens,
-                    ).exists()
-
-                    if existe_mens:
-                        saltados += 1
-                    else:
-                        Payment.objects.create(
-                            student=alumno,
-                            amount=monto_mensualidad,
-                            concept=concepto_mens,
-                            due_date=due_mens,
-                            status="pending",
-                        )
-                        creados += 1
+        for i in range(0, len(nuevos), batch_size):
+            lote = nuevos[i:i + batch_size]
+            with transaction.atomic():
+                Payment.objects.bulk_create(lote)
+            creados += len(lote)
+            self.stdout.write(f"   … {creados}/{len(nuevos)} pagos creados")
+
+        if creados:
+            invalidar_dashboard_stats()
 
         self.stdout.write(self.style.SUCCESS(
             f"Pagos creados: {creados} | Pagos saltados (ya existían): {saltados}"
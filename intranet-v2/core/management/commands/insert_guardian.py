@@ -1,5 +1,11 @@
-import csv
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from adminView.stats import invalidar_dashboard_stats
+from core.importacion import (
+    Importacion, agregar_argumentos, agregar_argumentos_plan,
+    cargar_plan, diferencias, guardar_plan, verificar_plan,
+)
 from core.models import User, GuardianRelation, Comuna, GuardianProfile
 
 
@@ -12,160 +18,298 @@ def normalize_rut(rut: str) -> str:
     return (rut or "").strip()
 
 
+# Datos de contacto que la carga puede actualizar (comuna va por nombre)
+CAMPOS = ['first_name', 'last_name', 'email', 'phone', 'comuna', 'active_status']
+
+
+def valores_actuales(user, comunas_por_id):
+    """Valores de CAMPOS de un usuario existente, tal como quedan en el plan."""
+    valores = {c: getattr(user, c) for c in CAMPOS if c != 'comuna'}
+    valores['comuna'] = comunas_por_id.get(user.comuna_id)
+    return valores
+
+
 class Command(BaseCommand):
-    help = 'Importa apoderados desde un archivo CSV y los asocia con sus alumnos.'
+    help = 'Importa apoderados desde un archivo CSV o XLSX y los asocia con sus alumnos.'
 
     def add_arguments(self, parser):
         parser.add_argument(
             'csv_file',
             type=str,
-            help='Ruta completa del archivo CSV, ejemplo: C:/Users/Softer/Documents/guardians.csv'
+            nargs='?',
+            default='',
+            help='Ruta completa del archivo CSV o XLSX, ejemplo: C:/Users/Softer/Documents/guardians.csv'
         )
+        # --chunk-size, --resume, --errores
+        agregar_argumentos(parser)
+        # --plan, --apply
+        agregar_argumentos_plan(parser)
 
     def handle(self, *args, **kwargs):
-        csv_file = kwargs['csv_file']
-        count = 0
-        relations = 0
+        self.count = 0
+        self.relations = 0
 
         # ==========================
-        #  Abrir CSV con 2 intentos
+        #  --apply: ejecuta un plan ya revisado, sin releer el archivo
         # ==========================
+        if kwargs['apply']:
+            plan = cargar_plan(kwargs['apply'], 'insert_guardian')
+            try:
+                with transaction.atomic():
+                    self.aplicar(plan)
+            finally:
+                invalidar_dashboard_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Plan aplicado. {len(plan["crear"])} apoderados creados, '
+                f'{len(plan["actualizar"])} actualizados, {self.relations} relaciones creadas.'
+            ))
+            return
+
+        if not kwargs['csv_file']:
+            raise CommandError('Indica el archivo a importar (o --apply <plan.json>).')
+
+        self.imp = Importacion(
+            kwargs['csv_file'],
+            chunk_size=kwargs['chunk_size'],
+            resume=kwargs['resume'],
+            errores_path=kwargs['errores'],
+            stdout=self.stdout,
+        )
+
+        # ==========================
+        #  --plan: diff en memoria contra la BD, sin escribir nada
+        # ==========================
+        if kwargs['plan'] is not None:
+            plan_path = kwargs['plan'] or f"{kwargs['csv_file']}.plan.json"
+            plan = self.planificar(list(self.imp.filas()))
+            guardar_plan(plan_path, 'insert_guardian', plan, origen=self.imp._firma())
+            self.stdout.write(self.style.SUCCESS(
+                f'📝 Plan guardado en {plan_path}. Crear={len(plan["crear"])} | '
+                f'Actualizar={len(plan["actualizar"])} | PIN={len(plan["pins"])} | '
+                f'Asociar={len(plan["asociar"])} | Omitidas={len(plan["omitidas"])}'
+            ))
+            self.stdout.write(f'   Revísalo y ejecútalo con --apply {plan_path}')
+            return
+
         try:
-            with open(csv_file, newline='', encoding='utf-8') as f:
-                sample = f.read(2048)
-                delimiter = ';' if ';' in sample else ','
-                f.seek(0)
-                reader = csv.DictReader(f, delimiter=delimiter)
-                raw_rows = list(reader)
-        except UnicodeDecodeError:
-            self.stdout.write(self.style.WARNING("⚠️ Archivo no está en UTF-8, intentando con ISO-8859-1..."))
-            with open(csv_file, newline='', encoding='ISO-8859-1') as f:
-                sample = f.read(2048)
-                delimiter = ';' if ';' in sample else ','
-                f.seek(0)
-                reader = csv.DictReader(f, delimiter=delimiter)
-                raw_rows = list(reader)
-
-        # Normalizar encabezados y filas (llaves en minúscula)
-        fieldnames = [h.strip().lower() for h in (reader.fieldnames or [])]
-        self.stdout.write(self.style.WARNING(f"Encabezados detectados: {fieldnames}"))
-
-        rows = []
-        for r in raw_rows:
-            norm = {}
-            for k, v in (r or {}).items():
-                key = (k or "").strip().lower()
-                val = (v or "").strip()
-                norm[key] = val
-            rows.append(norm)
-
-        for row in rows:
-            # ==========================
-            #  Datos básicos
-            # ==========================
-            rut = normalize_rut(row.get('rut', ''))
-            if not rut:
-                continue
+            self.imp.ejecutar(self.procesar_bloque)
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(
+                f"❌ Carga interrumpida ({e}). {self.imp.resumen()}. "
+                "Corrige el problema y vuelve a ejecutar con --resume."
+            )
+        finally:
+            # bulk_create/bulk_update no disparan señales
+            invalidar_dashboard_stats()
 
-            first_name = row.get('first_name', '').strip()
-            last_name = row.get('last_name', '').strip()
-            email = row.get('email', '').strip() or None
-            phone = row.get('phone', '').strip() or None
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Carga completa. {self.count} apoderados procesados, {self.relations} relaciones creadas.'
+        ))
+        self.stdout.write(self.imp.resumen())
 
-            # comuna es texto para buscar/crear Comuna
-            comuna_name = row.get('comuna', '').strip()
-            comuna_obj = None
-            if comuna_name:
-                comuna_obj, _ = Comuna.objects.get_or_create(
-                    nombre=comuna_name.upper()
-                )
+    def procesar_bloque(self, bloque):
+        """Importa un bloque de filas (ya dentro de su transacción)."""
+        plan = self.planificar(bloque)
+        for o in plan['omitidas']:
+            self.imp.rechazar(o['fila'], o['datos'], o['motivo'])
+        self.aplicar(plan)
 
-            student_rut = normalize_rut(row.get('student_rut', '').strip())
+    def planificar(self, bloque):
+        """
+        Compara las filas con la BD (pocas queries en bloque) y devuelve el
+        plan: comunas nuevas, apoderados a crear/actualizar, PIN, relaciones
+        y filas omitidas. No escribe nada.
+        """
+        # ==========================
+        #  Parseo
+        # ==========================
+        registros = []
+        omitidas = []
+        for n, row in bloque:
+            rut = normalize_rut(row.get('rut', ''))
+            if not rut:
+                omitidas.append({'fila': n, 'motivo': 'Fila sin RUT', 'datos': row})
+                continue
 
-            # PIN 
+            # PIN
             payment_pin = row.get('payment_pin') or row.get('pin') or ''
-            payment_pin = payment_pin.strip() or None
 
-            # ==========================
-            #  Crear / obtener apoderado
-            # ==========================
-            guardian, created = User.objects.get_or_create(
-                rut=rut,
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'email': email,
-                    'phone': phone,
-                    'comuna': comuna_obj,     #  FK a Comuna
-                    'role': User.GUARDIAN,    # SOLO para nuevos usuarios
+            registros.append({
+                'rut': rut,
+                'valores': {
+                    'first_name': row.get('first_name', '').strip(),
+                    'last_name': row.get('last_name', '').strip(),
+                    'email': row.get('email', '').strip() or None,
+                    'phone': row.get('phone', '').strip() or None,
+                    # comuna es texto para buscar/crear Comuna
+                    'comuna': row.get('comuna', '').strip().upper() or None,
                     'active_status': 'active',
-                }
-            )
+                },
+                'student_rut': normalize_rut(row.get('student_rut', '').strip()),
+                'payment_pin': payment_pin.strip() or None,
+            })
+
+        # ==========================
+        #  Foto de la BD: usuarios, comunas, PIN y relaciones (una query cada una)
+        # ==========================
+        ruts = {r['rut'] for r in registros} | {r['student_rut'] for r in registros if r['student_rut']}
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+        comunas_por_id = dict(Comuna.objects.values_list('id', 'nombre'))
+        ids = [u.pk for u in usuarios.values()]
+        pins_actuales = dict(
+            GuardianProfile.objects.filter(user_id__in=ids).values_list('user_id', 'payment_pin')
+        )
+        relaciones = set(
+            GuardianRelation.objects
+            .filter(guardian_id__in=ids, student_id__in=ids)
+            .values_list('guardian_id', 'student_id')
+        )
+
+        # ==========================
+        #  Diff en memoria
+        # ==========================
+        crear, actualizar, pins, asociar = {}, {}, {}, {}
+        for r in registros:
+            rut, valores = r['rut'], r['valores']
+            guardian = usuarios.get(rut)
 
-            if created:
-                self.stdout.write(f'🟢 Creado apoderado: {first_name} {last_name} (rol={guardian.role})')
+            if rut in crear:
+                crear[rut]['valores'].update({k: v for k, v in valores.items() if v is not None})
+            elif guardian is None:
+                crear[rut] = {'rut': rut, 'valores': dict(valores)}
             else:
                 #  Si ya existe (puede ser GUARDIAN, ADMIN, FINANCE_ADMIN, etc.)
                 # NO tocamos el rol, solo datos de contacto.
-                changed = False
-                update_fields = {}
-
-                campos_actualizables = {
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'email': email,
-                    'phone': phone,
-                    'comuna': comuna_obj,
-                    'active_status': 'active',
-                }
-
-                for field, value in campos_actualizables.items():
-                    if getattr(guardian, field) != value and value is not None:
-                        setattr(guardian, field, value)
-                        update_fields[field] = value
-                        changed = True
-
-                if changed:
-                    guardian.save(update_fields=list(update_fields.keys()))
-                    self.stdout.write(
-                        f'🟡 Actualizado apoderado: {guardian.first_name} {guardian.last_name} (rol={guardian.role})'
-                    )
-                else:
-                    self.stdout.write(
-                        f'ℹ️ Sin cambios en apoderado: {guardian.first_name} {guardian.last_name} (rol={guardian.role})'
-                    )
+                actuales = valores_actuales(guardian, comunas_por_id)
+                if rut in actualizar:
+                    actuales.update({c: v[1] for c, v in actualizar[rut]['cambios'].items()})
+                cambios = diferencias(actuales, valores, ignorar_nulos=True)
+                if cambios:
+                    previo = actualizar.setdefault(rut, {'rut': rut, 'id': guardian.pk, 'cambios': {}})
+                    for campo, (antes, despues) in cambios.items():
+                        previo['cambios'].setdefault(campo, [antes, despues])[1] = despues
 
             # ==========================
-            #  GuardianProfile (PIN)
+            #  GuardianProfile (PIN): la última fila gana
             # ==========================
-            # Ahora GuardianProfile permite GUARDIAN / ADMIN / FINANCE_ADMIN
-            if payment_pin is not None:
-                GuardianProfile.objects.update_or_create(
-                    user=guardian,
-                    defaults={"payment_pin": payment_pin},
-                )
+            pin = r['payment_pin']
+            if pin is not None:
+                if guardian is None or guardian.pk not in pins_actuales or pins_actuales[guardian.pk] != pin:
+                    pins[rut] = pin
+                else:
+                    pins.pop(rut, None)
 
             # ==========================
             #  Asociar con el estudiante
             # ==========================
+            student_rut = r['student_rut']
             if student_rut:
-                try:
-                    student = User.objects.get(rut=student_rut, role=User.STUDENT)
-                    GuardianRelation.objects.get_or_create(
-                        guardian=guardian,
-                        student=student
-                    )
-                    self.stdout.write(
-                        f'   ↳ Asociado con estudiante: {student.first_name} {student.last_name}'
-                    )
-                    relations += 1
-                except User.DoesNotExist:
+                student = usuarios.get(student_rut)
+                if student is not None and student.role == User.STUDENT:
+                    if guardian is None or (guardian.pk, student.pk) not in relaciones:
+                        asociar[(rut, student_rut)] = {'apoderado': rut, 'alumno': student_rut}
+                else:
                     self.stdout.write(
                         self.style.WARNING(f'⚠️ No se encontró estudiante con RUT {student_rut}')
                     )
 
-            count += 1
+            self.count += 1
 
-        self.stdout.write(self.style.SUCCESS(
-            f'✅ Carga completa. {count} apoderados procesados, {relations} relaciones creadas.'
-        ))
+        # Filas repetidas pueden dejar un campo igual a como estaba
+        for e in actualizar.values():
+            e['cambios'] = {c: v for c, v in e['cambios'].items() if v[0] != v[1]}
+
+        nombres = {r['valores']['comuna'] for r in registros if r['valores']['comuna']}
+        return {
+            'comunas': sorted(nombres - set(comunas_por_id.values())),
+            'crear': list(crear.values()),
+            'actualizar': [e for e in actualizar.values() if e['cambios']],
+            'pins': [{'rut': rut, 'pin': pin} for rut, pin in pins.items()],
+            'asociar': list(asociar.values()),
+            'omitidas': omitidas,
+        }
+
+    def aplicar(self, plan):
+        """Ejecuta un plan con operaciones en bloque (dentro de una transacción)."""
+        Comuna.objects.bulk_create(
+            [Comuna(nombre=n) for n in plan['comunas']], ignore_conflicts=True,
+        )
+        comunas_por_id = dict(Comuna.objects.values_list('id', 'nombre'))
+        comunas = {nombre: cid for cid, nombre in comunas_por_id.items()}
+
+        # ==========================
+        #  El plan sigue vigente
+        # ==========================
+        ruts = (
+            {e['rut'] for e in plan['crear'] + plan['actualizar'] + plan['pins']}
+            | {e['apoderado'] for e in plan['asociar']}
+            | {e['alumno'] for e in plan['asociar']}
+        )
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+        conflictos = [e['rut'] for e in plan['crear'] if e['rut'] in usuarios]
+        for e in plan['actualizar']:
+            user = usuarios.get(e['rut'])
+            actuales = valores_actuales(user, comunas_por_id) if user else {}
+            if not user or any(actuales[c] != antes for c, (antes, _) in e['cambios'].items()):
+                conflictos.append(e['rut'])
+        conflictos += [e['alumno'] for e in plan['asociar'] if e['alumno'] not in usuarios]
+        verificar_plan(conflictos)
+
+        # ==========================
+        #  Escritura en bloque (conflictos resueltos por las restricciones únicas)
+        # ==========================
+        nuevos = []
+        for e in plan['crear']:
+            valores = dict(e['valores'])
+            comuna_id = comunas.get(valores.pop('comuna'))
+            guardian = User(
+                rut=e['rut'],
+                comuna_id=comuna_id,      #  FK a Comuna
+                role=User.GUARDIAN,       # SOLO para nuevos usuarios
+                **valores,
+            )
+            usuarios[e['rut']] = guardian
+            nuevos.append(guardian)
+            self.stdout.write(f'🟢 Creado apoderado: {guardian.first_name} {guardian.last_name} (rol={guardian.role})')
+        User.objects.bulk_create(nuevos)
+
+        cambiados = []
+        campos = set()
+        for e in plan['actualizar']:
+            guardian = usuarios[e['rut']]
+            for campo, (_, despues) in e['cambios'].items():
+                if campo == 'comuna':
+                    guardian.comuna_id = comunas.get(despues)
+                    campos.add('comuna_id')
+                else:
+                    setattr(guardian, campo, despues)
+                    campos.add(campo)
+            cambiados.append(guardian)
+            self.stdout.write(
+                f'🟡 Actualizado apoderado: {guardian.first_name} {guardian.last_name} (rol={guardian.role})'
+            )
+        if cambiados:
+            User.objects.bulk_update(cambiados, sorted(campos))
+
+        # PIN del plan + perfil vacío para los apoderados nuevos sin PIN
+        pins = {e['rut']: e['pin'] for e in plan['pins']}
+        pins.update({e['rut']: None for e in plan['crear'] if e['rut'] not in pins})
+        GuardianProfile.objects.bulk_create(
+            [GuardianProfile(user=usuarios[rut], payment_pin=pin) for rut, pin in pins.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['payment_pin'],
+        )
+        GuardianRelation.objects.bulk_create(
+            [
+                GuardianRelation(guardian=usuarios[e['apoderado']], student=usuarios[e['alumno']])
+                for e in plan['asociar']
+            ],
+            ignore_conflicts=True,
+        )
+        for e in plan['asociar']:
+            student = usuarios[e['alumno']]
+            self.stdout.write(f'   ↳ {e["apoderado"]} asociado con estudiante: {student.first_name} {student.last_name}')
+        self.relations += len(plan['asociar'])
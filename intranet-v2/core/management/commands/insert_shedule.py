@@ -1,7 +1,7 @@
-import csv
 from datetime import datetime
-from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+from core.horarios import invalidar_todos_los_horarios
+from core.importacion import Importacion, agregar_argumentos
 from core.models import Class, Subject, SubjectSchedule, User
 
 
@@ -41,178 +41,221 @@ def to_compact_rut(rut: str) -> str:
 
 
 class Command(BaseCommand):
-    help = "Importa horarios (Subject + SubjectSchedule) desde un CSV."
+    help = "Importa horarios (Subject + SubjectSchedule) desde un CSV o XLSX."
 
     def add_arguments(self, parser):
         parser.add_argument(
             "csv_file",
             type=str,
-            help="Ruta completa del CSV de horarios",
+            help="Ruta completa del CSV o XLSX de horarios",
         )
+        parser.add_argument(
+            "--verbose",
+            action="store_true",
+            help="Muestra el detalle fila por fila (por defecto solo el resumen)",
+        )
+        # --chunk-size, --resume, --errores
+        agregar_argumentos(parser, chunk_size=2000)
+
+    def log(self, msg):
+        if self.verbose:
+            self.stdout.write(msg)
 
     def handle(self, *args, **options):
-        csv_path = options["csv_file"]
+        self.verbose = options["verbose"]
 
-        created_subjects = 0
-        created_schedules = 0
-        skipped = 0
-        errors = 0
+        self.created_subjects = 0
+        self.created_schedules = 0
+        self.updated_subjects = 0
+        self.skipped = 0
+        self.errors = 0
 
         # ==========================
-        #  Abrir CSV (UTF-8 / ISO)
+        #  Cachés para toda la carga: clases y profesores (una query cada una)
         # ==========================
+        self.clases = {
+            (grade_id, year): class_id
+            for class_id, grade_id, year in Class.objects.values_list("id", "grade_id", "year")
+        }
+        self.profesores = dict(User.objects.filter(role=User.TEACHER).values_list("rut", "id"))
+
+        self.imp = Importacion(
+            options["csv_file"],
+            chunk_size=options["chunk_size"],
+            resume=options["resume"],
+            errores_path=options["errores"],
+            stdout=self.stdout,
+        )
         try:
+            self.imp.ejecutar(self.procesar_bloque)
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(
+                f"❌ Carga interrumpida ({e}). {self.imp.resumen()}. "
+                "Corrige el problema y vuelve a ejecutar con --resume."
+            )
+        finally:
+            # bulk_create/bulk_update no disparan señales: se invalidan los Excel cacheados
+            invalidar_todos_los_horarios()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Carga completa. Subjects creados: {self.created_subjects} | "
+            f"Horarios creados: {self.created_schedules} | "
+            f"Subjects actualizados: {self.updated_subjects} | "
+            f"Filas saltadas: {self.skipped} | Errores: {self.errors}"
+        ))
+        self.stdout.write(self.imp.resumen())
+
+    def saltar(self, idx, row, motivo):
+        self.skipped += 1
+        self.log(self.style.WARNING(f"⚠️ Fila {idx}: {motivo}, saltada."))
+        self.imp.rechazar(idx, row, motivo)
+
+    def procesar_bloque(self, bloque):
+        """Procesa un bloque de filas (ya dentro de su transacción)."""
+        resueltas = []
+        subject_teacher = {}  # (class_id, nombre) -> teacher_id (el último no nulo gana)
+
+        for idx, row in bloque:
             try:
-                f = open(csv_path, newline="", encoding="utf-8-sig", errors="ignore")
-            except UnicodeDecodeError:
-                f = open(csv_path, newline="", encoding="ISO-8859-1", errors="ignore")
-
-            with f:
-                sample = f.read(4096)
-                f.seek(0)
-                # detectar delimitador
+                curso_id = row.get("curso_id") or row.get("curso") or ""
+                year_str = row.get("year") or ""
+                subject_name = row.get("subject_name") or row.get("asignatura") or ""
+                teacher_rut_raw = row.get("teacher_rut") or ""
+                day_name = row.get("day_of_week") or row.get("dia") or ""
+                start_time_str = row.get("start_time") or ""
+                end_time_str = row.get("end_time") or ""
+
+                if not curso_id or not year_str or not subject_name or not day_name:
+                    self.saltar(idx, row, "datos básicos incompletos")
+                    continue
+
+                try:
+                    year = int(year_str)
+                except ValueError:
+                    self.saltar(idx, row, f"year inválido '{year_str}'")
+                    continue
+
+                # ==========================
+                #  Buscar Class (curso + año)
+                # ==========================
+                class_id = self.clases.get((str(curso_id), year))
+                if class_id is None:
+                    self.saltar(idx, row, f"no se encontró Class para curso_id={curso_id}, year={year}")
+                    continue
+
+                # ==========================
+                #  Mapear día de la semana
+                # ==========================
+                day_key = day_name.strip().lower()
+                if day_key not in DAY_MAP:
+                    self.saltar(idx, row, f"día '{day_name}' no reconocido")
+                    continue
+
+                # ==========================
+                #  Parsear horas
+                # ==========================
                 try:
-                    dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
-                    reader = csv.DictReader(f, dialect=dialect)
-                except csv.Error:
-                    reader = csv.DictReader(f, delimiter=";")
-
-                # normalizar encabezados
-                fieldnames = [h.strip().lower() for h in (reader.fieldnames or [])]
-                self.stdout.write(self.style.WARNING(f"Encabezados: {fieldnames}"))
-
-                for idx, row in enumerate(reader, start=2):  # fila 2 = primera con datos
-                    try:
-                        # normalizar claves y valores
-                        row = {
-                            (k or "").strip().lower(): (v or "").strip()
-                            for k, v in (row or {}).items()
-                        }
-
-                        curso_id = row.get("curso_id") or row.get("curso") or ""
-                        year_str = row.get("year") or ""
-                        subject_name = row.get("subject_name") or row.get("asignatura") or ""
-                        teacher_rut_raw = row.get("teacher_rut") or ""
-                        day_name = row.get("day_of_week") or row.get("dia") or ""
-                        start_time_str = row.get("start_time") or ""
-                        end_time_str = row.get("end_time") or ""
-
-                        if not curso_id or not year_str or not subject_name or not day_name:
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Fila {idx}: datos básicos incompletos, saltada."
-                            ))
-                            continue
-
-                        try:
-                            year = int(year_str)
-                        except ValueError:
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Fila {idx}: year inválido '{year_str}', saltada."
-                            ))
-                            continue
-
-                        # ==========================
-                        #  Buscar Class (curso + año)
-                        # ==========================
-                        try:
-                            class_group = Class.objects.get(
-                                grade__curso_id=str(curso_id),
-                                year=year,
-                            )
-                        except Class.DoesNotExist:
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Fila {idx}: no se encontró Class para curso_id={curso_id}, year={year}."
-                            ))
-                            continue
-
-                        # ==========================
-                        #  Mapear día de la semana
-                        # ==========================
-                        day_key = day_name.strip().lower()
-                        if day_key not in DAY_MAP:
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Fila {idx}: día '{day_name}' no reconocido, saltada."
-                            ))
-                            continue
-                        day_of_week = DAY_MAP[day_key]
-
-                        # ==========================
-                        #  Parsear horas
-                        # ==========================
-                        try:
-                            start_time = parse_time(start_time_str)
-                            end_time = parse_time(end_time_str)
-                        except ValueError as e_time:
-                            skipped += 1
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Fila {idx}: {e_time}, saltada."
-                            ))
-                            continue
-
-                        # ==========================
-                        #  Buscar profesor (opcional)
-                        # ==========================
-                        teacher = None
-                        if teacher_rut_raw and teacher_rut_raw.lower() not in ("no asignado", "null", "none", "n/a"):
-                            rut_excel = clean_rut_excel(teacher_rut_raw)
-                            rut_compact = to_compact_rut(teacher_rut_raw)
-                            teacher = User.objects.filter(
-                                role=User.TEACHER
-                            ).filter(
-                                Q(rut=rut_excel) | Q(rut=rut_compact)
-                            ).first()
-                            if not teacher:
-                                self.stdout.write(self.style.WARNING(
-                                    f"⚠️ Fila {idx}: profesor con RUT '{teacher_rut_raw}' no encontrado, se deja sin profesor."
-                                ))
-
-                        # ==========================
-                        #  Subject (por curso + nombre)
-                        # ==========================
-                        subject, created = Subject.objects.get_or_create(
-                            name=subject_name,
-                            class_group=class_group,
-                            defaults={"teacher": teacher},
-                        )
-
-                        # si ya existía pero no tenía teacher y ahora sí, lo actualizamos
-                        if not created and teacher is not None and subject.teacher != teacher:
-                            subject.teacher = teacher
-                            subject.save(update_fields=["teacher"])
-
-                        if created:
-                            created_subjects += 1
-
-                        # ==========================
-                        #  SubjectSchedule
-                        # ==========================
-                        sched, sched_created = SubjectSchedule.objects.get_or_create(
-                            subject=subject,
-                            day_of_week=day_of_week,
-                            start_time=start_time,
-                            end_time=end_time,
-                        )
-                        if sched_created:
-                            created_schedules += 1
-                            self.stdout.write(
-                                f"🟢 Fila {idx}: horario creado → {subject} {day_name} {start_time_str}-{end_time_str}"
-                            )
-
-                    except Exception as e_row:
-                        errors += 1
-                        self.stdout.write(self.style.ERROR(
-                            f"❌ Error en fila {idx}: {e_row}"
+                    start_time = parse_time(start_time_str)
+                    end_time = parse_time(end_time_str)
+                except ValueError as e_time:
+                    self.saltar(idx, row, str(e_time))
+                    continue
+
+                # Las validaciones de la BD se revisan antes: un error
+                # dentro de bulk_create haría fallar todo el bloque.
+                if start_time is None or end_time is None or end_time <= start_time:
+                    raise ValueError(f"horario inválido '{start_time_str}-{end_time_str}'")
+
+                # ==========================
+                #  Buscar profesor (opcional)
+                # ==========================
+                teacher_id = None
+                if teacher_rut_raw and teacher_rut_raw.lower() not in ("no asignado", "null", "none", "n/a"):
+                    teacher_id = (
+                        self.profesores.get(clean_rut_excel(teacher_rut_raw))
+                        or self.profesores.get(to_compact_rut(teacher_rut_raw))
+                    )
+                    if not teacher_id:
+                        self.log(self.style.WARNING(
+                            f"⚠️ Fila {idx}: profesor con RUT '{teacher_rut_raw}' no encontrado, se deja sin profesor."
                         ))
 
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"❌ Archivo no encontrado: {csv_path}"))
+                key = (class_id, subject_name)
+                if teacher_id is not None or key not in subject_teacher:
+                    subject_teacher[key] = teacher_id
+                resueltas.append((idx, key, DAY_MAP[day_key], start_time, end_time))
+
+            except Exception as e_row:
+                self.errors += 1
+                self.log(self.style.ERROR(f"❌ Error en fila {idx}: {e_row}"))
+                self.imp.rechazar(idx, row, str(e_row))
+
+        if not subject_teacher:
             return
 
-        self.stdout.write(self.style.SUCCESS(
-            f"✅ Carga completa. Subjects creados: {created_subjects} | Horarios creados: {created_schedules} | "
-            f"Filas saltadas: {skipped} | Errores: {errors}"
-        ))
+        # ==========================
+        #  Subjects (por curso + nombre)
+        # ==========================
+        existentes = {
+            (s.class_group_id, s.name): s
+            for s in Subject.objects.filter(class_group_id__in={k[0] for k in subject_teacher})
+            if (s.class_group_id, s.name) in subject_teacher
+        }
+
+        nuevos = [
+            Subject(class_group_id=class_id, name=name, teacher_id=subject_teacher[(class_id, name)])
+            for class_id, name in subject_teacher
+            if (class_id, name) not in existentes
+        ]
+        Subject.objects.bulk_create(nuevos, ignore_conflicts=True)
+        self.created_subjects += len(nuevos)
+
+        # si ya existía y ahora viene con profesor, lo actualizamos
+        cambiados = []
+        for key, subject in existentes.items():
+            teacher_id = subject_teacher[key]
+            if teacher_id is not None and subject.teacher_id != teacher_id:
+                subject.teacher_id = teacher_id
+                cambiados.append(subject)
+        Subject.objects.bulk_update(cambiados, ["teacher"])
+        self.updated_subjects += len(cambiados)
+
+        # ids de todos los subjects (ignore_conflicts no los devuelve)
+        subject_ids = {
+            (class_id, name): subject_id
+            for subject_id, class_id, name in Subject.objects
+            .filter(class_group_id__in={k[0] for k in subject_teacher})
+            .values_list("id", "class_group_id", "name")
+        }
+
+        # ==========================
+        #  SubjectSchedule
+        # ==========================
+        ya_existen = set(
+            SubjectSchedule.objects
+            .filter(subject_id__in=subject_ids.values())
+            .values_list("subject_id", "day_of_week", "start_time", "end_time")
+        )
+
+        horarios = []
+        for idx, key, day_of_week, start_time, end_time in resueltas:
+            clave = (subject_ids[key], day_of_week, start_time, end_time)
+            if clave in ya_existen:
+                continue
+            ya_existen.add(clave)
+            horarios.append(SubjectSchedule(
+                subject_id=clave[0],
+                day_of_week=day_of_week,
+                start_time=start_time,
+                end_time=end_time,
+            ))
+            self.log(
+                f"🟢 Fila {idx}: horario creado → {key[1]} ({key[0]}) "
+                f"{SubjectSchedule.DOW_CHOICES[day_of_week][1]} {start_time:%H:%M}-{end_time:%H:%M}"
+            )
+
+        # La restricción única cubre cargas concurrentes
+        SubjectSchedule.objects.bulk_create(horarios, ignore_conflicts=True)
+        self.created_schedules += len(horarios)
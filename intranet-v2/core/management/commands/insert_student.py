@@ -1,12 +1,15 @@
-import csv
 from datetime import datetime
-from pathlib import Path
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
-from core.models import Comuna  
+from adminView.stats import invalidar_dashboard_stats
+from core.importacion import (
+    Importacion, agregar_argumentos, agregar_argumentos_plan,
+    cargar_plan, diferencias, guardar_plan, valor_plan, verificar_plan,
+)
+from core.models import Comuna
 
 # Modelos que pueden vivir en 'core' o 'studentView'
 def import_models():
@@ -42,8 +45,22 @@ def parse_date_mx(s: str):
     return None
 
 
+# Campos del alumno que la carga crea/actualiza (comuna va por nombre)
+CAMPOS = [
+    "first_name", "last_name", "email", "birth_date", "comuna",
+    "ingreso_date", "phone", "active_status",
+]
+
+
+def valores_actuales(user, comunas_por_id):
+    """Valores de CAMPOS de un usuario existente, normalizados como en el plan."""
+    valores = {c: valor_plan(getattr(user, c)) for c in CAMPOS if c != "comuna"}
+    valores["comuna"] = comunas_por_id.get(user.comuna_id)
+    return valores
+
+
 class Command(BaseCommand):
-    help = 'Importa estudiantes desde un archivo CSV y los asocia a sus cursos.'
+    help = 'Importa estudiantes desde un archivo CSV o XLSX y los asocia a sus cursos.'
 
     def add_arguments(self, parser):
         # csv_file
@@ -51,7 +68,7 @@ class Command(BaseCommand):
             "csv_file",
             nargs="?",
             default=r"C:\Users\Carta\Downloads\excels_de_carga\Nueva carpeta\matriz de carga.csv",
-            help="Ruta del CSV. Si no se indica, usa la ruta por defecto."
+            help="Ruta del CSV o XLSX. Si no se indica, usa la ruta por defecto."
         )
         parser.add_argument(
             "--year",
@@ -59,169 +76,274 @@ class Command(BaseCommand):
             default=timezone.now().year,
             help="Año académico para la matrícula (default: año actual)."
         )
+        # --chunk-size, --resume, --errores
+        agregar_argumentos(parser)
+        # --plan, --apply
+        agregar_argumentos_plan(parser)
 
-    def _read_csv_rows(self, csv_file: str):
-        """Lee CSV intentando UTF-8 y luego ISO-8859-1, detecta delimitador y normaliza filas."""
-        rows = []
-        encodings = ["utf-8", "ISO-8859-1"]
-        last_exc = None
-
-        for enc in encodings:
-            try:
-                with open(csv_file, "r", encoding=enc, newline="") as f:
-                    sample = f.read(4096)
-                    f.seek(0)
-
-                    # Delimitador
-                    try:
-                        dialect = csv.Sniffer().sniff(sample, delimiters=";,")
-                        delimiter = dialect.delimiter
-                    except Exception:
-                        delimiter = ";" if ";" in sample else ","
-
-                    reader = csv.DictReader(f, delimiter=delimiter)
-                    # Normalizar cada fila: llaves y valores
-                    for r in reader:
-                        norm = {}
-                        for k, v in (r or {}).items():
-                            key = (k or "").strip().lower()
-                            val = (v or "").strip()
-                            norm[key] = val
-                        rows.append(norm)
-
-                    self.stdout.write(self.style.WARNING(
-                        f"Encoding={enc} Delimiter='{delimiter}' Encabezados={list(reader.fieldnames or [])}"
-                    ))
-                    return rows
-            except UnicodeDecodeError as e:
-                last_exc = e
-                continue
-            except FileNotFoundError:
-                raise CommandError(f"Archivo no encontrado: {csv_file}")
-
-        if last_exc:
-            raise CommandError(f"No se pudo leer el CSV con UTF-8 ni ISO-8859-1: {last_exc}")
-        return rows
-
-    @transaction.atomic
     def handle(self, *args, **kwargs):
         csv_file = kwargs["csv_file"]
-        year = kwargs["year"]
+        self.year = kwargs["year"]
+
+        self.created = 0
+        self.updated = 0
+        self.enrolled = 0
+        self.skipped = 0
+        self.errors = 0
+
+        # ==========================
+        #  --apply: ejecuta un plan ya revisado, sin releer el archivo
+        # ==========================
+        if kwargs["apply"]:
+            plan = cargar_plan(kwargs["apply"], "insert_student")
+            try:
+                with transaction.atomic():
+                    self.aplicar(plan)
+            finally:
+                invalidar_dashboard_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Plan aplicado. Creados={self.created} | Actualizados={self.updated} | "
+                f"Matriculados={self.enrolled} | Omitidos en el plan={len(plan['omitidas'])}"
+            ))
+            return
 
-        # Validación de existencia
-        if not Path(csv_file).exists():
-            raise CommandError(f"Archivo no encontrado: {csv_file}")
+        # Clases del año: son pocas, se cargan una sola vez
+        self.clases = {
+            c.grade_id: c
+            for c in Class.objects.select_related("grade").filter(year=self.year)
+        }
+
+        self.imp = Importacion(
+            csv_file,
+            chunk_size=kwargs["chunk_size"],
+            resume=kwargs["resume"],
+            errores_path=kwargs["errores"],
+            stdout=self.stdout,
+        )
 
-        rows = self._read_csv_rows(csv_file)
-        if not rows:
-            self.stdout.write(self.style.WARNING("⚠️ El CSV está vacío o no tiene filas."))
+        # ==========================
+        #  --plan: diff en memoria contra la BD, sin escribir nada
+        # ==========================
+        if kwargs["plan"] is not None:
+            plan_path = kwargs["plan"] or f"{csv_file}.plan.json"
+            plan = self.planificar(list(self.imp.filas()))
+            plan["year"] = self.year
+            guardar_plan(plan_path, "insert_student", plan, origen=self.imp._firma())
+            self.stdout.write(self.style.SUCCESS(
+                f"📝 Plan guardado en {plan_path}. Crear={len(plan['crear'])} | "
+                f"Actualizar={len(plan['actualizar'])} | Matricular={len(plan['matricular'])} | "
+                f"Omitidas={len(plan['omitidas'])}"
+            ))
+            self.stdout.write(f"   Revísalo y ejecútalo con --apply {plan_path}")
             return
 
-        created = 0
-        updated = 0
-        enrolled = 0
-        skipped = 0
-        errors = 0
+        try:
+            self.imp.ejecutar(self.procesar_bloque)
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(
+                f"❌ Carga interrumpida ({e}). {self.imp.resumen()}. "
+                "Corrige el problema y vuelve a ejecutar con --resume."
+            )
+        finally:
+            # bulk_create/bulk_update no disparan señales
+            invalidar_dashboard_stats()
+
+        if not self.imp.total and not self.imp.confirmadas:
+            self.stdout.write(self.style.WARNING("⚠️ El archivo está vacío o no tiene filas."))
+            return
 
-        for row in rows:
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Carga completa. Total filas={self.imp.total} | "
+            f"Creados={self.created} | Actualizados={self.updated} | "
+            f"Matriculados={self.enrolled} | Omitidos={self.skipped} | Errores={self.errors}"
+        ))
+        self.stdout.write(self.imp.resumen())
+
+    def procesar_bloque(self, bloque):
+        """Procesa un bloque de filas (ya dentro de su transacción)."""
+        plan = self.planificar(bloque)
+        for o in plan["omitidas"]:
+            self.imp.rechazar(o["fila"], o["datos"], o["motivo"])
+        self.aplicar(plan)
+
+    def planificar(self, bloque):
+        """
+        Compara las filas con la BD (pocas queries en bloque) y devuelve el
+        plan: comunas nuevas, alumnos a crear/actualizar, matrículas y filas
+        omitidas. No escribe nada.
+        """
+        year = self.year
+        omitidas = []
+
+        # -----------------------------
+        # Parseo de filas
+        # -----------------------------
+        registros = []
+        for n, row in bloque:
             try:
                 rut = normalize_rut(row.get("rut", ""))
                 if not rut:
                     self.stdout.write(self.style.WARNING("⚠️ Fila sin RUT. Saltando..."))
-                    skipped += 1
+                    self.skipped += 1
+                    omitidas.append({"fila": n, "motivo": "Fila sin RUT", "datos": row})
                     continue
 
-                first_name = row.get("first_name", "")
-                last_name = row.get("last_name", "")
-                email = row.get("email") or None
-
-                #  para alumnos → usamos siempre STUDENT en defaults
-                role_default = User.STUDENT
-
-                # comuna texto → objeto Comuna
-                comuna_name = (row.get("comuna") or "").strip()
-                comuna_obj = None
-                if comuna_name:
-                    comuna_obj, _ = Comuna.objects.get_or_create(
-                        nombre=comuna_name.upper()
-                    )
-
-                phone = row.get("phone") or None
-                active_status = (row.get("active_status") or "active").strip().lower()
-                curso_id = row.get("curso_id") or ""
-                birth_date = parse_date_mx(row.get("birth_date") or "")
-                ingreso_date = parse_date_mx(row.get("ingreso_date") or "")
-
-                # Crear / actualizar usuario por RUT
-                student, was_created = User.objects.get_or_create(
-                    rut=rut,
-                    defaults={
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "email": email,
-                        "role": role_default,   
-                        "birth_date": birth_date,
-                        "comuna": comuna_obj,
-                        "ingreso_date": ingreso_date,
-                        "phone": phone,
-                        "active_status": active_status,
+                registros.append({
+                    "rut": rut,
+                    "curso_id": row.get("curso_id") or "",
+                    "valores": {
+                        "first_name": row.get("first_name", ""),
+                        "last_name": row.get("last_name", ""),
+                        "email": row.get("email") or None,
+                        "birth_date": valor_plan(parse_date_mx(row.get("birth_date") or "")),
+                        "comuna": (row.get("comuna") or "").strip().upper() or None,
+                        "ingreso_date": valor_plan(parse_date_mx(row.get("ingreso_date") or "")),
+                        "phone": row.get("phone") or None,
+                        "active_status": (row.get("active_status") or "active").strip().lower(),
                     },
-                )
-
-                if was_created:
-                    created += 1
-                    self.stdout.write(f"🟢 Creado: {first_name} {last_name} ({rut}) (rol={student.role})")
-                else:
-                    # Update idempotente (SIN tocar el rol existente)
-                    changed = False
-                    campos_actualizables = {
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "email": email,
-                        "birth_date": birth_date,
-                        "comuna": comuna_obj,
-                        "ingreso_date": ingreso_date,
-                        "phone": phone,
-                        "active_status": active_status,
-                    }
-
-                    for field, value in campos_actualizables.items():
-                        if getattr(student, field) != value:
-                            setattr(student, field, value)
-                            changed = True
-
-                    if changed:
-                        student.save()
-                        updated += 1
-                        self.stdout.write(
-                            f"🟡 Actualizado: {first_name} {last_name} ({rut}) (rol={student.role})"
-                        )
-
-                # Matricular si hay curso_id
-                if curso_id:
-                    try:
-                        class_group = Class.objects.get(grade__curso_id=curso_id, year=year)
-                        _, enr_created = Enrollment.objects.get_or_create(
-                            student=student,
-                            class_group=class_group,
-                            defaults={"active_status": "active", "date": ingreso_date},
-                        )
-                        if enr_created:
-                            enrolled += 1
-                            self.stdout.write(f"   ↳ Matriculado en: {class_group}")
-                    except Class.DoesNotExist:
-                        self.stdout.write(self.style.WARNING(
-                            f"⚠️ Clase no encontrada para curso_id '{curso_id}' y año {year}"
-                        ))
-                else:
-                    self.stdout.write(self.style.WARNING("ℹ️ Sin curso_id; no se matricula."))
-
+                })
             except Exception as e:
-                errors += 1
+                self.errors += 1
                 self.stdout.write(self.style.ERROR(f"❌ Error en fila (rut={row.get('rut')}): {e}"))
+                omitidas.append({"fila": n, "motivo": str(e), "datos": row})
+
+        # -----------------------------
+        # Foto de la BD: comunas, usuarios y matrículas existentes
+        # -----------------------------
+        comunas_por_id = dict(Comuna.objects.values_list("id", "nombre"))
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in={r["rut"] for r in registros})}
+        matriculas = set(
+            Enrollment.objects
+            .filter(student__in=list(usuarios.values()), class_group__in=list(self.clases.values()))
+            .values_list("student_id", "class_group_id")
+        )
 
-        self.stdout.write(self.style.SUCCESS(
-            f"✅ Carga completa. Total filas={len(rows)} | "
-            f"Creados={created} | Actualizados={updated} | "
-            f"Matriculados={enrolled} | Omitidos={skipped} | Errores={errors}"
-        ))
+        # -----------------------------
+        # Diff en memoria
+        # -----------------------------
+        crear, actualizar, matricular = {}, {}, {}
+        for r in registros:
+            rut, valores = r["rut"], r["valores"]
+
+            if rut in crear:
+                # RUT repetido en el archivo: la última fila gana
+                crear[rut]["valores"].update(valores)
+            elif rut not in usuarios:
+                crear[rut] = {"rut": rut, "valores": dict(valores)}
+            else:
+                # Update idempotente (SIN tocar el rol existente)
+                actuales = valores_actuales(usuarios[rut], comunas_por_id)
+                if rut in actualizar:
+                    actuales.update({c: v[1] for c, v in actualizar[rut]["cambios"].items()})
+                cambios = diferencias(actuales, valores)
+                if cambios:
+                    previo = actualizar.setdefault(rut, {"rut": rut, "id": usuarios[rut].pk, "cambios": {}})
+                    for campo, (antes, despues) in cambios.items():
+                        previo["cambios"].setdefault(campo, [antes, despues])[1] = despues
+
+            # Matricular si hay curso_id
+            if r["curso_id"]:
+                class_group = self.clases.get(r["curso_id"])
+                if not class_group:
+                    self.stdout.write(self.style.WARNING(
+                        f"⚠️ Clase no encontrada para curso_id '{r['curso_id']}' y año {year}"
+                    ))
+                    continue
+                student = usuarios.get(rut)
+                if student is not None and (student.pk, class_group.pk) in matriculas:
+                    continue
+                matricular.setdefault((rut, class_group.pk), {
+                    "rut": rut,
+                    "class_id": class_group.pk,
+                    "curso": str(class_group),
+                    "date": valores["ingreso_date"],
+                })
+            else:
+                self.stdout.write(self.style.WARNING("ℹ️ Sin curso_id; no se matricula."))
+
+        # Filas repetidas pueden dejar un campo igual a como estaba
+        for e in actualizar.values():
+            e["cambios"] = {c: v for c, v in e["cambios"].items() if v[0] != v[1]}
+
+        nombres = {r["valores"]["comuna"] for r in registros if r["valores"]["comuna"]}
+        return {
+            "comunas": sorted(nombres - set(comunas_por_id.values())),
+            "crear": list(crear.values()),
+            "actualizar": [e for e in actualizar.values() if e["cambios"]],
+            "matricular": list(matricular.values()),
+            "omitidas": omitidas,
+        }
+
+    def aplicar(self, plan):
+        """Ejecuta un plan con operaciones en bloque (dentro de una transacción)."""
+        # -----------------------------
+        # Comunas nuevas
+        # -----------------------------
+        Comuna.objects.bulk_create(
+            [Comuna(nombre=n) for n in plan["comunas"]], ignore_conflicts=True,
+        )
+        comunas_por_id = dict(Comuna.objects.values_list("id", "nombre"))
+        comunas = {nombre: cid for cid, nombre in comunas_por_id.items()}
+
+        # -----------------------------
+        # El plan sigue vigente: nada de lo que crea existe y lo que
+        # actualiza conserva los valores 'antes'
+        # -----------------------------
+        ruts = {e["rut"] for e in plan["crear"] + plan["actualizar"] + plan["matricular"]}
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+        conflictos = [e["rut"] for e in plan["crear"] if e["rut"] in usuarios]
+        for e in plan["actualizar"]:
+            user = usuarios.get(e["rut"])
+            actuales = valores_actuales(user, comunas_por_id) if user else {}
+            if not user or any(actuales[c] != antes for c, (antes, _) in e["cambios"].items()):
+                conflictos.append(e["rut"])
+        verificar_plan(conflictos)
+
+        # -----------------------------
+        # Escritura
+        # -----------------------------
+        nuevos = []
+        for e in plan["crear"]:
+            valores = dict(e["valores"])
+            comuna_id = comunas.get(valores.pop("comuna"))
+            #  para alumnos → usamos siempre STUDENT
+            student = User(rut=e["rut"], role=User.STUDENT, comuna_id=comuna_id, **valores)
+            usuarios[e["rut"]] = student
+            nuevos.append(student)
+            self.stdout.write(f"🟢 Creado: {student.first_name} {student.last_name} ({e['rut']}) (rol={student.role})")
+        User.objects.bulk_create(nuevos)
+        self.created += len(nuevos)
+
+        cambiados = []
+        for e in plan["actualizar"]:
+            student = usuarios[e["rut"]]
+            for campo, (_, despues) in e["cambios"].items():
+                if campo == "comuna":
+                    student.comuna_id = comunas.get(despues)
+                else:
+                    setattr(student, campo, despues)
+            cambiados.append(student)
+            self.stdout.write(
+                f"🟡 Actualizado: {student.first_name} {student.last_name} ({e['rut']}) (rol={student.role})"
+            )
+        campos = [c if c != "comuna" else "comuna_id" for c in CAMPOS]
+        User.objects.bulk_update(cambiados, campos)
+        self.updated += len(cambiados)
+
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(
+                    student=usuarios[e["rut"]],
+                    class_group_id=e["class_id"],
+                    active_status="active",
+                    date=e["date"],
+                )
+                for e in plan["matricular"]
+            ],
+            ignore_conflicts=True,
+        )
+        for e in plan["matricular"]:
+            self.stdout.write(f"   ↳ Matriculado {e['rut']} en: {e['curso']}")
+        self.enrolled += len(plan["matricular"])
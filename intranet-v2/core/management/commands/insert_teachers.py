@@ -1,6 +1,11 @@
-import csv
-from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from adminView.stats import invalidar_dashboard_stats
+from core.importacion import (
+    Importacion, agregar_argumentos, agregar_argumentos_plan,
+    cargar_plan, diferencias, guardar_plan, verificar_plan,
+)
 from core.models import User, Comuna, TeacherProfile
 
 def clean_rut_excel(rut: str) -> str:
@@ -10,144 +15,254 @@ def to_compact_rut(rut: str) -> str:
     rut = (rut or "").strip()
     return rut.replace(".", "").replace(" ", "").replace("\t", "")
 
-def detectar_encoding(path):
-    """Detecta codificación sin chardet."""
-    for enc in ('utf-8-sig', 'utf-8', 'latin-1', 'cp1252'):
-        try:
-            with open(path, encoding=enc) as f:
-                f.read()
-            return enc
-        except UnicodeDecodeError:
-            continue
-    return 'utf-8'
+# Campos del usuario que la carga actualiza (comuna va por nombre)
+CAMPOS = ['first_name', 'last_name', 'email', 'phone', 'comuna', 'role', 'active_status']
+CAMPOS_PERFIL = ['department', 'title', 'position']
+
+
+def valores_actuales(user, comunas_por_id):
+    valores = {c: getattr(user, c) for c in CAMPOS if c != 'comuna'}
+    valores['comuna'] = comunas_por_id.get(user.comuna_id)
+    return valores
+
 
 class Command(BaseCommand):
-    help = "Crea/actualiza profesores desde matrizteacher.csv (tildes OK)"
+    help = "Crea/actualiza profesores desde matrizteacher.csv o .xlsx (tildes OK)"
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str, help='Ruta del archivo CSV')
+        parser.add_argument('csv_file', type=str, nargs='?', default='', help='Ruta del archivo CSV o XLSX')
+        # --chunk-size, --resume, --errores
+        agregar_argumentos(parser)
+        # --plan, --apply
+        agregar_argumentos_plan(parser)
 
     def handle(self, *args, **options):
-        csv_path = options['csv_file']
-        fila_num = 0
-        actualizados = 0
-        creados = 0
-        errores = 0
+        self.actualizados = 0
+        self.creados = 0
+        self.errores = 0
 
-        try:
-            # --- detectar encoding automáticamente ---
-            encoding = detectar_encoding(csv_path)
-            self.stdout.write(f"📌 Usando codificación detectada: {encoding}")
-
-            with open(csv_path, newline='', encoding=encoding) as f:
-                sample = f.read(2048)
-                f.seek(0)
-
-                # detectar delimitador
-                try:
-                    dialect = csv.Sniffer().sniff(sample, delimiters=[',', ';', '\t'])
-                    reader = csv.DictReader(f, dialect=dialect)
-                except csv.Error:
-                    reader = csv.DictReader(f, delimiter=';')
-
-                for row in reader:
-                    fila_num += 1
-                    try:
-                        row = {(k or '').strip().lower(): (v or '').strip()
-                               for k, v in (row or {}).items()}
-
-                        rut_raw = row.get('rut') or ''
-                        rut_excel = clean_rut_excel(rut_raw)
-                        rut_compact = to_compact_rut(rut_raw)
-
-                        if not rut_excel:
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️  Fila {fila_num}: sin RUT, saltada"
-                            ))
-                            continue
-
-                        first_name = row.get('first_name', '')
-                        last_name = row.get('last_name', '')
-
-                        email_raw = (row.get('email') or '').strip()
-                        email = email_raw.lower() if email_raw else None
-
-                        phone = (row.get('phone') or '').strip() or None
-
-                        comuna_name = (row.get('comuna') or '').strip()
-                        comuna_obj = None
-                        if comuna_name:
-                            comuna_obj, _ = Comuna.objects.get_or_create(
-                                nombre=comuna_name.upper()
-                            )
-
-                        department = (row.get('department') or row.get('departamento') or '').strip() or None
-                        title = (row.get('title') or row.get('titulo') or '').strip() or None
-                        position = (row.get('position') or row.get('cargo') or '').strip() or None
-
-                        # buscar existente
-                        user = User.objects.filter(
-                            Q(rut=rut_excel) | Q(rut=rut_compact)
-                        ).first()
-
-                        if not user:
-                            user = User.objects.create(
-                                rut=rut_excel,
-                                first_name=first_name,
-                                last_name=last_name,
-                                email=email,
-                                phone=phone,
-                                comuna=comuna_obj,
-                                role=User.TEACHER,
-                                active_status='active',
-                            )
-                            creados += 1
-                            self.stdout.write(self.style.SUCCESS(
-                                f"🟢 Creado profesor: {first_name} {last_name} ({rut_excel})"
-                            ))
-                        else:
-                            changed = False
-                            for field, value in {
-                                'first_name': first_name,
-                                'last_name': last_name,
-                                'email': email,
-                                'phone': phone,
-                                'comuna': comuna_obj,
-                                'role': User.TEACHER,
-                                'active_status': 'active',
-                            }.items():
-                                if value is not None and getattr(user, field) != value:
-                                    setattr(user, field, value)
-                                    changed = True
-
-                            if changed:
-                                user.save()
-                                actualizados += 1
-                                self.stdout.write(
-                                    f"🟡 Actualizado: {user.first_name} {user.last_name} ({user.rut})"
-                                )
-
-                        TeacherProfile.objects.update_or_create(
-                            user=user,
-                            defaults={
-                                "department": department,
-                                "title": title,
-                                "position": position,
-                            }
-                        )
-
-                    except Exception as e_row:
-                        errores += 1
-                        self.stdout.write(self.style.ERROR(
-                            f"❌ Error fila {fila_num} (rut='{row.get('rut','')}'): {e_row}"
-                        ))
-
-            self.stdout.write(self.style.SUCCESS('✅ Proceso finalizado'))
+        # --apply: ejecuta un plan ya revisado, sin releer el archivo
+        if options['apply']:
+            plan = cargar_plan(options['apply'], 'insert_teachers')
+            try:
+                with transaction.atomic():
+                    self.aplicar(plan)
+            finally:
+                invalidar_dashboard_stats()
+            self.stdout.write(self.style.SUCCESS('✅ Plan aplicado'))
+            self.stdout.write(self.style.SUCCESS(
+                f"📊 Creados: {self.creados} | Actualizados: {self.actualizados} | "
+                f"Omitidas en el plan: {len(plan['omitidas'])}"
+            ))
+            return
+
+        if not options['csv_file']:
+            raise CommandError('Indica el archivo a importar (o --apply <plan.json>).')
+
+        self.imp = Importacion(
+            options['csv_file'],
+            chunk_size=options['chunk_size'],
+            resume=options['resume'],
+            errores_path=options['errores'],
+            stdout=self.stdout,
+        )
+
+        # --plan: diff en memoria contra la BD, sin escribir nada
+        if options['plan'] is not None:
+            plan_path = options['plan'] or f"{options['csv_file']}.plan.json"
+            plan = self.planificar(list(self.imp.filas()))
+            guardar_plan(plan_path, 'insert_teachers', plan, origen=self.imp._firma())
             self.stdout.write(self.style.SUCCESS(
-                f"📊 Creados: {creados} | Actualizados: {actualizados} | Errores: {errores}"
+                f"📝 Plan guardado en {plan_path}. Crear: {len(plan['crear'])} | "
+                f"Actualizar: {len(plan['actualizar'])} | Perfiles: {len(plan['perfiles'])} | "
+                f"Omitidas: {len(plan['omitidas'])}"
             ))
+            self.stdout.write(f"   Revísalo y ejecútalo con --apply {plan_path}")
+            return
 
+        try:
+            self.imp.ejecutar(self.procesar_bloque)
+        except CommandError:
+            raise
         except Exception as e:
             import traceback
             self.stdout.write(self.style.ERROR(f"❌ Error inesperado: {e}"))
             self.stdout.write(self.style.WARNING(traceback.format_exc()))
+            raise CommandError(
+                f"Carga interrumpida. {self.imp.resumen()}. Vuelve a ejecutar con --resume."
+            )
+        finally:
+            # bulk_create/bulk_update no disparan señales
+            invalidar_dashboard_stats()
+
+        self.stdout.write(self.style.SUCCESS('✅ Proceso finalizado'))
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Creados: {self.creados} | Actualizados: {self.actualizados} | Errores: {self.errores}"
+        ))
+        self.stdout.write(self.imp.resumen())
+
+    def procesar_bloque(self, bloque):
+        """Procesa un bloque de filas (ya dentro de su transacción)."""
+        plan = self.planificar(bloque)
+        for o in plan['omitidas']:
+            self.imp.rechazar(o['fila'], o['datos'], o['motivo'])
+        self.aplicar(plan)
+
+    def planificar(self, bloque):
+        """
+        Compara las filas con la BD (pocas queries en bloque) y devuelve el
+        plan: comunas nuevas, profesores a crear/actualizar, perfiles y filas
+        omitidas. No escribe nada.
+        """
+        registros = []
+        omitidas = []
+        for fila_num, row in bloque:
+            try:
+                rut_raw = row.get('rut') or ''
+                rut_excel = clean_rut_excel(rut_raw)
+
+                if not rut_excel:
+                    self.stdout.write(self.style.WARNING(
+                        f"⚠️  Fila {fila_num}: sin RUT, saltada"
+                    ))
+                    omitidas.append({'fila': fila_num, 'motivo': 'Fila sin RUT', 'datos': row})
+                    continue
+
+                email_raw = (row.get('email') or '').strip()
+
+                registros.append({
+                    'rut_excel': rut_excel,
+                    'rut_compact': to_compact_rut(rut_raw),
+                    'valores': {
+                        'first_name': row.get('first_name', ''),
+                        'last_name': row.get('last_name', ''),
+                        'email': email_raw.lower() if email_raw else None,
+                        'phone': (row.get('phone') or '').strip() or None,
+                        'comuna': (row.get('comuna') or '').strip().upper() or None,
+                        'role': User.TEACHER,
+                        'active_status': 'active',
+                    },
+                    'perfil': {
+                        'department': (row.get('department') or row.get('departamento') or '').strip() or None,
+                        'title': (row.get('title') or row.get('titulo') or '').strip() or None,
+                        'position': (row.get('position') or row.get('cargo') or '').strip() or None,
+                    },
+                })
+            except Exception as e_row:
+                self.errores += 1
+                self.stdout.write(self.style.ERROR(
+                    f"❌ Error fila {fila_num} (rut='{row.get('rut','')}'): {e_row}"
+                ))
+                omitidas.append({'fila': fila_num, 'motivo': str(e_row), 'datos': row})
+
+        # Foto de la BD: usuarios (por RUT tal cual o compacto), comunas y perfiles
+        ruts = {r['rut_excel'] for r in registros} | {r['rut_compact'] for r in registros}
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+        comunas_por_id = dict(Comuna.objects.values_list('id', 'nombre'))
+        perfiles_actuales = {
+            p['user_id']: p
+            for p in TeacherProfile.objects
+            .filter(user_id__in=[u.pk for u in usuarios.values()])
+            .values('user_id', *CAMPOS_PERFIL)
+        }
+
+        crear, actualizar, perfiles = {}, {}, {}
+        for r in registros:
+            # buscar existente
+            user = usuarios.get(r['rut_excel']) or usuarios.get(r['rut_compact'])
+            rut = user.rut if user else r['rut_excel']
+            valores = r['valores']
+
+            if rut in crear:
+                crear[rut]['valores'].update(valores)
+            elif user is None:
+                crear[rut] = {'rut': rut, 'valores': dict(valores)}
+            else:
+                actuales = valores_actuales(user, comunas_por_id)
+                if rut in actualizar:
+                    actuales.update({c: v[1] for c, v in actualizar[rut]['cambios'].items()})
+                cambios = diferencias(actuales, valores, ignorar_nulos=True)
+                if cambios:
+                    previo = actualizar.setdefault(rut, {'rut': rut, 'id': user.pk, 'cambios': {}})
+                    for campo, (antes, despues) in cambios.items():
+                        previo['cambios'].setdefault(campo, [antes, despues])[1] = despues
+
+            # Perfil: se reemplaza completo (la última fila gana)
+            actual = perfiles_actuales.get(user.pk) if user else None
+            if actual is None or any(actual[c] != v for c, v in r['perfil'].items()):
+                perfiles[rut] = {'rut': rut, **r['perfil']}
+            else:
+                perfiles.pop(rut, None)
+
+        for e in actualizar.values():
+            e['cambios'] = {c: v for c, v in e['cambios'].items() if v[0] != v[1]}
+
+        nombres = {r['valores']['comuna'] for r in registros if r['valores']['comuna']}
+        return {
+            'comunas': sorted(nombres - set(comunas_por_id.values())),
+            'crear': list(crear.values()),
+            'actualizar': [e for e in actualizar.values() if e['cambios']],
+            'perfiles': list(perfiles.values()),
+            'omitidas': omitidas,
+        }
+
+    def aplicar(self, plan):
+        """Ejecuta un plan con operaciones en bloque (dentro de una transacción)."""
+        Comuna.objects.bulk_create(
+            [Comuna(nombre=n) for n in plan['comunas']], ignore_conflicts=True,
+        )
+        comunas_por_id = dict(Comuna.objects.values_list('id', 'nombre'))
+        comunas = {nombre: cid for cid, nombre in comunas_por_id.items()}
+
+        # El plan sigue vigente
+        ruts = {e['rut'] for e in plan['crear'] + plan['actualizar'] + plan['perfiles']}
+        usuarios = {u.rut: u for u in User.objects.filter(rut__in=ruts)}
+        conflictos = [e['rut'] for e in plan['crear'] if e['rut'] in usuarios]
+        for e in plan['actualizar']:
+            user = usuarios.get(e['rut'])
+            actuales = valores_actuales(user, comunas_por_id) if user else {}
+            if not user or any(actuales[c] != antes for c, (antes, _) in e['cambios'].items()):
+                conflictos.append(e['rut'])
+        verificar_plan(conflictos)
+
+        nuevos = []
+        for e in plan['crear']:
+            valores = dict(e['valores'])
+            comuna_id = comunas.get(valores.pop('comuna'))
+            user = User(rut=e['rut'], comuna_id=comuna_id, **valores)
+            usuarios[e['rut']] = user
+            nuevos.append(user)
+            self.stdout.write(self.style.SUCCESS(
+                f"🟢 Creado profesor: {user.first_name} {user.last_name} ({e['rut']})"
+            ))
+        User.objects.bulk_create(nuevos)
+        self.creados += len(nuevos)
+
+        cambiados = []
+        campos = set()
+        for e in plan['actualizar']:
+            user = usuarios[e['rut']]
+            for campo, (_, despues) in e['cambios'].items():
+                if campo == 'comuna':
+                    user.comuna_id = comunas.get(despues)
+                    campos.add('comuna_id')
+                else:
+                    setattr(user, campo, despues)
+                    campos.add(campo)
+            cambiados.append(user)
+            self.stdout.write(
+                f"🟡 Actualizado: {user.first_name} {user.last_name} ({user.rut})"
+            )
+        if cambiados:
+            User.objects.bulk_update(cambiados, sorted(campos))
+        self.actualizados += len(cambiados)
+
+        TeacherProfile.objects.bulk_create(
+            [
+                TeacherProfile(user=usuarios[e['rut']], **{c: e[c] for c in CAMPOS_PERFIL})
+                for e in plan['perfiles']
+            ],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=CAMPOS_PERFIL,
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.outbox import purgar
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra de la bandeja de salida los correos enviados o fallidos más "
+        "antiguos que --dias y vacía el contenido de los que queden."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=30,
+            help="Antigüedad mínima (en días) de los correos a borrar (default: 30)",
+        )
+
+    def handle(self, *args, **opts):
+        borrados, vaciados = purgar(max(0, opts["dias"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 Bandeja depurada. Borrados={borrados} | Contenido vaciado={vaciados}"
+        ))
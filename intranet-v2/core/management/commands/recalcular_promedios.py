@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.promedios import recalcular
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye la tabla de promedios materializados (StudentSubjectAverage) "
+        "desde las notas. Úsalo si se sospecha que quedó desfasada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            type=int,
+            default=None,
+            help="Solo este año académico (default: todos)",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        year = options["year"]
+        creadas, corregidas, eliminadas = recalcular(year=year)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Promedios recalculados{f' ({year})' if year else ''}. "
+            f"Nuevos={creadas} | Corregidos={corregidas} | Eliminados={eliminadas}"
+        ))
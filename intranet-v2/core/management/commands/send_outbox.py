@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import enviar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía los correos pendientes de la bandeja de salida (OutboundEmail). "
+        "Reutiliza una conexión SMTP por lote y reintenta con backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Correos por lote/conexión SMTP (default: EMAIL_OUTBOX_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=None,
+            help="Intentos antes de marcar un correo como fallido (default: EMAIL_OUTBOX_MAX_ATTEMPTS)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=None,
+            help="Máximo de correos por minuto, 0 = sin límite (default: EMAIL_OUTBOX_RATE_PER_MINUTE)",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Queda corriendo como worker y revisa la bandeja cada --sleep segundos",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=int,
+            default=10,
+            help="Segundos de espera cuando la bandeja está vacía (modo --loop)",
+        )
+
+    def handle(self, *args, **opts):
+        total_enviados = 0
+        total_fallidos = 0
+
+        while True:
+            enviados, fallidos, rate_limited = enviar_lote(
+                batch_size=opts["batch_size"],
+                max_attempts=opts["max_attempts"],
+                rate_per_minute=opts["rate"],
+            )
+            total_enviados += enviados
+            total_fallidos += fallidos
+
+            if enviados or fallidos:
+                self.stdout.write(f"📨 Lote: enviados={enviados} | con error={fallidos}")
+            if rate_limited:
+                self.stdout.write(self.style.WARNING("⚠️ Servidor SMTP limitando/no disponible; se pausa el envío."))
+
+            hay_mas = (enviados or fallidos) and not rate_limited
+            if hay_mas:
+                continue
+            if not opts["loop"]:
+                break
+            time.sleep(opts["sleep"] * (6 if rate_limited else 1))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Bandeja procesada. Enviados={total_enviados} | Con error={total_fallidos}"
+        ))
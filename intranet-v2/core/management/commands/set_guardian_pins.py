@@ -2,12 +2,16 @@
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import Count, Q
 
-from core.models import GuardianRelation, GuardianProfile
+from core.models import GuardianRelation, GuardianProfile, User
 
 
 DEFAULT_PIN = "12345"
 
+# Perfil sin PIN asignado
+SIN_PIN = Q(payment_pin__isnull=True) | Q(payment_pin="")
+
 
 class Command(BaseCommand):
     help = (
@@ -33,49 +37,51 @@ class Command(BaseCommand):
         pin = options["pin"]
         overwrite = options["overwrite"]
 
-        # Traemos todas las relaciones y armamos un set de apoderados únicos
-        relations = GuardianRelation.objects.select_related("guardian").all()
-        guardians = {rel.guardian for rel in relations}
-
-        total = len(guardians)
-        nuevos = 0
-        actualizados = 0
-        sin_cambios = 0
+        # Apoderados únicos como subconsulta: no se cargan en memoria
+        guardian_ids = GuardianRelation.objects.values("guardian_id").distinct()
+        total = guardian_ids.count()
 
         self.stdout.write(
             self.style.NOTICE(
                 f"Procesando {total} apoderado(s) con relación alumno–apoderado. "
-                f"PIN por defecto: {pin} | overwrite={overwrite}"
+                f"overwrite={overwrite}"
             )
         )
 
-        for guardian in guardians:
-            profile, _ = GuardianProfile.objects.get_or_create(user=guardian)
-
-            tenia_pin = bool(profile.payment_pin)
-
-            # Si ya tiene PIN y no queremos sobrescribir → lo dejamos tal cual
-            if tenia_pin and not overwrite:
-                sin_cambios += 1
-                self.stdout.write(
-                    f"ℹ️ {guardian.rut} ya tiene PIN ({profile.payment_pin}), se mantiene."
-                )
-                continue
-
-            # Asignamos / reasignamos PIN
-            profile.payment_pin = pin
-            profile.save(update_fields=["payment_pin"])
-
-            if tenia_pin and overwrite:
-                actualizados += 1
-                self.stdout.write(
-                    f"🟡 Actualizado PIN de {guardian.rut} → {pin}"
-                )
-            elif not tenia_pin:
-                nuevos += 1
-                self.stdout.write(
-                    f"🟢 Asignado PIN a {guardian.rut} → {pin}"
-                )
+        # ==========================
+        #  Perfiles existentes: conteo en una sola query
+        # ==========================
+        perfiles = GuardianProfile.objects.filter(user_id__in=guardian_ids)
+        conteo = perfiles.aggregate(
+            sin_pin=Count("id", filter=SIN_PIN),
+            con_pin=Count("id", filter=~SIN_PIN),
+        )
+
+        # ==========================
+        #  PIN en perfiles existentes: un solo UPDATE
+        # ==========================
+        # Va antes del INSERT: así solo toca perfiles que ya existían, sin
+        # excluir a los nuevos con una lista de ids.
+        if not overwrite:
+            perfiles = perfiles.filter(SIN_PIN)
+        perfiles.update(payment_pin=pin)
+
+        # ==========================
+        #  Perfiles faltantes: un solo INSERT
+        # ==========================
+        faltantes = list(
+            User.objects
+            .filter(id__in=guardian_ids, guardian_profile__isnull=True)
+            .values_list("id", flat=True)
+        )
+        GuardianProfile.objects.bulk_create(
+            [GuardianProfile(user_id=uid, payment_pin=pin) for uid in faltantes],
+            batch_size=1000,
+        )
+
+        nuevos = len(faltantes) + conteo["sin_pin"]
+        actualizados = conteo["con_pin"] if overwrite else 0
+        sin_cambios = 0 if overwrite else conteo["con_pin"]
 
         self.stdout.write("")
         self.stdout.write(self.style.SUCCESS(
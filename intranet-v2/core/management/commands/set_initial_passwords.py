@@ -2,8 +2,8 @@ import unicodedata
 import re
 import csv
 from django.core.management.base import BaseCommand
-from django.db import transaction
 from core.models import User
+from core.passwords import asignar_passwords
 
 def strip_accents(s: str) -> str:
     if not s:
@@ -57,8 +57,11 @@ class Command(BaseCommand):
                             help="Ruta para exportar CSV con (rut, password) de los afectados")
         parser.add_argument("--dry-run", action="store_true",
                             help="No guarda cambios, solo muestra/expone CSV si se pide")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Procesos para hashear (default: núcleos disponibles)")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Usuarios por UPDATE masivo (default: 500)")
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         role = opts["role"].lower()
         only_empty = opts["only_empty"]
@@ -73,18 +76,16 @@ class Command(BaseCommand):
             # Usuarios que no tienen password usable (por ej. set_unusable_password)
             qs = qs.filter(password__isnull=True) | qs.filter(password="")
 
-        qs = qs.order_by("id")
+        users = list(qs.order_by("id").only("id", "rut", "first_name", "last_name"))
+        rows = [(u.rut, build_password(u)) for u in users]
+        count = len(users)
 
-        rows = []
-        count = 0
-
-        for u in qs:
-            pwd = build_password(u)
-            rows.append((u.rut, pwd))
-            if not dry:
-                u.set_password(pwd)  # guarda con hash
-                u.save(update_fields=["password"])
-            count += 1
+        if not dry and users:
+            # Hash en paralelo + bulk_update por bloques
+            asignar_passwords(
+                users, [pwd for _, pwd in rows],
+                workers=opts["workers"] or None, chunk_size=max(1, opts["chunk_size"]),
+            )
 
         # Exporta CSV
         if export_csv:
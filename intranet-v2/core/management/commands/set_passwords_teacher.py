@@ -3,8 +3,8 @@ import unicodedata
 import re
 import os
 from django.core.management.base import BaseCommand
-from django.db import transaction
 from core.models import User
+from core.passwords import asignar_passwords
 
 try:
     from openpyxl import Workbook  # type: ignore
@@ -82,8 +82,19 @@ class Command(BaseCommand):
             action="store_true",
             help="No guarda en la BD, solo genera el Excel",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Procesos para hashear (default: núcleos disponibles)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Usuarios por UPDATE masivo (default: 500)",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         if Workbook is None:
             self.stderr.write(self.style.ERROR("Debes instalar openpyxl: pip install openpyxl"))
@@ -101,7 +112,7 @@ class Command(BaseCommand):
         if only_empty:
             qs = qs.filter(password__isnull=True) | qs.filter(password="")
 
-        qs = qs.order_by("id")
+        users = list(qs.order_by("id").only("id", "rut", "first_name", "last_name"))
 
         # preparar carpeta
         folder = os.path.dirname(xlsx_path)
@@ -113,19 +124,20 @@ class Command(BaseCommand):
         ws.title = "Contraseñas"
         ws.append(["rut", "nombre", "apellido", "password_inicial"])
 
-        count = 0
-
-        for u in qs:
+        passwords = []
+        for u in users:
             pwd = build_password(u)
+            passwords.append(pwd)
             # escribir en el excel
             ws.append([u.rut, u.first_name, u.last_name, pwd])
-
-            # guardar en la BD si no es dry-run
-            if not dry:
-                u.set_password(pwd)
-                u.save(update_fields=["password"])
-
-            count += 1
+        count = len(users)
+
+        # guardar en la BD si no es dry-run (hash en paralelo + bulk_update)
+        if not dry and users:
+            asignar_passwords(
+                users, passwords,
+                workers=opts["workers"] or None, chunk_size=max(1, opts["chunk_size"]),
+            )
 
         wb.save(xlsx_path)
         self.stdout.write(self.style.SUCCESS(f"Excel guardado en: {xlsx_path}"))
@@ -3,8 +3,9 @@ import unicodedata
 import re
 import os
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from core.importacion import agregar_argumentos_plan, cargar_plan, guardar_plan, verificar_plan
 from core.models import User
+from core.passwords import asignar_passwords
 
 try:
     from openpyxl import Workbook  # type: ignore
@@ -82,8 +83,21 @@ class Command(BaseCommand):
             action="store_true",
             help="No guarda en la BD, solo genera el Excel",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Procesos para hashear (default: núcleos disponibles)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Usuarios por UPDATE masivo (default: 500)",
+        )
+        # --plan, --apply
+        agregar_argumentos_plan(parser)
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         if Workbook is None:
             self.stderr.write(self.style.ERROR("Debes instalar openpyxl: pip install openpyxl"))
@@ -94,14 +108,43 @@ class Command(BaseCommand):
         xlsx_path = opts["xlsx_path"]
         dry = opts["dry_run"]
 
-        qs = User.objects.all()
-        if role != "all":
-            qs = qs.filter(role=role)
-
-        if only_empty:
-            qs = qs.filter(password__isnull=True) | qs.filter(password="")
-
-        qs = qs.order_by("id")
+        if opts["apply"]:
+            # --apply: exactamente los usuarios del plan, si no cambiaron desde entonces
+            plan = cargar_plan(opts["apply"], "update_teacher_emails")
+            por_id = User.objects.only("id", "rut", "first_name", "last_name").in_bulk(
+                [e["id"] for e in plan["usuarios"]]
+            )
+            verificar_plan([
+                e["rut"] for e in plan["usuarios"]
+                if e["id"] not in por_id
+                or (por_id[e["id"]].rut, por_id[e["id"]].first_name, por_id[e["id"]].last_name)
+                != (e["rut"], e["first_name"], e["last_name"])
+            ])
+            users = [por_id[e["id"]] for e in plan["usuarios"]]
+        else:
+            qs = User.objects.all()
+            if role != "all":
+                qs = qs.filter(role=role)
+
+            if only_empty:
+                qs = qs.filter(password__isnull=True) | qs.filter(password="")
+
+            users = list(qs.order_by("id").only("id", "rut", "first_name", "last_name"))
+
+        if opts["plan"] is not None:
+            # --plan: solo la lista de usuarios afectados (sin contraseñas)
+            plan_path = opts["plan"] or f"{os.path.splitext(xlsx_path)[0]}.plan.json"
+            guardar_plan(plan_path, "update_teacher_emails", {
+                "role": role,
+                "only_empty": only_empty,
+                "usuarios": [
+                    {"id": u.pk, "rut": u.rut, "first_name": u.first_name, "last_name": u.last_name}
+                    for u in users
+                ],
+            })
+            self.stdout.write(self.style.SUCCESS(f"📝 Plan guardado en {plan_path}. Usuarios: {len(users)}"))
+            self.stdout.write(f"   Revísalo y ejecútalo con --apply {plan_path}")
+            return
 
         # preparar carpeta
         folder = os.path.dirname(xlsx_path)
@@ -113,19 +156,20 @@ class Command(BaseCommand):
         ws.title = "Contraseñas"
         ws.append(["rut", "nombre", "apellido", "password_inicial"])
 
-        count = 0
-
-        for u in qs:
+        passwords = []
+        for u in users:
             pwd = build_password(u)
+            passwords.append(pwd)
             # escribir en el excel
             ws.append([u.rut, u.first_name, u.last_name, pwd])
-
-            # guardar en la BD si no es dry-run
-            if not dry:
-                u.set_password(pwd)
-                u.save(update_fields=["password"])
-
-            count += 1
+        count = len(users)
+
+        # guardar en la BD si no es dry-run (hash en paralelo + bulk_update)
+        if not dry and users:
+            asignar_passwords(
+                users, passwords,
+                workers=opts["workers"] or None, chunk_size=max(1, opts["chunk_size"]),
+            )
 
         wb.save(xlsx_path)
         self.stdout.write(self.style.SUCCESS(f"Excel guardado en: {xlsx_path}"))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:19
+
+from django.db import migrations, models
+
+
+# Índices trigram (pg_trgm) para las búsquedas icontains/istartswith del
+# listado de usuarios. Django las traduce a UPPER(campo::text) LIKE ..., por
+# eso el índice es sobre esa misma expresión. Solo aplican en PostgreSQL;
+# en SQLite (tests) no se crean.
+TRGM_FIELDS = ["rut", "first_name", "last_name", "email"]
+
+
+def crear_indices_trgm(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for field in TRGM_FIELDS:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS core_user_{field}_trgm "
+            f"ON core_user USING gin (UPPER(({field})::text) gin_trgm_ops)"
+        )
+
+
+def borrar_indices_trgm(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for field in TRGM_FIELDS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS core_user_{field}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0006_remove_payment_cuotas_ids_payment_getnet_token'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'first_name', 'id'], name='user_role_name_idx'),
+        ),
+        migrations.RunPython(crear_indices_trgm, borrar_indices_trgm),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField(help_text='Versión texto plano del mensaje')),
+                ('html_body', models.TextField(blank=True, help_text='Versión HTML (opcional)')),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('to', models.JSONField(blank=True, default=list, help_text='Lista de destinatarios')),
+                ('bcc', models.JSONField(blank=True, default=list, help_text='Lista de destinatarios en copia oculta')),
+                ('attachments', models.JSONField(blank=True, default=list, help_text='Adjuntos: [{filename, mimetype, content (base64), content_id}]')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Fallido')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text="Cuándo puede (re)intentarse. Mientras está 'sending' actúa como lease del worker.")),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Correo saliente',
+                'verbose_name_plural': 'Correos salientes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx')],
+            },
+        ),
+    ]
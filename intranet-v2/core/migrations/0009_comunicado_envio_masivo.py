@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comunicado',
+            name='curso',
+            field=models.ForeignKey(blank=True, help_text="Curso destino cuando destino='curso'", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='comunicados', to='core.class'),
+        ),
+        migrations.AddField(
+            model_name='comunicado',
+            name='enviados',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comunicado',
+            name='estado',
+            field=models.CharField(choices=[('en_cola', 'En cola'), ('enviado', 'Enviado'), ('con_errores', 'Enviado con errores')], default='en_cola', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='comunicado',
+            name='fallidos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comunicado',
+            name='total_destinatarios',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comunicado',
+            name='ultimo_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='comunicado',
+            field=models.ForeignKey(blank=True, help_text='Comunicado masivo al que pertenece este lote (si aplica)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='correos', to='core.comunicado'),
+        ),
+        migrations.AlterField(
+            model_name='comunicado',
+            name='destino',
+            field=models.CharField(choices=[('todos', 'Todos los usuarios'), ('curso', 'Por curso'), ('alumno', 'Alumno específico'), ('manual', 'Correo manual')], help_text='Destino del comunicado (todos, curso o manual)', max_length=20),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Carga inicial de los promedios desde las notas existentes. Después se
+# mantienen con las señales de core/promedios.py.
+def poblar_promedios(apps, schema_editor):
+    GradeResult = apps.get_model("core", "GradeResult")
+    StudentSubjectAverage = apps.get_model("core", "StudentSubjectAverage")
+
+    filas = (
+        GradeResult.objects
+        .values("student_id", subject_id=models.F("evaluation__subject_id"),
+                year=models.F("evaluation__subject__class_group__year"))
+        .annotate(
+            weighted_sum=models.Sum(
+                models.F("score") * models.F("evaluation__weight"),
+                output_field=models.DecimalField(max_digits=14, decimal_places=4),
+            ),
+            weight_sum=models.Sum("evaluation__weight"),
+            grade_count=models.Count("id"),
+        )
+    )
+    StudentSubjectAverage.objects.bulk_create(
+        (StudentSubjectAverage(**f) for f in filas.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_comunicado_envio_masivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSubjectAverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('weighted_sum', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('weight_sum', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('grade_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(limit_choices_to={'role': 'student'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['student', 'year'], name='avg_student_year_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'subject', 'year'), name='unique_student_subject_average')],
+            },
+        ),
+        migrations.RunPython(poblar_promedios, migrations.RunPython.noop),
+    ]
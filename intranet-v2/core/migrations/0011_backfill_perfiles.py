@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Q
+
+
+# Crea los perfiles que falten: TeacherProfile para cada profesor y
+# GuardianProfile para cada apoderado (rol guardian o que figure como
+# apoderado en GuardianRelation). Desde aquí User.tprofile / gprofile ya
+# no los crean al leer.
+def crear_perfiles_faltantes(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    TeacherProfile = apps.get_model("core", "TeacherProfile")
+    GuardianProfile = apps.get_model("core", "GuardianProfile")
+
+    profesores = (
+        User.objects
+        .filter(role="teacher", teacher_profile__isnull=True)
+        .values_list("id", flat=True)
+    )
+    TeacherProfile.objects.bulk_create(
+        (TeacherProfile(user_id=uid) for uid in profesores.iterator()),
+        batch_size=1000,
+    )
+
+    apoderados = (
+        User.objects
+        .filter(Q(role="guardian") | Q(guardian_relations__isnull=False), guardian_profile__isnull=True)
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    GuardianProfile.objects.bulk_create(
+        (GuardianProfile(user_id=uid) for uid in apoderados.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_studentsubjectaverage'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_perfiles_faltantes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+# La caché por defecto es DatabaseCache (ver CACHES en settings): su tabla
+# no la crean las migraciones normales. createcachetable no hace nada si
+# el backend no es de BD o si la tabla ya existe.
+def crear_tabla_cache(apps, schema_editor):
+    call_command("createcachetable", database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_backfill_perfiles'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
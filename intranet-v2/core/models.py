@@ -1,5 +1,7 @@
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
 
 
@@ -109,29 +111,40 @@ class User(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Listado de usuarios del admin: filtro por rol + paginación por cursor
+            models.Index(fields=["role", "first_name", "id"], name="user_role_name_idx"),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.get_role_display()})"
 
-    # Helpers opcionales para perfilar más fácil
+    # Helpers opcionales para perfilar más fácil (solo lectura: nunca
+    # crean el perfil). Los perfiles se crean junto con el usuario
+    # (core/perfiles.py); para evitar la query extra, cargar el usuario con
+    # select_related("teacher_profile") / select_related("guardian_profile").
     @property
     def tprofile(self):
-        """Acceso rápido al perfil de profesor."""
-        from .models import TeacherProfile  # import local para evitar ciclos
+        """Perfil de profesor, o None si no es profesor o no lo tiene."""
         if self.role != User.TEACHER:
             return None
-        profile, _ = TeacherProfile.objects.get_or_create(user=self)
-        return profile
+        try:
+            return self.teacher_profile
+        except ObjectDoesNotExist:
+            return None
 
     @property
     def gprofile(self):
         """
-        Acceso rápido al perfil de apoderado.
+        Perfil de apoderado, o None si no tiene.
         Cualquier usuario (admin, teacher, guardian, etc.) puede tener
         un GuardianProfile y por lo tanto actuar como apoderado.
         """
-        from .models import GuardianProfile
-        profile, _ = GuardianProfile.objects.get_or_create(user=self)
-        return profile
+        try:
+            return self.guardian_profile
+        except ObjectDoesNotExist:
+            return None
 
 
 # ==========================
@@ -374,6 +387,44 @@ class GradeResult(models.Model):
         return f"{self.student} - {self.evaluation.subject.name}: {self.score}"
 
 
+class StudentSubjectAverage(models.Model):
+    """
+    Promedio ponderado materializado por alumno + asignatura + año.
+    Guarda Σ(score·weight) y Σ(weight); se mantiene al día desde las señales
+    de GradeResult/Evaluation (core/promedios.py) y se reconstruye con
+    `manage.py recalcular_promedios`.
+    """
+    student = models.ForeignKey(
+        User, on_delete=models.CASCADE, limit_choices_to={"role": User.STUDENT}
+    )
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    weighted_sum = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    weight_sum = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    grade_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "subject", "year"], name="unique_student_subject_average"
+            )
+        ]
+        indexes = [
+            # Dashboard del alumno: todos sus promedios del año
+            models.Index(fields=["student", "year"], name="avg_student_year_idx"),
+        ]
+
+    @property
+    def promedio(self):
+        if not self.weight_sum:
+            return None
+        return self.weighted_sum / self.weight_sum
+
+    def __str__(self):
+        return f"{self.student} - {self.subject.name} ({self.year}): {self.promedio}"
+
+
 # ==========================
 #  Asistencia
 # ==========================
@@ -521,9 +572,16 @@ class Comunicado(models.Model):
     DESTINO_CHOICES = [
         ("todos", "Todos los usuarios"),
         ("curso", "Por curso"),
+        ("alumno", "Alumno específico"),
         ("manual", "Correo manual"),
     ]
 
+    ESTADO_CHOICES = [
+        ("en_cola", "En cola"),
+        ("enviado", "Enviado"),
+        ("con_errores", "Enviado con errores"),
+    ]
+
     asunto = models.CharField(max_length=200, help_text="Título o asunto del comunicado")
     mensaje = models.TextField(help_text="Contenido del mensaje a enviar")
     destino = models.CharField(
@@ -547,6 +605,21 @@ class Comunicado(models.Model):
 
     fecha_envio = models.DateTimeField(auto_now_add=True)
 
+    # Seguimiento del envío masivo (lo actualiza el worker send_outbox)
+    curso = models.ForeignKey(
+        Class,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="comunicados",
+        help_text="Curso destino cuando destino='curso'",
+    )
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default="en_cola")
+    total_destinatarios = models.PositiveIntegerField(default=0)
+    enviados = models.PositiveIntegerField(default=0)
+    fallidos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+
     class Meta:
         ordering = ["-fecha_envio"]
         verbose_name = "Comunicado"
@@ -554,3 +627,67 @@ class Comunicado(models.Model):
 
     def __str__(self):
         return f"{self.asunto} - {self.fecha_envio.strftime('%d/%m/%Y %H:%M')}"
+
+
+# ==========================
+#  Bandeja de salida de correos
+# ==========================
+class OutboundEmail(models.Model):
+    """
+    Correo pendiente de envío. Las vistas solo insertan filas aquí; el envío
+    SMTP real lo hace el comando `send_outbox` fuera del request.
+    """
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pendiente"),
+        (SENDING, "Enviando"),
+        (SENT, "Enviado"),
+        (FAILED, "Fallido"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(help_text="Versión texto plano del mensaje")
+    html_body = models.TextField(blank=True, help_text="Versión HTML (opcional)")
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list, blank=True, help_text="Lista de destinatarios")
+    bcc = models.JSONField(default=list, blank=True, help_text="Lista de destinatarios en copia oculta")
+    attachments = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Adjuntos: [{filename, mimetype, content (base64), content_id}]",
+    )
+
+    comunicado = models.ForeignKey(
+        Comunicado,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="correos",
+        help_text="Comunicado masivo al que pertenece este lote (si aplica)",
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Cuándo puede (re)intentarse. Mientras está 'sending' actúa como lease del worker.",
+    )
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx"),
+        ]
+        verbose_name = "Correo saliente"
+        verbose_name_plural = "Correos salientes"
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to or self.bcc)} ({self.get_status_display()})"
@@ -0,0 +1,249 @@
+import base64
+import logging
+import smtplib
+import time
+from datetime import timedelta
+from email.mime.image import MIMEImage
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from core.comunicados import registrar_progreso
+from core.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+#  ENCOLAR
+# =====================================================
+
+def adjunto(filename, content, mimetype, content_id=None):
+    """Arma un adjunto serializable para OutboundEmail.attachments."""
+    return {
+        "filename": filename,
+        "mimetype": mimetype,
+        "content": base64.b64encode(content).decode("ascii"),
+        "content_id": content_id,
+    }
+
+
+def preparar_correo(subject, body, to=None, html_body="", bcc=None, attachments=None, from_email=None):
+    """Arma el OutboundEmail sin guardarlo (para encolar muchos con bulk_create)."""
+    return OutboundEmail(
+        subject=subject,
+        body=body,
+        html_body=html_body or "",
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER or "",
+        to=list(to or []),
+        bcc=list(bcc or []),
+        attachments=list(attachments or []),
+    )
+
+
+def encolar_correo(subject, body, to=None, html_body="", bcc=None, attachments=None, from_email=None):
+    """
+    Deja un correo en la bandeja de salida y retorna la fila creada.
+    Es solo un INSERT: puede llamarse dentro de transaction.atomic sin
+    bloquear nada mientras el servidor SMTP responde.
+    """
+    correo = preparar_correo(subject, body, to, html_body, bcc, attachments, from_email)
+    correo.save()
+    return correo
+
+
+# =====================================================
+#  ENVIAR (lo usa el comando send_outbox)
+# =====================================================
+
+def construir_mensaje(correo, connection=None):
+    msg = EmailMultiAlternatives(
+        subject=correo.subject,
+        body=correo.body,
+        from_email=correo.from_email or None,
+        to=correo.to,
+        bcc=correo.bcc,
+        connection=connection,
+    )
+    if correo.html_body:
+        msg.attach_alternative(correo.html_body, "text/html")
+
+    for a in correo.attachments:
+        content = base64.b64decode(a["content"])
+        if a.get("content_id"):
+            # Imagen inline referenciada desde el HTML (cid:...)
+            img = MIMEImage(content)
+            img.add_header("Content-ID", f"<{a['content_id']}>")
+            img.add_header("Content-Disposition", "inline", filename=a["filename"])
+            msg.attach(img)
+        else:
+            msg.attach(a["filename"], content, a["mimetype"])
+    return msg
+
+
+def es_rate_limit(exc):
+    """
+    Errores SMTP temporales (4xx), desconexiones o cuota diaria agotada
+    (Gmail: 550 5.4.5): conviene pausar el lote, no seguir insistiendo.
+    """
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    code = getattr(exc, "smtp_code", None)
+    if code is None and isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [c for c, _ in exc.recipients.values()]
+        code = min(codes) if codes else None
+    if code is None:
+        return False
+    error = getattr(exc, "smtp_error", b"") or b""
+    if isinstance(error, bytes):
+        error = error.decode("utf-8", "ignore")
+    return 400 <= code < 500 or "5.4.5" in error
+
+
+def backoff(intentos):
+    """1, 2, 4, 8... minutos, con tope de 1 hora."""
+    return timedelta(minutes=min(2 ** max(intentos - 1, 0), 60))
+
+
+# Campos con el contenido del mensaje. Pueden traer contraseñas iniciales o
+# PINs, así que se vacían apenas el correo llega a un estado final.
+CAMPOS_CONTENIDO = ["body", "html_body", "attachments"]
+
+
+def _vaciar_contenido(correo):
+    correo.body = ""
+    correo.html_body = ""
+    correo.attachments = []
+
+
+LEASE_MINIMO = timedelta(minutes=10)
+LEASE_MARGEN = timedelta(minutes=5)
+
+
+def reclamar_lote(batch_size, lease=LEASE_MINIMO):
+    """
+    Marca hasta `batch_size` correos como 'sending' y los devuelve.
+    Usa SKIP LOCKED para que varios workers no tomen los mismos correos.
+    Un 'sending' con el lease vencido (worker caído) vuelve a reclamarse.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING],
+                next_attempt_at__lte=ahora,
+            )
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if ids:
+            OutboundEmail.objects.filter(id__in=ids).update(
+                status=OutboundEmail.SENDING,
+                next_attempt_at=ahora + lease,
+            )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by("id"))
+
+
+def enviar_lote(batch_size=None, max_attempts=None, rate_per_minute=None):
+    """
+    Envía un lote de la bandeja usando UNA conexión SMTP.
+    Retorna (enviados, fallidos, pausado_por_rate_limit).
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    rate_per_minute = settings.EMAIL_OUTBOX_RATE_PER_MINUTE if rate_per_minute is None else rate_per_minute
+    pausa = 60.0 / rate_per_minute if rate_per_minute else 0
+
+    # El lease debe cubrir todo el lote (pausas + timeout SMTP por correo);
+    # si vence a mitad de camino otro worker reclamaría y reenviaría correos.
+    por_correo = pausa + (getattr(settings, "EMAIL_TIMEOUT", None) or 30)
+    lease = timedelta(seconds=batch_size * por_correo) + LEASE_MARGEN
+    lote = reclamar_lote(batch_size, lease=max(lease, LEASE_MINIMO))
+    if not lote:
+        return 0, 0, False
+
+    enviados = fallidos = 0
+    rate_limited = False
+    connection = get_connection(fail_silently=False)
+
+    try:
+        connection.open()
+        for i, correo in enumerate(lote):
+            if i and pausa:
+                time.sleep(pausa)
+            try:
+                construir_mensaje(correo, connection).send()
+            except Exception as e:
+                correo.attempts += 1
+                correo.last_error = f"{type(e).__name__}: {e}"
+                if es_rate_limit(e):
+                    # Devolvemos este y el resto del lote a la cola y cortamos.
+                    rate_limited = True
+                    logger.warning("Outbox: límite SMTP alcanzado (%s), se pausa el envío", e)
+                    correo.status = OutboundEmail.PENDING
+                    correo.next_attempt_at = timezone.now() + backoff(correo.attempts)
+                    correo.save(update_fields=["status", "attempts", "last_error", "next_attempt_at"])
+                    OutboundEmail.objects.filter(
+                        id__in=[c.id for c in lote[i + 1:]],
+                        status=OutboundEmail.SENDING,
+                    ).update(status=OutboundEmail.PENDING, next_attempt_at=correo.next_attempt_at)
+                    break
+
+                fallidos += 1
+                campos = ["status", "attempts", "last_error", "next_attempt_at"]
+                if correo.attempts >= max_attempts:
+                    correo.status = OutboundEmail.FAILED
+                    _vaciar_contenido(correo)
+                    campos += CAMPOS_CONTENIDO
+                    logger.error("Outbox: correo %s descartado tras %s intentos: %s", correo.id, correo.attempts, e)
+                else:
+                    correo.status = OutboundEmail.PENDING
+                    correo.next_attempt_at = timezone.now() + backoff(correo.attempts)
+                correo.save(update_fields=campos)
+                if correo.comunicado_id and correo.status == OutboundEmail.FAILED:
+                    registrar_progreso(correo, ok=False, error=correo.last_error)
+            else:
+                correo.status = OutboundEmail.SENT
+                correo.sent_at = timezone.now()
+                correo.attempts += 1
+                correo.last_error = ""
+                _vaciar_contenido(correo)
+                correo.save(update_fields=["status", "sent_at", "attempts", "last_error"] + CAMPOS_CONTENIDO)
+                if correo.comunicado_id:
+                    registrar_progreso(correo, ok=True)
+                enviados += 1
+    except Exception as e:
+        # No se pudo abrir la conexión: todo el lote vuelve a la cola.
+        rate_limited = True
+        logger.warning("Outbox: no se pudo conectar al servidor SMTP: %s", e)
+        OutboundEmail.objects.filter(
+            id__in=[c.id for c in lote],
+            status=OutboundEmail.SENDING,
+        ).update(status=OutboundEmail.PENDING, next_attempt_at=timezone.now() + backoff(1), last_error=str(e))
+    finally:
+        connection.close()
+
+    return enviados, fallidos, rate_limited
+
+
+# =====================================================
+#  LIMPIEZA (lo usa el comando purgar_outbox)
+# =====================================================
+
+def purgar(dias):
+    """
+    Borra los correos enviados o fallidos con más de `dias` días y vacía el
+    contenido de cualquier otro en estado final que aún lo conserve (filas
+    anteriores a este cambio). Retorna (borrados, vaciados).
+    """
+    finales = OutboundEmail.objects.filter(status__in=[OutboundEmail.SENT, OutboundEmail.FAILED])
+    limite = timezone.now() - timedelta(days=dias)
+    borrados, _ = finales.filter(created_at__lt=limite).delete()
+    vaciados = finales.exclude(body="", html_body="", attachments=[]).update(
+        body="", html_body="", attachments=[],
+    )
+    return borrados, vaciados
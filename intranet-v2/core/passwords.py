@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from core.models import User
+
+
+# =====================================================
+#  HASH DE CONTRASEÑAS EN LOTE
+# =====================================================
+
+def hashear_passwords(passwords, workers=None, hilos=False):
+    """
+    Hashea una lista de contraseñas en paralelo. Mantiene el orden.
+
+    Por defecto usa un pool de procesos (comandos). Con hilos=True usa hilos:
+    el PBKDF2 de hashlib suelta el GIL mientras calcula, así que también
+    corre en paralelo y sirve dentro de un request sin hacer fork del worker.
+    """
+    passwords = list(passwords)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+
+    if hilos:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(make_password, passwords))
+
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def asignar_passwords(usuarios, passwords, workers=None, chunk_size=500):
+    """
+    Asigna `passwords[i]` a `usuarios[i]`: hashea en paralelo (fuera de la
+    transacción) y guarda con bulk_update por bloques en una sola transacción.
+    """
+    for u, hashed in zip(usuarios, hashear_passwords(passwords, workers)):
+        u.password = hashed
+
+    with transaction.atomic():
+        User.objects.bulk_update(usuarios, ["password"], batch_size=chunk_size)
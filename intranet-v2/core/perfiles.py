@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+
+from core.models import GuardianProfile, TeacherProfile, User
+
+
+# =====================================================
+#  PERFILES: se crean una sola vez, junto con el usuario
+# =====================================================
+#  User.tprofile / User.gprofile son de solo lectura. Los altas masivas
+#  (bulk_create) no disparan señales: los comandos insert_* y el registro
+#  por lote crean los perfiles ellos mismos.
+
+def crear_perfil(user):
+    """Crea el perfil que corresponde al rol del usuario (si no lo tiene)."""
+    if user.role == User.TEACHER:
+        TeacherProfile.objects.get_or_create(user=user)
+    elif user.role == User.GUARDIAN:
+        GuardianProfile.objects.get_or_create(user=user)
+
+
+def _usuario_guardado(sender, instance, created, **kwargs):
+    if created and not kwargs.get("raw"):
+        crear_perfil(instance)
+
+
+def conectar_senales():
+    post_save.connect(_usuario_guardado, sender=User, dispatch_uid="perfiles_user_save")
@@ -0,0 +1,187 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from core.models import Evaluation, GradeResult, StudentSubjectAverage
+
+
+# =====================================================
+#  PROMEDIOS MATERIALIZADOS (StudentSubjectAverage)
+# =====================================================
+#  Cada fila guarda Σ(score·weight) y Σ(weight) de un alumno en una
+#  asignatura y año. Guardar/borrar una nota aplica solo la diferencia
+#  (UPDATE con F()); los cambios de ponderación y las escrituras masivas
+#  recalculan las filas afectadas con recalcular().
+
+SUMA_FIELD = DecimalField(max_digits=14, decimal_places=4)
+
+
+def _sumar(student_id, subject_id, year, ponderado, peso, notas):
+    """Suma (o resta) un aporte a la fila (alumno, asignatura, año)."""
+    claves = {"student_id": student_id, "subject_id": subject_id, "year": year}
+    filas = StudentSubjectAverage.objects.filter(**claves)
+    incremento = {
+        "weighted_sum": F("weighted_sum") + ponderado,
+        "weight_sum": F("weight_sum") + peso,
+        "grade_count": F("grade_count") + notas,
+    }
+    if filas.update(**incremento) or notas <= 0:
+        return
+    try:
+        # Savepoint: si otra transacción creó la fila entre el UPDATE y este
+        # INSERT, la restricción única falla solo aquí y se suma sobre esa.
+        with transaction.atomic():
+            StudentSubjectAverage.objects.create(
+                **claves, weighted_sum=ponderado, weight_sum=peso, grade_count=notas,
+            )
+    except IntegrityError:
+        filas.update(**incremento)
+
+
+def _datos_evaluacion(evaluation_id):
+    """(weight, subject_id, year) de una evaluación, o None si ya no existe."""
+    return (
+        Evaluation.objects
+        .filter(id=evaluation_id)
+        .values_list("weight", "subject_id", "subject__class_group__year")
+        .first()
+    )
+
+
+def recalcular(student_ids=None, subject_ids=None, evaluation_id=None, year=None):
+    """
+    Recalcula desde GradeResult las filas que calzan con los filtros (todas
+    si no se indica ninguno). Devuelve (creadas, corregidas, eliminadas).
+    """
+    notas = GradeResult.objects.all()
+    filas = StudentSubjectAverage.objects.all()
+    if student_ids is not None:
+        notas = notas.filter(student_id__in=student_ids)
+        filas = filas.filter(student_id__in=student_ids)
+    if subject_ids is not None:
+        notas = notas.filter(evaluation__subject_id__in=subject_ids)
+        filas = filas.filter(subject_id__in=subject_ids)
+    if evaluation_id is not None:
+        # Toda la asignatura de esa evaluación
+        notas = notas.filter(evaluation__subject__evaluation__id=evaluation_id)
+        filas = filas.filter(subject__evaluation__id=evaluation_id)
+    if year is not None:
+        notas = notas.filter(evaluation__subject__class_group__year=year)
+        filas = filas.filter(year=year)
+
+    esperadas = {
+        (r["student_id"], r["subject_id"], r["year"]): r
+        for r in notas
+        .values("student_id", subject_id=F("evaluation__subject_id"),
+                year=F("evaluation__subject__class_group__year"))
+        .annotate(
+            weighted_sum=Sum(F("score") * F("evaluation__weight"), output_field=SUMA_FIELD),
+            weight_sum=Sum("evaluation__weight"),
+            grade_count=Count("id"),
+        )
+    }
+    actuales = {(f.student_id, f.subject_id, f.year): f for f in filas}
+
+    campos = ["weighted_sum", "weight_sum", "grade_count"]
+    nuevas, corregidas = [], []
+    for clave, r in esperadas.items():
+        fila = actuales.get(clave)
+        if fila is None:
+            nuevas.append(StudentSubjectAverage(
+                student_id=clave[0], subject_id=clave[1], year=clave[2],
+                **{c: r[c] for c in campos},
+            ))
+        elif any(Decimal(getattr(fila, c)) != Decimal(r[c]) for c in campos):
+            for c in campos:
+                setattr(fila, c, r[c])
+            corregidas.append(fila)
+
+    sobrantes = [f.pk for clave, f in actuales.items() if clave not in esperadas]
+
+    StudentSubjectAverage.objects.bulk_create(
+        nuevas,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["student", "subject", "year"],
+        update_fields=campos,
+    )
+    StudentSubjectAverage.objects.bulk_update(corregidas, campos, batch_size=1000)
+    if sobrantes:
+        StudentSubjectAverage.objects.filter(pk__in=sobrantes).delete()
+
+    return len(nuevas), len(corregidas), len(sobrantes)
+
+
+# =====================================================
+#  SEÑALES: mantener las sumas al día
+# =====================================================
+
+def _nota_antes_de_guardar(sender, instance, **kwargs):
+    # Valores anteriores para aplicar solo la diferencia
+    instance._nota_anterior = None
+    if instance.pk:
+        instance._nota_anterior = (
+            GradeResult.objects.filter(pk=instance.pk)
+            .values_list("score", "evaluation_id", "student_id")
+            .first()
+        )
+
+
+def _nota_guardada(sender, instance, **kwargs):
+    anterior = getattr(instance, "_nota_anterior", None)
+    if anterior is not None:
+        score, evaluation_id, student_id = anterior
+        datos = _datos_evaluacion(evaluation_id)
+        if datos:
+            peso, subject_id, year = datos
+            _sumar(student_id, subject_id, year, -score * peso, -peso, -1)
+
+    datos = _datos_evaluacion(instance.evaluation_id)
+    if datos:
+        peso, subject_id, year = datos
+        score = Decimal(str(instance.score))
+        _sumar(instance.student_id, subject_id, year, score * peso, peso, 1)
+
+
+def _nota_borrada(sender, instance, **kwargs):
+    datos = _datos_evaluacion(instance.evaluation_id)
+    if datos:
+        peso, subject_id, year = datos
+        score = Decimal(str(instance.score))
+        _sumar(instance.student_id, subject_id, year, -score * peso, -peso, -1)
+
+
+def _evaluacion_antes_de_guardar(sender, instance, **kwargs):
+    instance._evaluacion_anterior = None
+    if instance.pk:
+        instance._evaluacion_anterior = (
+            Evaluation.objects.filter(pk=instance.pk)
+            .values_list("weight", "subject_id")
+            .first()
+        )
+
+
+def _evaluacion_guardada(sender, instance, created, **kwargs):
+    anterior = getattr(instance, "_evaluacion_anterior", None)
+    if created or anterior is None:
+        return
+    peso, subject_id = anterior
+    if Decimal(str(instance.weight)) != peso or instance.subject_id != subject_id:
+        recalcular(subject_ids={subject_id, instance.subject_id})
+
+
+def _evaluacion_borrada(sender, instance, **kwargs):
+    # El borrado en cascada de sus notas ya restó lo suyo; por si acaso
+    # la evaluación desapareció antes que ellas, se recalcula la asignatura.
+    recalcular(subject_ids=[instance.subject_id])
+
+
+def conectar_senales():
+    pre_save.connect(_nota_antes_de_guardar, sender=GradeResult, dispatch_uid="promedios_nota_pre_save")
+    post_save.connect(_nota_guardada, sender=GradeResult, dispatch_uid="promedios_nota_save")
+    post_delete.connect(_nota_borrada, sender=GradeResult, dispatch_uid="promedios_nota_delete")
+    pre_save.connect(_evaluacion_antes_de_guardar, sender=Evaluation, dispatch_uid="promedios_evaluacion_pre_save")
+    post_save.connect(_evaluacion_guardada, sender=Evaluation, dispatch_uid="promedios_evaluacion_save")
+    post_delete.connect(_evaluacion_borrada, sender=Evaluation, dispatch_uid="promedios_evaluacion_delete")
@@ -5,7 +5,6 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import never_cache
 from django.core.cache import cache
 from django.http import JsonResponse
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -16,6 +15,7 @@ import json
 import time
 from .forms import LoginForm
 from core.models import User, GuardianRelation, GuardianProfile
+from core.outbox import encolar_correo
 
 
 # ===========================================================
@@ -420,8 +420,8 @@ Atentamente,
 Equipo de Soporte
 """
 
-            # Enviar correo
-            send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [email_destino], fail_silently=False)
+            # Encolar correo (lo envía el worker send_outbox)
+            encolar_correo(subject=asunto, body=mensaje, to=[email_destino])
 
             # Guardar intento
             cache.set(cache_key_ip, ip_attempts, IP_LOCK_TIME)
@@ -123,6 +123,32 @@ DATABASES = {
 }
 
 
+# =========================================================
+#  CACHÉ (compartida entre procesos)
+# =========================================================
+# Los workers web y los comandos (insert_*, send_outbox...) deben ver la
+# misma caché para que las invalidaciones lleguen a todos. Con REDIS_URL se
+# usa Redis (requiere el paquete `redis`); si no, una tabla en la BD, que
+# crea la migración core.0012 (o `python manage.py createcachetable`).
+# Con la tabla, cada lectura de caché es un SELECT: en producción se
+# recomienda Redis. Las clases de hoy además tienen una memoria por proceso
+# de 30 s (core/horarios.py), así que no hacen queries mientras está vigente.
+if env("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': env("CACHE_TABLE", "intranet_cache"),
+        }
+    }
+
+
 # =========================================================
 #  VALIDACIÓN DE PASSWORD
 # =========================================================
@@ -171,4 +197,12 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = env("EMAIL_HOST_USER")
-EMAIL_TIMEOUT = 15
\ No newline at end of file
+EMAIL_TIMEOUT = 15
+
+# Bandeja de salida (comando send_outbox)
+EMAIL_OUTBOX_BATCH_SIZE = env_int("EMAIL_OUTBOX_BATCH_SIZE", 50)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env_int("EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+# Máximo de mensajes SMTP por minuto (0 = sin límite)
+EMAIL_OUTBOX_RATE_PER_MINUTE = env_int("EMAIL_OUTBOX_RATE_PER_MINUTE", 60)
+# Destinatarios BCC por correo en los comunicados masivos
+COMUNICADO_BCC_BATCH_SIZE = env_int("COMUNICADO_BCC_BATCH_SIZE", 50)
\ No newline at end of file
@@ -0,0 +1,219 @@
+from collections import defaultdict
+from functools import cached_property
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.horarios import clases_del_dia
+from core.models import Enrollment, Evaluation, GradeResult, StudentSubjectAverage, Subject
+
+
+# =====================================================
+#  DATOS DEL PANEL DEL PROFESOR
+# =====================================================
+#  Cada endpoint del panel (perfil, cursos, clases de hoy, próximas
+#  evaluaciones, libro de notas) se arma desde un DatosProfesor. Las
+#  queries compartidas (p. ej. las asignaturas del profe) se memorizan por
+#  request, así el bootstrap arma todo el payload sin repetirlas.
+
+BOOTSTRAP_CACHE_KEY = "profesor_bootstrap:{}"
+BOOTSTRAP_TIMEOUT = 60  # segundos; las escrituras del profe lo invalidan antes
+
+
+class DatosProfesor:
+    def __init__(self, user):
+        self.user = user
+
+    # ---------- queries compartidas (una vez por request) ----------
+
+    @cached_property
+    def asignaturas(self):
+        """Asignaturas que imparte el profe, con su curso y grado."""
+        return list(
+            Subject.objects
+            .filter(teacher=self.user)
+            .select_related("class_group__grade")
+            .order_by("id")
+        )
+
+    @cached_property
+    def cursos_ids(self):
+        """Cursos donde enseña, sin repetir y en orden de aparición."""
+        return list(dict.fromkeys(s.class_group_id for s in self.asignaturas))
+
+    # ---------- secciones ----------
+
+    def perfil(self):
+        u = self.user
+        tprofile = u.tprofile  # solo lectura: nunca crea el perfil
+        return {
+            "nombre": f"{u.first_name} {u.last_name}",
+            "email": u.email or "--",
+            "rut": getattr(u, "rut", "--"),
+            "telefono": getattr(u, "phone", "--"),
+            "rol": getattr(u, "role", "--"),
+            "department": getattr(tprofile, "department", "--") if tprofile else "--",
+            "title": getattr(tprofile, "title", "--") if tprofile else "--",
+            "position": getattr(tprofile, "position", "--") if tprofile else "--",
+        }
+
+    def cursos(self):
+        """Cursos donde el profesor imparte asignaturas (no depende de Class.teacher)."""
+        clases = {s.class_group_id: s.class_group for s in self.asignaturas}
+        return [
+            {"id": cid, "nombre": f"{clases[cid].grade.curso_nombre} {clases[cid].year}"}
+            for cid in self.cursos_ids
+        ]
+
+    def clases_hoy(self):
+        """
+        Clases de hoy según SubjectSchedule (horario semanal cacheado), con
+        la clase en curso y la siguiente. Con el horario en caché cuesta una
+        sola lectura de caché.
+        """
+        ahora = timezone.localtime()
+        hoy = clases_del_dia(self.user.id, ahora)
+        return {
+            "dia": ahora.strftime("%A %d de %B %Y").capitalize(),
+            # Cursos de hoy sin repetir, en orden de la primera clase
+            "cursos": list(dict.fromkeys(c["curso"] for c in hoy["clases"])),
+            **hoy,
+        }
+
+    def proximas_evaluaciones(self):
+        hoy = timezone.now().date()
+        evaluaciones = (
+            Evaluation.objects
+            .select_related("class_group__grade", "subject")
+            .filter(teacher=self.user, date__gte=hoy)
+            .order_by("date")
+        )
+        return [
+            {
+                "descripcion": ev.description,
+                "fecha": ev.date.strftime("%d-%m-%Y"),
+                "curso": ev.class_group.grade.curso_nombre,
+                "asignatura": ev.subject.name,
+            }
+            for ev in evaluaciones
+        ]
+
+    def libro_de_notas(self):
+        """
+        Libro de notas de todas las asignaturas con un número fijo de
+        queries (matrículas, evaluaciones, notas y promedios, además de las
+        asignaturas compartidas). Los promedios ponderados se leen de la
+        tabla materializada StudentSubjectAverage (Decimal).
+        """
+        subjects = self.asignaturas
+
+        # Alumnos de todos los cursos
+        alumnos_por_curso = defaultdict(list)
+        for en in (
+            Enrollment.objects
+            .filter(class_group_id__in=self.cursos_ids)
+            .select_related("student")
+            .order_by("id")
+        ):
+            alumnos_por_curso[en.class_group_id].append(en.student)
+
+        # Evaluaciones de todas las asignaturas (ordenadas por fecha)
+        evaluaciones_por_asignatura = defaultdict(list)
+        for ev in (
+            Evaluation.objects
+            .filter(subject__in=subjects)
+            .select_related("evaluation_type")
+            .order_by("date", "id")
+        ):
+            evaluaciones_por_asignatura[ev.subject_id].append(ev)
+
+        # Notas: results_index[(student_id, evaluation_id)] = score
+        results_index = {
+            (student_id, ev_id): score
+            for ev_id, student_id, score in GradeResult.objects
+            .filter(evaluation__subject__in=subjects)
+            .values_list("evaluation_id", "student_id", "score")
+        }
+
+        # Promedios ponderados materializados por (asignatura, alumno)
+        promedios = {
+            (p.subject_id, p.student_id): p.promedio
+            for p in StudentSubjectAverage.objects.filter(subject__in=subjects)
+        }
+
+        cursos_data = []
+        for s in subjects:
+            evaluations = evaluaciones_por_asignatura[s.id]
+            alumnos_data = []
+
+            for student in alumnos_por_curso[s.class_group_id]:
+                notas = []
+                for ev in evaluations:
+                    score = results_index.get((student.id, ev.id))
+                    notas.append({
+                        "evaluacion": ev.description,
+                        "nota": float(score) if score is not None else None,
+                        "weight": float(ev.weight),                  # 👈 ponderación
+                        "tipo": ev.evaluation_type.name
+                                if ev.evaluation_type else "",
+                        "fecha": ev.date.isoformat() if ev.date else None,
+                    })
+
+                promedio_ponderado = promedios.get((s.id, student.id))
+                if promedio_ponderado is not None:
+                    promedio_ponderado = float(round(promedio_ponderado, 2))
+
+                alumnos_data.append({
+                    "nombre": f"{student.first_name} {student.last_name}",
+                    "rut": getattr(student, "rut", ""),
+                    "notas": notas,
+                    "promedio_ponderado": promedio_ponderado,
+                })
+
+            cursos_data.append({
+                "asignatura": s.name,
+                "curso": str(s.class_group),
+                "alumnos": alumnos_data,
+            })
+
+        return cursos_data
+
+    # ---------- todo junto ----------
+
+    def bootstrap(self):
+        # Sin clases_hoy: depende de la hora y bootstrap_profesor la agrega aparte
+        return {
+            "perfil": self.perfil(),
+            "cursos": self.cursos(),
+            "proximas_evaluaciones": self.proximas_evaluaciones(),
+            "mis_cursos_notas": self.libro_de_notas(),
+        }
+
+
+def datos_profesor(request):
+    """DatosProfesor memorizado en el request (una sola instancia por request)."""
+    if not hasattr(request, "_datos_profesor"):
+        request._datos_profesor = DatosProfesor(request.user)
+    return request._datos_profesor
+
+
+def bootstrap_profesor(request, fresco=False):
+    """
+    Payload completo del panel, cacheado unos segundos por profesor. Las
+    clases de hoy se calculan en cada llamada (clase actual/siguiente) desde
+    el horario semanal, que tiene su propia caché.
+
+    fresco=True ignora lo cacheado y lo reemplaza: el panel lo pide así justo
+    después de guardar, para ver su propia escritura aunque la invalidación
+    aún no se note.
+    """
+    key = BOOTSTRAP_CACHE_KEY.format(request.user.id)
+    data = None if fresco else cache.get(key)
+    if data is None:
+        data = datos_profesor(request).bootstrap()
+        cache.set(key, data, BOOTSTRAP_TIMEOUT)
+    return {**data, "clases_hoy": datos_profesor(request).clases_hoy()}
+
+
+def invalidar_bootstrap(user_id):
+    cache.delete(BOOTSTRAP_CACHE_KEY.format(user_id))
@@ -0,0 +1,128 @@
+import csv
+import re
+import tempfile
+
+from openpyxl import Workbook
+
+from core.models import Enrollment, Evaluation, GradeResult, StudentSubjectAverage
+
+
+# =====================================================
+#  EXPORTAR LIBRO DE NOTAS (CSV / XLSX en streaming)
+# =====================================================
+#  Una fila por alumno y una columna por evaluación, por asignatura. Los
+#  alumnos y las notas se recorren con iterator() ordenados por alumno y se
+#  cruzan como dos listas ordenadas: nunca se arma la matriz completa.
+
+CHUNK_SIZE = 2000
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+BLOQUE_BYTES = 64 * 1024
+
+
+def _encabezado(evaluaciones):
+    return (
+        ["RUT", "Apellidos", "Nombres"]
+        + [f"{ev.description} ({ev.date:%d-%m-%Y}, {ev.weight:g})" for ev in evaluaciones]
+        + ["Promedio"]
+    )
+
+
+def _nota(valor):
+    return float(valor) if valor is not None else None
+
+
+def filas_asignatura(subject):
+    """
+    Genera el encabezado y luego una fila por alumno matriculado en el curso
+    de la asignatura. Memoria: solo las evaluaciones y la fila en curso.
+    """
+    evaluaciones = list(
+        Evaluation.objects.filter(subject=subject).order_by("date", "id")
+    )
+    columna = {ev.id: i for i, ev in enumerate(evaluaciones)}
+    yield _encabezado(evaluaciones)
+
+    alumnos = (
+        Enrollment.objects
+        .filter(class_group_id=subject.class_group_id)
+        .order_by("student_id")
+        .values_list("student_id", "student__rut", "student__last_name", "student__first_name")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    notas = iter(
+        GradeResult.objects
+        .filter(evaluation__subject=subject)
+        .order_by("student_id")
+        .values_list("student_id", "evaluation_id", "score")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    promedios = iter(
+        StudentSubjectAverage.objects
+        .filter(subject=subject, weight_sum__gt=0)
+        .order_by("student_id")
+        .values_list("student_id", "weighted_sum", "weight_sum")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    nota = next(notas, None)
+    promedio = next(promedios, None)
+    vistos = set()
+    for student_id, rut, apellidos, nombres in alumnos:
+        if student_id in vistos:  # matriculado dos veces en el mismo curso
+            continue
+        vistos.add(student_id)
+
+        celdas = [None] * len(evaluaciones)
+        # Notas de alumnos no matriculados (student_id menor) se descartan
+        while nota is not None and nota[0] <= student_id:
+            if nota[0] == student_id:
+                celdas[columna[nota[1]]] = _nota(nota[2])
+            nota = next(notas, None)
+
+        valor = None
+        while promedio is not None and promedio[0] <= student_id:
+            if promedio[0] == student_id:
+                valor = round(promedio[1] / promedio[2], 2)
+            promedio = next(promedios, None)
+
+        yield [rut, apellidos, nombres] + celdas + [_nota(valor)]
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def csv_libro(subjects):
+    """CSV (separado por ';', con BOM para Excel) de una o más asignaturas."""
+    writer = csv.writer(_Eco(), delimiter=";")
+    yield "\ufeff"
+    for i, subject in enumerate(subjects):
+        if i:
+            yield "\r\n"
+        yield writer.writerow([f"{subject.name} - {subject.class_group}"])
+        for fila in filas_asignatura(subject):
+            yield writer.writerow(["" if v is None else v for v in fila])
+
+
+def xlsx_libro(subjects):
+    """
+    XLSX write-only (una hoja por asignatura). openpyxl vuelca las filas a
+    disco al escribirlas; el archivo final se envía por bloques desde un
+    temporal.
+    """
+    wb = Workbook(write_only=True)
+    for subject in subjects:
+        # Los nombres de hoja tienen máximo 31 caracteres y deben ser únicos
+        nombre = re.sub(r"[\\/*?:\[\]]", "-", f"{subject.id} {subject.name}")
+        ws = wb.create_sheet(nombre[:31])
+        for fila in filas_asignatura(subject):
+            ws.append(fila)
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while bloque := tmp.read(BLOQUE_BYTES):
+            yield bloque
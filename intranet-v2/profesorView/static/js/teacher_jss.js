@@ -18,8 +18,33 @@ document.addEventListener("DOMContentLoaded", () => {
 
   // ✅ NUEVO: alumnos + nota (si existe) para una evaluación
   alumnosConNotas: (evalId) => `/profesorView/evaluacion/${evalId}/alumnos-notas/`,
+
+  // perfil + cursos + clases de hoy + próximas evaluaciones + libro de notas
+  bootstrap: "/profesorView/bootstrap/",
 };
 
+  // =========================
+  // BOOTSTRAP: todo lo inicial en una sola petición
+  // =========================
+  // Las secciones leen de aquí en vez de pedir cada endpoint por separado.
+  // Tras guardar notas o crear una evaluación se vuelve a pedir.
+  let bootstrap = null;
+
+  function datosIniciales(recargar = false) {
+    if (!bootstrap || recargar) {
+      // Tras una escritura se pide sin caché para ver el cambio al tiro
+      const url = recargar ? `${API.bootstrap}?fresco=1` : API.bootstrap;
+      bootstrap = fetch(url).then((r) => {
+        if (!r.ok) throw new Error(`HTTP ${r.status}`);
+        return r.json();
+      });
+      bootstrap.catch(() => {
+        bootstrap = null; // reintentar en la próxima sección
+      });
+    }
+    return bootstrap;
+  }
+
 
   function setTitle(section) {
     const pretty = section.replace(/-/g, " ").replace(/^\w/, (c) => c.toUpperCase());
@@ -104,30 +129,27 @@ async function cargarClasesHoy() {
     const msg = document.getElementById("msg-hoy");
 
     try {
-        const r = await fetch("/profesorView/clases-hoy/");
-        const data = await r.json();
-
-        // **NUEVOS CAMBIOS EN JS**
-        const hoy = new Date();
-        const diaSemana = hoy.getDay(); // 0 (Dom) a 6 (Sáb)
-
-        // Asignaturas del día (vacío si es fin de semana)
-        let cursosVisibles = [];
-        
-        // Excluir Sábado (6) y Domingo (0)
-        if (diaSemana !== 0 && diaSemana !== 6) { 
-            cursosVisibles = data.cursos.map(c => limpiarNombreCurso(c));
+        const data = (await datosIniciales()).clases_hoy;
+
+        // Clases de hoy según el horario (el servidor ya filtra el día)
+        const clases = data.clases || [];
+        const bloque = (c) =>
+          `${c.inicio}–${c.fin} ${c.asignatura} (${limpiarNombreCurso(c.curso)})`;
+
+        const lista = clases.length
+            ? clases.map(bloque).join("<br>")
+            : "ningún curso programado para hoy";
+
+        let ahora = "";
+        if (data.actual) {
+          ahora = `<br>En curso: <strong>${bloque(data.actual)}</strong>.`;
+        } else if (data.siguiente) {
+          ahora = `<br>Siguiente: <strong>${bloque(data.siguiente)}</strong>.`;
         }
 
-        // Determinar la lista de asignaturas para mostrar
-        const lista = cursosVisibles.length
-            ? cursosVisibles.join(", ")
-            : "ningún curso programado para hoy"; // Texto ligeramente mejorado para el caso vacío
-
-        // **CAMBIO DEL TEXTO DE SALIDA**
         msg.innerHTML = `
         Hoy es: <strong>${data.dia}</strong>.
-        Tus asignaturas: <strong>${lista}</strong>.
+        <br>Tus clases:<br><strong>${lista}</strong>${ahora}
         `;
 
     } catch (err) {
@@ -140,9 +162,7 @@ async function cargarClasesHoy() {
     const cont = document.getElementById("eval-card");
 
     try {
-      const r = await fetch("/profesorView/proximas-evaluaciones/");
-      const data = await r.json();
-      const evaluaciones = data.evaluaciones || [];
+      const evaluaciones = (await datosIniciales()).proximas_evaluaciones || [];
 
       if (!evaluaciones.length) {
         cont.innerHTML = `
@@ -217,8 +237,7 @@ async function cargarClasesHoy() {
     let cursos = [];
 
     try {
-      const r = await fetch(API.cursos);
-      cursos = await r.json();
+      cursos = (await datosIniciales()).cursos;
     } catch (err) {
       grid.innerHTML = "<p>Error al cargar.</p>";
       return;
@@ -344,8 +363,7 @@ async function cargarClasesHoy() {
     content.innerHTML = `<div class="card">Cargando perfil...</div>`;
     let p = {};
     try {
-      const r = await fetch(API.perfil);
-      p = await r.json();
+      p = (await datosIniciales()).perfil;
     } catch (err) {
       content.innerHTML = `<div class="card">No se pudo cargar el perfil.</div>`;
       return;
@@ -420,8 +438,7 @@ async function cargarClasesHoy() {
     // cargar cursos
     let cursos = [];
     try {
-      const r = await fetch(API.cursos);
-      cursos = await r.json();
+      cursos = (await datosIniciales()).cursos;
     } catch (err) {
       selCurso.innerHTML = `<option value="">Error al cargar cursos</option>`;
       return;
@@ -546,6 +563,7 @@ async function cargarClasesHoy() {
       });
       const res = await r.json();
       if (res.success) {
+        datosIniciales(true);
         alert("Evaluación creada ✅");
         load("mis-cursos");
       } else {
@@ -594,8 +612,7 @@ async function cargarClasesHoy() {
     // 1) Cargar cursos del profe
     let cursos = [];
     try {
-      const r = await fetch(API.cursos);
-      cursos = await r.json();
+      cursos = (await datosIniciales()).cursos;
     } catch (err) {
       console.error(err);
       selCurso.innerHTML = `<option value="">Error al cargar cursos</option>`;
@@ -737,6 +754,7 @@ async function cargarClasesHoy() {
           });
           const res = await r.json();
           if (res.success) {
+            datosIniciales(true);
             alert(`Notas guardadas ✅${res.actualizadas ? " (" + res.actualizadas + " registro(s))" : ""}`);
           } else {
             alert(res.error || "Error al guardar notas");
@@ -769,8 +787,8 @@ async function cargarClasesHoy() {
     </div>
   `;
 
-  fetch("/profesorView/mis-cursos-notas/")
-    .then((r) => r.json())
+  datosIniciales()
+    .then((boot) => ({ cursos: boot.mis_cursos_notas }))
     .then((data) => {
       const cursos = data.cursos || [];
       if (!cursos.length) {
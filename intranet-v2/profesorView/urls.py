@@ -5,6 +5,7 @@ app_name = "profesorView"
 
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),
+    path("bootstrap/", views.bootstrap, name="bootstrap"),
     path("perfil-data/", views.perfil_data, name="perfil-data"),
     path("cursos/", views.cursos_docente, name="cursos"),
     path("curso/<int:class_id>/alumnos/", views.alumnos_por_curso, name="alumnos-curso"),
@@ -14,6 +15,7 @@ urlpatterns = [
     path("evaluacion/<int:eval_id>/notas/guardar/", views.guardar_notas, name="guardar-notas"),
     path("evaluacion/<int:eval_id>/alumnos-notas/", views.alumnos_con_notas, name="alumnos-con-notas"),
     path("curso/<int:class_id>/evaluaciones/", views.evaluaciones_por_curso, name="evaluaciones-curso"),
+    path("curso/<int:class_id>/notas/exportar/", views.exportar_notas, name="exportar-notas"),
     path("mis-cursos-notas/", views.mis_cursos_y_notas, name="mis_cursos_notas"),
     path("proximas-evaluaciones/", views.proximas_evaluaciones),
     path("clases-hoy/", views.clases_hoy, name="clases_hoy"),
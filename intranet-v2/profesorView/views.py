@@ -1,6 +1,7 @@
 from django.utils import timezone
 from django.shortcuts import render
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 
@@ -8,6 +9,8 @@ from core.models import (
     User, Class, Subject, Enrollment,
     Evaluation, EvaluationType, GradeResult
 )
+from .datos import bootstrap_profesor, datos_profesor, invalidar_bootstrap
+from .exportar import XLSX_MIMETYPE, csv_libro, xlsx_libro
 
 
 # =========================================================
@@ -29,47 +32,12 @@ def dashboard(request):
 
 @login_required
 def perfil_data(request):
-    u = request.user
-
-    # Perfil de profesor (si es profe)
-    tprofile = None
-    if u.role == User.TEACHER:
-        tprofile = u.tprofile  # helper que definimos en el modelo User
-
-    data = {
-        "nombre": f"{u.first_name} {u.last_name}",
-        "email": u.email or "--",
-        "rut": getattr(u, "rut", "--"),
-        "telefono": getattr(u, "phone", "--"),
-        "rol": getattr(u, "role", "--"),
-        "department": getattr(tprofile, "department", "--") if tprofile else "--",
-        "title": getattr(tprofile, "title", "--") if tprofile else "--",
-        "position": getattr(tprofile, "position", "--") if tprofile else "--",
-    }
-    return JsonResponse(data)
+    return JsonResponse(datos_profesor(request).perfil())
 
 
 @login_required
 def clases_hoy(request):
-    profe = request.user
-
-    # cursos donde el profe enseña
-    subjects = Subject.objects.filter(teacher=profe).select_related("class_group")
-
-    cursos = []
-    for s in subjects:
-        nombre = str(s.class_group)
-        if nombre not in cursos:
-            cursos.append(nombre)
-
-    # día actual 
-    from datetime import datetime
-    dia = datetime.now().strftime("%A %d de %B %Y").capitalize()
-
-    return JsonResponse({
-        "dia": dia,
-        "cursos": cursos, # Siempre se devuelven todos los cursos
-    })
+    return JsonResponse(datos_profesor(request).clases_hoy())
 
 # =========================================================
 # Cursos del docente (por asignaturas que imparte)
@@ -80,27 +48,7 @@ def cursos_docente(request):
     Lista los cursos donde el profesor imparte asignaturas.
     (No depende de que Class.teacher esté seteado)
     """
-    profesor = request.user
-
-    cursos = (
-        Subject.objects
-        .filter(teacher=profesor)
-        .values(
-            "class_group_id",
-            "class_group__grade__curso_nombre",
-            "class_group__year",
-        )
-        .distinct()
-    )
-
-    data = [
-        {
-            "id": c["class_group_id"],
-            "nombre": f'{c["class_group__grade__curso_nombre"]} {c["class_group__year"]}',
-        }
-        for c in cursos
-    ]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(datos_profesor(request).cursos(), safe=False)
 
 
 # =========================================================
@@ -148,48 +96,105 @@ def alumnos_por_curso(request, class_id: int):
 # =========================================================
 # Evaluaciones: guardar notas
 # =========================================================
+import json
 from django.views.decorators.http import require_POST
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from core.promedios import recalcular as recalcular_promedios
+
+# Rango válido de notas (ajusta si usas otro sistema)
+NOTA_MIN = Decimal("1")
+NOTA_MAX = Decimal("7")
+
+
+def _notas_del_request(request):
+    """
+    {student_id: nota} desde el POST de formulario o desde un body JSON:
+    { "<student_id>": <nota>, ... }  o  { "notas": { "<student_id>": <nota>, ... } }
+    """
+    if request.content_type == "application/json":
+        data = json.loads(request.body.decode("utf-8") or "{}")
+        if isinstance(data, dict) and isinstance(data.get("notas"), dict):
+            data = data["notas"]
+        if not isinstance(data, dict):
+            raise ValueError("Se esperaba un objeto { student_id: nota }")
+        return data
+    return {k: v for k, v in request.POST.items() if k != "csrfmiddlewaretoken"}
+
 
 @login_required
 @require_POST
 def guardar_notas(request, eval_id):
     """
     Crea o actualiza notas para una evaluación.
-    Espera en POST: { <student_id>: <nota>, ... }
-    """
-    evaluacion = get_object_or_404(Evaluation, id=eval_id)
-
-    # Si quieres validar que el profe sea dueño de la evaluación:
-    # if evaluacion.teacher_id != request.user.id:
-    #     return JsonResponse({"error": "No autorizado"}, status=403)
+    Espera en POST (o JSON): { <student_id>: <nota>, ... }
 
-    actualizadas = 0
+    Solo el profe dueño de la evaluación puede guardar y solo se aceptan
+    alumnos matriculados en su curso. Dos queries: una que valida dueño +
+    matrícula y un upsert masivo sobre (evaluation, student).
+    """
+    try:
+        datos = _notas_del_request(request)
+    except ValueError as e:  # JSONDecodeError también es ValueError
+        return JsonResponse({"error": f"Body inválido: {e}"}, status=400)
 
-    for key, value in request.POST.items():
-        if key == "csrfmiddlewaretoken":
+    notas = {}
+    for key, value in datos.items():
+        if value in (None, ""):
             continue
-        if not value:
-            continue
-
         try:
             student_id = int(key)
-            nota = Decimal(value.replace(",", "."))
-        except (ValueError, TypeError):
+            nota = Decimal(str(value).replace(",", "."))
+        except (ValueError, TypeError, InvalidOperation):
             continue
 
-        # valida rango 1.0 a 7.0 (ajusta si usas otro sistema)
-        if nota < 1 or nota > 7:
-            continue
+        if NOTA_MIN <= nota <= NOTA_MAX:
+            notas[student_id] = nota
 
-        GradeResult.objects.update_or_create(
-            evaluation=evaluacion,
-            student_id=student_id,
-            defaults={"score": nota},
+    # Alumnos con matrícula activa en el curso de la evaluación, solo si es
+    # del profe (los retirados quedan en "no_matriculados")
+    matriculados = set()
+    if notas:
+        matriculados = set(
+            Enrollment.objects
+            .filter(
+                class_group__evaluation__id=eval_id,
+                class_group__evaluation__teacher=request.user,
+                student_id__in=notas.keys(),
+                active_status="active",
+            )
+            .values_list("student_id", flat=True)
         )
-        actualizadas += 1
 
-    return JsonResponse({"success": True, "actualizadas": actualizadas})
+    if not matriculados:
+        # Sin filas válidas: distinguimos evaluación inexistente / ajena
+        teacher_id = (
+            Evaluation.objects.filter(id=eval_id).values_list("teacher_id", flat=True).first()
+        )
+        if teacher_id is None:
+            raise Http404("Evaluación no encontrada")
+        if teacher_id != request.user.id:
+            return JsonResponse({"error": "No autorizado"}, status=403)
+
+    GradeResult.objects.bulk_create(
+        [
+            GradeResult(evaluation_id=eval_id, student_id=student_id, score=nota)
+            for student_id, nota in notas.items()
+            if student_id in matriculados
+        ],
+        update_conflicts=True,
+        unique_fields=["evaluation", "student"],
+        update_fields=["score", "updated_at"],
+    )
+    if matriculados:
+        # bulk_create no dispara señales: se recalculan los promedios materializados
+        recalcular_promedios(student_ids=matriculados, evaluation_id=eval_id)
+        invalidar_bootstrap(request.user.id)
+
+    return JsonResponse({
+        "success": True,
+        "actualizadas": len(matriculados),
+        "no_matriculados": sorted(set(notas) - matriculados),
+    })
 
 
 
@@ -269,33 +274,14 @@ def crear_evaluacion(request):
         weight=weight,
     )
 
+    invalidar_bootstrap(request.user.id)
     return JsonResponse({"success": True, "evaluation_id": ev.id})
 
 
 
 @login_required
 def proximas_evaluaciones(request):
-    profe = request.user
-
-    hoy = timezone.now().date()
-
-    evaluaciones = (
-        Evaluation.objects
-        .select_related("class_group", "subject")
-        .filter(teacher=profe, date__gte=hoy)   
-        .order_by("date")
-    )
-
-    data = []
-    for ev in evaluaciones:
-        data.append({
-            "descripcion": ev.description,
-            "fecha": ev.date.strftime("%d-%m-%Y"),
-            "curso": ev.class_group.grade.curso_nombre,
-            "asignatura": ev.subject.name,
-        })
-
-    return JsonResponse({"evaluaciones": data})
+    return JsonResponse({"evaluaciones": datos_profesor(request).proximas_evaluaciones()})
 
 
 # para las notas
@@ -332,89 +318,60 @@ def evaluaciones_por_curso(request, class_id: int):
 # profesorView/views.py
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from core.models import Subject, Enrollment, Evaluation, GradeResult
+
 
 @login_required
 def mis_cursos_y_notas(request):
-    profe = request.user
-
-    # Asignaturas que imparte este profe
-    subjects = Subject.objects.filter(teacher=profe).select_related("class_group")
+    """Libro de notas de todas las asignaturas del profe (ver DatosProfesor.libro_de_notas)."""
+    return JsonResponse({"cursos": datos_profesor(request).libro_de_notas()})
 
-    cursos_data = []
 
-    for s in subjects:
-        # Alumnos del curso de esa asignatura
-        enrollments = (
-            Enrollment.objects
-            .filter(class_group=s.class_group)
-            .select_related("student")
-        )
-
-        # Evaluaciones de esa asignatura (ordenadas por fecha)
-        evaluations = list(
-            Evaluation.objects
-            .filter(subject=s)
-            .select_related("evaluation_type")
-            .order_by("date")
-        )
+@login_required
+def bootstrap(request):
+    """
+    Todo lo que el panel necesita al cargar (perfil, cursos, clases de hoy,
+    próximas evaluaciones y libro de notas) en una sola respuesta, armado
+    con queries compartidas y cacheado unos segundos por profesor.
+    ?fresco=1 salta la caché (se usa tras una escritura del profe).
+    """
+    return JsonResponse(bootstrap_profesor(request, fresco=request.GET.get("fresco") == "1"))
 
-        # Para no hacer N×M queries, indexamos los GradeResult
-        students = [en.student for en in enrollments]
-        grade_results = GradeResult.objects.filter(
-            evaluation__in=evaluations,
-            student__in=students,
-        )
 
-        # results_index[student_id][evaluation_id] = GradeResult
-        results_index = {}
-        for gr in grade_results:
-            results_index.setdefault(gr.student_id, {})[gr.evaluation_id] = gr
-
-        alumnos_data = []
-
-        for en in enrollments:
-            student = en.student
-            notas = []
-            total_ponderado = 0.0
-            suma_pesos = 0.0
-
-            for ev in evaluations:
-                gr = results_index.get(student.id, {}).get(ev.id)
-                score = float(gr.score) if gr else None
-                peso = float(ev.weight) if getattr(ev, "weight", None) is not None else 1.0
-
-                notas.append({
-                    "evaluacion": ev.description,                # igual que antes
-                    "nota": score,                               # igual que antes
-                    "weight": peso,                              # 👈 NUEVO: ponderación
-                    "tipo": ev.evaluation_type.name
-                            if ev.evaluation_type else "",
-                    "fecha": ev.date.isoformat() if ev.date else None,
-                })
-
-                if score is not None:
-                    total_ponderado += score * peso
-                    suma_pesos += peso
-
-            promedio_ponderado = None
-            if suma_pesos > 0:
-                promedio_ponderado = round(total_ponderado / suma_pesos, 2)
-
-            alumnos_data.append({
-                "nombre": f"{student.first_name} {student.last_name}",
-                "rut": getattr(student, "rut", ""),
-                "notas": notas,
-                "promedio_ponderado": promedio_ponderado,   # 👈 NUEVO
-            })
-
-        cursos_data.append({
-            "asignatura": s.name,
-            "curso": str(s.class_group),
-            "alumnos": alumnos_data,
-        })
+@login_required
+def exportar_notas(request, class_id: int):
+    """
+    Descarga el libro de notas de un curso (CSV o XLSX) en streaming.
+    ?asignatura=<id> limita a una asignatura; sin ella van todas las que el
+    profe imparte en ese curso. ?formato=xlsx para Excel (por defecto CSV).
+    """
+    formato = request.GET.get("formato", "csv").lower()
+    if formato not in ("csv", "xlsx"):
+        return JsonResponse({"error": "Formato inválido (csv o xlsx)."}, status=400)
 
-    return JsonResponse({"cursos": cursos_data})
+    subjects = (
+        Subject.objects
+        .filter(class_group_id=class_id, teacher=request.user)
+        .select_related("class_group__grade")
+        .order_by("name")
+    )
+    asignatura = request.GET.get("asignatura")
+    if asignatura:
+        if not asignatura.isdigit():
+            return JsonResponse({"error": "Asignatura inválida."}, status=400)
+        subjects = subjects.filter(id=asignatura)
+    subjects = list(subjects)
+    if not subjects:
+        return JsonResponse({"error": "No tienes asignaturas en ese curso."}, status=404)
+
+    nombre = f"Notas_{subjects[0].class_group.grade.curso_id}_{subjects[0].class_group.year}"
+    if asignatura:
+        nombre += f"_{subjects[0].name}"
+    if formato == "xlsx":
+        response = StreamingHttpResponse(xlsx_libro(subjects), content_type=XLSX_MIMETYPE)
+    else:
+        response = StreamingHttpResponse(csv_libro(subjects), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = content_disposition_header(True, f"{nombre}.{formato}")
+    return response
 
 
 
@@ -15,7 +15,7 @@ from core.models import (
     Evaluation,
     GradeResult,
     Payment,
-
+    GuardianProfile,
 )
 
 
@@ -257,18 +257,15 @@ def validar_pin(request):
     if alumno.role != "student":
         return JsonResponse({"success": False, "message": "Solo estudiantes pueden usar este portal"})
 
-    guardianes = (
-        GuardianRelation.objects
-        .filter(student=alumno)
-        .select_related("guardian")
-    )
+    # Una sola query: ¿algún apoderado del alumno tiene ese PIN?
+    autorizado = GuardianProfile.objects.filter(
+        user__guardian_relations__student=alumno,
+        payment_pin=pin,
+    ).exists()
 
-    for rel in guardianes:
-        guardian = rel.guardian
-        profile = guardian.gprofile  # crea/obtiene el GuardianProfile
-        if profile and profile.payment_pin == pin:
-            request.session["pagos_autorizados"] = True
-            return JsonResponse({"success": True})
+    if autorizado:
+        request.session["pagos_autorizados"] = True
+        return JsonResponse({"success": True})
 
     return JsonResponse({"success": False, "message": "PIN incorrecto"})
 
@@ -474,7 +471,11 @@ from django.db.models import Avg
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 
-from core.models import Enrollment, Subject, GradeResult
+from django.db.models import DecimalField, F
+from core.models import Enrollment, Subject, GradeResult, StudentSubjectAverage
+
+# Asignaturas que no llevan nota
+ASIGNATURAS_SIN_NOTA = ["Almuerzo", "Acto Cívico", "Acto Civico"]
 
 
 @login_required
@@ -502,13 +503,21 @@ def api_promedio_alumno(request):
     asignaturas_qs = (
         Subject.objects
         .filter(class_group=class_group)
-        .exclude(name__in=["Almuerzo", "Acto Cívico", "Acto Civico"])
+        .exclude(name__in=ASIGNATURAS_SIN_NOTA)
     )
     cantidad_asignaturas = asignaturas_qs.count()
 
-    # 3) Promedio general del alumno (todas sus notas)
-    resultados = GradeResult.objects.filter(student=user)
-    promedio = resultados.aggregate(prom=Avg("score"))["prom"] or 0
+    # 3) Promedio general del año: media de los promedios ponderados por
+    #    asignatura, leídos de la tabla materializada (índice student+year)
+    promedio = (
+        StudentSubjectAverage.objects
+        .filter(student=user, year=class_group.year, weight_sum__gt=0)
+        .exclude(subject__name__in=ASIGNATURAS_SIN_NOTA)
+        .aggregate(prom=Avg(
+            F("weighted_sum") / F("weight_sum"),
+            output_field=DecimalField(max_digits=9, decimal_places=4),
+        ))["prom"] or 0
+    )
 
     return JsonResponse({
         "promedio": float(promedio),
@@ -538,9 +547,9 @@ def cambiar_pin_apoderado(request):
     guardian = relation.guardian
 
     
-    profile = guardian.gprofile          
-    profile.payment_pin = nuevo_pin
-    profile.save()
+    GuardianProfile.objects.update_or_create(
+        user=guardian, defaults={"payment_pin": nuevo_pin},
+    )
 
     return JsonResponse({"success": True, "message": "PIN actualizado correctamente."})
 